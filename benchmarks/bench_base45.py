@@ -0,0 +1,40 @@
+"""
+Compares the base45 package with the table driven decoder in codec.
+
+Run from the repository root with:
+    python -m benchmarks.bench_base45
+"""
+import os
+import timeit
+
+import base45
+
+import codec
+from test_helper import create_test_dcc, create_test_dsc
+
+ROUNDS = 2000
+
+
+def measure(function, data):
+    return min(timeit.repeat(lambda: function(data), number=ROUNDS,
+                             repeat=5)) / ROUNDS * 1e6
+
+
+def main():
+    payloads = {
+        "test DCC": create_test_dcc(create_test_dsc()[1])[4:].encode(),
+        "1 KiB": base45.b45encode(os.urandom(1024)),
+        "4 KiB": base45.b45encode(os.urandom(4096)),
+    }
+    print("%10s %8s %14s %14s %8s" %
+          ("payload", "chars", "base45 [us]", "codec [us]", "speedup"))
+    for name, data in payloads.items():
+        assert codec.b45decode(data) == base45.b45decode(data)
+        old_time = measure(base45.b45decode, data)
+        new_time = measure(codec.b45decode, data)
+        print("%10s %8i %14.1f %14.1f %7.1fx" %
+              (name, len(data), old_time, new_time, old_time / new_time))
+
+
+if __name__ == '__main__':
+    main()
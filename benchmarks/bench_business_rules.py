@@ -0,0 +1,46 @@
+"""
+Measures how long compiling and evaluating the business rules takes,
+compared to interpreting the CertLogic expressions on every evaluation.
+
+Run from the repository root with:
+    python -m benchmarks.bench_business_rules
+"""
+import timeit
+
+from business_rules import RuleSet, compile_logic
+from test_business_rules import CLAIMS, NOW, RULES
+
+ROUNDS = 2000
+
+
+def measure(function):
+    return min(timeit.repeat(function, number=ROUNDS,
+                             repeat=5)) / ROUNDS * 1e6
+
+
+def main():
+    rule_set = RuleSet(RULES)
+    assert all(result["result"] == "passed"
+               for result in rule_set.evaluate(CLAIMS, NOW))
+
+    # compiling on every call is what an interpreter of the JSON does
+    compile_time = measure(lambda: RuleSet(RULES))
+    evaluate_time = measure(lambda: rule_set.evaluate(CLAIMS, NOW))
+    uncompiled_time = measure(
+        lambda: RuleSet(RULES).evaluate(CLAIMS, NOW))
+    print("%i rules, %i apply to the test certificate" %
+          (len(rule_set), len(rule_set.evaluate(CLAIMS, NOW))))
+    print("%28s %10.1f us" % ("compile", compile_time))
+    print("%28s %10.1f us" % ("evaluate precompiled", evaluate_time))
+    print("%28s %10.1f us" % ("compile and evaluate", uncompiled_time))
+
+    logic = RULES[1]["Logic"]
+    data = {"payload": CLAIMS[-260][1],
+            "external": {"validationClock": NOW.isoformat()}}
+    single = compile_logic(logic)
+    print("%28s %10.1f us" % ("evaluate a single date rule",
+                              measure(lambda: single(data))))
+
+
+if __name__ == '__main__':
+    main()
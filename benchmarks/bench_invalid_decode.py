@@ -0,0 +1,77 @@
+"""
+Compares the old two pass decoding of invalid DCCs with the single pass
+pipeline of DCCValidator.validate.
+
+The single pass pipeline also times every stage for the metrics, counts
+the results and sets the reason of the verdict, which the two pass
+pipeline doesn't. With that it takes about the same time per DCC, the
+differences between the runs are larger than the ones between the
+pipelines. A DCC of an unknown signer isn't handed to cwt at all.
+
+Run from the repository root with:
+    python -m benchmarks.bench_invalid_decode
+"""
+import contextlib
+import os
+import time
+import timeit
+
+import cbor2
+import cwt
+from cwt import Claims, load_pem_hcert_dsc
+
+from test_helper import create_test_dcc, create_test_dsc
+from validator import DCCValidator
+
+ROUNDS = 2000
+
+
+def two_pass(validator, dcc, certs):
+    """
+    The pipeline before the COSE structure was parsed only once.
+    """
+    raw = validator._decode(dcc)
+    try:
+        return [True, Claims.new(cwt.decode(raw, keys=certs)).to_dict()]
+    except Exception:
+        try:
+            decoded_noverify = cbor2.loads(raw)
+            decoded_noverify = cbor2.loads(decoded_noverify.value[2])
+            print("Could not validate certificate.")
+        except Exception:
+            print("Could not decode certificate.")
+            return [False, {}]
+        return [False, decoded_noverify]
+
+
+def measure(function):
+    with open(os.devnull, "w") as devnull, \
+            contextlib.redirect_stdout(devnull):
+        return min(timeit.repeat(function, number=ROUNDS, repeat=5)) \
+            / ROUNDS * 1e6
+
+
+def main():
+    cert_pem, signing_key = create_test_dsc()
+    other_signing_key = create_test_dsc()[1]
+    certs = [load_pem_hcert_dsc(cert_pem)]
+    validator = DCCValidator("XX", certs=certs)
+    now = int(time.time())
+    expired_claims = {1: "DE", 4: now - 86400, 6: now - 2 * 86400,
+                      -260: {1: {"ver": "1.3.0", "dob": "1964-08-12"}}}
+    cases = {
+        "valid": create_test_dcc(signing_key),
+        "unknown signer": create_test_dcc(other_signing_key),
+        "expired": create_test_dcc(signing_key, expired_claims),
+    }
+
+    print("%16s %16s %16s" % ("case", "two pass [us]", "one pass [us]"))
+    trust_store = validator._trust_store
+    for name, dcc in cases.items():
+        old_time = measure(lambda: two_pass(validator, dcc, certs))
+        new_time = measure(lambda: validator._validate(dcc, trust_store))
+        print("%16s %16.1f %16.1f" % (name, old_time, new_time))
+
+
+if __name__ == '__main__':
+    main()
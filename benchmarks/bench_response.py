@@ -0,0 +1,67 @@
+"""
+Compares the throughput of encoding validation results through the
+response model, like FastAPI does, with FastJSONResponse with orjson and
+with its json fallback.
+
+Run from the repository root with:
+    python -m benchmarks.bench_response
+"""
+import asyncio
+import timeit
+from unittest import mock
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+import json_response
+from occv import DCCBatchData, DCCData
+from test_json_response import CLAIMS
+
+
+def model_renderer(model):
+    """
+    Returns a function that encodes content like FastAPI does for a
+    route with a response model. One event loop is reused, so only the
+    encoding is measured.
+    """
+    field = create_response_field(name="Response", type_=model)
+    loop = asyncio.new_event_loop()
+
+    def render(content):
+        return JSONResponse(loop.run_until_complete(serialize_response(
+            field=field, response_content=content,
+            exclude_unset=True))).body
+    return render
+
+
+def throughput(function):
+    # every measurement runs for at least 0.2 seconds
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    return number / min(timer.repeat(number=number, repeat=3))
+
+
+def main():
+    cases = {
+        "single": (DCCData, {"valid": True, "dccdata": CLAIMS}),
+        "batch of 100": (DCCBatchData, {"results": [
+            {"valid": True, "dccdata": CLAIMS, "error": None}] * 100}),
+    }
+    print("%14s %16s %16s %16s" %
+          ("response", "model [1/s]", "orjson [1/s]", "json [1/s]"))
+    for name, (model, content) in cases.items():
+        render = model_renderer(model)
+        assert render(content) == json_response.dumps(content)
+        model_rate = throughput(lambda: render(content))
+        fast_rate = throughput(
+            lambda: json_response.FastJSONResponse(content))
+        with mock.patch.object(json_response, "orjson", None):
+            fallback_rate = throughput(
+                lambda: json_response.FastJSONResponse(content))
+        print("%14s %16.0f %16.0f %16.0f" %
+              (name, model_rate, fast_rate, fallback_rate))
+
+
+if __name__ == '__main__':
+    main()
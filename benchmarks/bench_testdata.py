@@ -0,0 +1,187 @@
+"""
+Replays the dgc-testdata fixtures through DCCValidator.validate and
+measures the throughput, the latency of every validation and of every
+validation stage and the memory used.
+
+The results are written to a JSON file, so runs of different commits
+can be compared.
+
+Run from the repository root with:
+    python -m benchmarks.bench_testdata [--rounds 20] [--output FILE]
+
+The clock is not frozen to the VALIDATIONCLOCK of the fixtures, because
+freezegun also freezes the timers of the benchmark. Expired fixtures are
+validated up to the claims check like any other invalid DCC.
+"""
+import argparse
+import contextlib
+import glob
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+from cwt import load_pem_hcert_dsc
+
+from cert_loaders.helper import create_chunked_cert
+from cert_loaders.trust_store import TrustStore
+from metrics import VALIDATION_STAGE_SECONDS
+from validator import DCCValidator
+
+STAGES = ["base45", "zlib", "cbor", "verify", "claims"]
+QUANTILES = {"p50": 0.5, "p95": 0.95, "p99": 0.99}
+
+
+def load_cases(testdata):
+    """
+    Reads the fixtures and parses the DSC of every fixture once.
+    Returns:
+        cases: A list of (filename, dcc, trust store).
+    """
+    cases = []
+    pattern = os.path.join(testdata, "*", "2DCode", "raw", "*.json")
+    for filename in sorted(glob.glob(pattern)):
+        try:
+            with open(filename) as f:
+                fixture = json.load(f)
+            dcc = fixture["PREFIX"]
+            cert = load_pem_hcert_dsc(create_chunked_cert(
+                fixture["TESTCTX"]["CERTIFICATE"]))
+        except Exception:
+            # fixtures without a usable DCC or DSC can't be replayed
+            continue
+        cases.append((filename, dcc, TrustStore.merge({"XX": [cert]})))
+    return cases
+
+
+def replay(validator, cases, rounds):
+    """
+    Validates every case rounds times.
+    Returns:
+        latencies: The duration of every validation in seconds.
+    """
+    latencies = []
+    for _ in range(rounds):
+        for _, dcc, trust_store in cases:
+            validator._trust_store = trust_store
+            start = time.perf_counter()
+            validator.validate(dcc)
+            latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def stage_timings():
+    """
+    Reads the timings of every validation stage from the metrics.
+    """
+    stages = {}
+    for stage in STAGES:
+        count = VALIDATION_STAGE_SECONDS.count(stage=stage)
+        if not count:
+            continue
+        stages[stage] = {
+            "count": count,
+            "mean_us": VALIDATION_STAGE_SECONDS.sum(stage=stage)
+            / count * 1e6,
+        }
+        for name, q in QUANTILES.items():
+            stages[stage][name + "_us"] = \
+                VALIDATION_STAGE_SECONDS.quantile(q, stage=stage) * 1e6
+    return stages
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"],
+                              capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmarks the validation of the dgc-testdata fixtures.")
+    parser.add_argument("--testdata", default="testdata",
+                        help="the checkout of dgc-testdata")
+    parser.add_argument("--rounds", type=int, default=20,
+                        help="how often every fixture is validated")
+    parser.add_argument("--output", default="bench_testdata.json",
+                        help="the JSON file the results are written to")
+    args = parser.parse_args(argv)
+
+    cases = load_cases(args.testdata)
+    if not cases:
+        print("No fixtures found in %s, run "
+              "'git submodule update --init' first." % args.testdata)
+        return 1
+
+    with open(os.devnull, "w") as devnull, \
+            contextlib.redirect_stdout(devnull):
+        validator = DCCValidator("XX", certs=[], auto_update=False)
+        # warm up, then only measure the timed rounds
+        replay(validator, cases, 1)
+        VALIDATION_STAGE_SECONDS.clear()
+
+        start = time.perf_counter()
+        latencies = replay(validator, cases, args.rounds)
+        seconds = time.perf_counter() - start
+        stages = stage_timings()
+
+        # tracing slows down the validation, so memory is measured in
+        # an extra round
+        tracemalloc.start()
+        replay(validator, cases, 1)
+        _, peak_traced = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    results = {
+        "commit": git_commit(),
+        "date": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "fixtures": len(cases),
+        "rounds": args.rounds,
+        "validations": len(latencies),
+        "seconds": seconds,
+        "throughput_per_s": len(latencies) / seconds,
+        "latency_us": {
+            name: percentile(latencies, q) * 1e6
+            for name, q in QUANTILES.items()},
+        "stages": stages,
+        "memory": {
+            "peak_traced_bytes": peak_traced,
+            "max_rss_kib": resource.getrusage(
+                resource.RUSAGE_SELF).ru_maxrss,
+        },
+    }
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    print("%i fixtures x %i rounds: %.0f validations/s" %
+          (len(cases), args.rounds, results["throughput_per_s"]))
+    print("latency [us]: " + ", ".join(
+        "%s %.1f" % item for item in results["latency_us"].items()))
+    print("%8s %8s %10s %10s %10s %10s" %
+          ("stage", "count", "mean [us]", "p50 [us]", "p95 [us]", "p99 [us]"))
+    for stage, timings in stages.items():
+        print("%8s %8i %10.1f %10.1f %10.1f %10.1f" % (
+            stage, timings["count"], timings["mean_us"], timings["p50_us"],
+            timings["p95_us"], timings["p99_us"]))
+    print("peak traced memory: %.1f KiB, max RSS: %i KiB" %
+          (peak_traced / 1024, results["memory"]["max_rss_kib"]))
+    print("Results written to %s" % args.output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
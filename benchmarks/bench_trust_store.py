@@ -0,0 +1,52 @@
+"""
+Compares list based and kid indexed DCC verification.
+
+Run from the repository root with:
+    python -m benchmarks.bench_trust_store
+"""
+import timeit
+
+import cbor2
+import cwt
+from cwt import load_pem_hcert_dsc
+
+from cert_loaders.trust_store import TrustStore
+from test_helper import create_test_dcc, create_test_dsc
+from validator import DCCValidator
+
+TRUST_LIST_SIZES = [1, 10, 100, 500]
+ROUNDS = 200
+
+
+def main():
+    print("%8s %14s %14s %8s" % ("certs", "list [us]", "indexed [us]", "speedup"))
+    for size in TRUST_LIST_SIZES:
+        certs = []
+        for i in range(size):
+            cert_pem, signing_key = create_test_dsc("DSC %i" % i)
+            certs.append(load_pem_hcert_dsc(cert_pem))
+        # the last key is the worst case for the list based search
+        dcc = create_test_dcc(signing_key)
+
+        validator = DCCValidator("XX", certs=certs)
+        raw = validator._decode(dcc)
+        trust_store = TrustStore(certs)
+
+        def list_based():
+            cwt.decode(raw, keys=certs)
+
+        def indexed():
+            kid = validator._get_kid(cbor2.loads(raw))
+            cwt.decode(raw, keys=trust_store.find(kid))
+
+        list_time = min(timeit.repeat(list_based, number=ROUNDS, repeat=3))
+        index_time = min(timeit.repeat(indexed, number=ROUNDS, repeat=3))
+        print("%8i %14.1f %14.1f %7.1fx" % (
+            size,
+            list_time / ROUNDS * 1e6,
+            index_time / ROUNDS * 1e6,
+            list_time / index_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+"""
+Validates stored DCCs offline, e.g. for the nightly re-validation of
+scan archives.
+
+Inputs are text files with one DCC per line, JSON files in the format of
+the dgc-testdata fixtures ({"PREFIX": "HC1:..."}) or directories with
+such files. The certificates are loaded once, the DCCs are validated in
+a process pool that gets the trust store and only sends the verdict and
+its reason back.
+
+    python bulk_validate.py --country DE,AT testdata/ scans.log > out.jsonl
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+
+from validation_pool import _init_worker, _validate_batch_in_worker
+from validator import DCCValidator
+
+# the number of records sent to a worker at once
+CHUNK_SIZE = 64
+
+
+def _init_bulk_worker(country, dev_mode, trust_store):
+    # stdout may carry the results, so the log of the workers goes to stderr
+    sys.stdout = sys.stderr
+    _init_worker(country, dev_mode, {"auto_update": False}, trust_store)
+
+
+def iter_files(paths):
+    """
+    Yields the files of the given paths, directories are searched
+    recursively in a stable order.
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    yield os.path.join(root, name)
+        else:
+            yield path
+
+
+def iter_records(paths):
+    """
+    Reads the DCCs of all files.
+    Yields:
+        record, dcc: The position of a DCC, like file:line, and the DCC.
+    """
+    for filename in iter_files(paths):
+        if filename.endswith(".json"):
+            try:
+                with open(filename) as f:
+                    fixture = json.load(f)
+                dcc = fixture["PREFIX"]
+            except Exception as e:
+                print("Skipping %s: %s" % (filename, e), file=sys.stderr)
+                continue
+            yield filename, dcc
+            continue
+        with open(filename) as f:
+            for number, line in enumerate(f, 1):
+                line = line.strip()
+                if line:
+                    yield "%s:%i" % (filename, number), line
+
+
+def iter_chunks(records, size):
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def validate_records(records, country, workers, source=None,
+                     chunk_size=CHUNK_SIZE, dev_mode=False):
+    """
+    Validates the records in a process pool. The certificate lists are
+    loaded once, before the workers start. Only a few chunks per worker
+    are in flight, so arbitrarily large archives can be validated.
+    Yields:
+        record, valid, reason, error: The results in the order of the
+        records, reason is None if the DCC couldn't be validated.
+    """
+    # stdout may carry the results
+    with redirect_stdout(sys.stderr):
+        trust_store = DCCValidator(country=country, dev_mode=dev_mode,
+                                   auto_update=False).get_trust_store()
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers,
+                             initializer=_init_bulk_worker,
+                             initargs=(country, dev_mode,
+                                       trust_store)) as executor:
+        for chunk in iter_chunks(records, chunk_size):
+            if len(pending) >= workers * 2:
+                yield from _chunk_results(*pending.popleft())
+            names = [name for name, _ in chunk]
+            dccs = [dcc for _, dcc in chunk]
+            pending.append((names, executor.submit(
+                _validate_batch_in_worker, dccs, source, True)))
+        while pending:
+            yield from _chunk_results(*pending.popleft())
+
+
+def _chunk_results(names, future):
+    for name, (valid, reason, error) in zip(names, future.result()):
+        yield name, valid, reason, error
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Validates stored DCCs with all CPU cores.")
+    parser.add_argument("paths", nargs="+",
+                        help="files with one DCC per line, dgc-testdata "
+                             "JSON files or directories")
+    parser.add_argument("--country", default=os.getenv("CERT_COUNTRY", "AT"),
+                        help="the certificate lists to load, e.g. DE,AT")
+    parser.add_argument("--source", default=None,
+                        help="only validate against this certificate list")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="the number of worker processes")
+    parser.add_argument("--format", choices=("jsonl", "csv"), default="jsonl",
+                        help="the output format")
+    parser.add_argument("--output", default=None,
+                        help="the output file, defaults to stdout")
+    args = parser.parse_args(argv)
+
+    output = open(args.output, "w", newline="") if args.output \
+        else sys.stdout
+    writer = csv.writer(output) if args.format == "csv" else None
+    if writer is not None:
+        writer.writerow(["record", "valid", "reason", "error"])
+
+    counts = {"valid": 0, "invalid": 0, "errors": 0}
+    start = time.perf_counter()
+    try:
+        for record, valid, reason, error in validate_records(
+                iter_records(args.paths), args.country, args.workers,
+                args.source):
+            if error is not None:
+                counts["errors"] += 1
+            elif valid:
+                counts["valid"] += 1
+            else:
+                counts["invalid"] += 1
+            if writer is not None:
+                writer.writerow([record, valid, reason or "", error or ""])
+            else:
+                output.write(json.dumps(
+                    {"record": record, "valid": valid, "reason": reason,
+                     "error": error}) + "\n")
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    seconds = time.perf_counter() - start
+    total = sum(counts.values())
+    print("Validated %i DCCs in %.2f s (%.1f/s): %i valid, %i invalid, "
+          "%i errors." % (total, seconds, total / seconds if seconds else 0,
+                          counts["valid"], counts["invalid"],
+                          counts["errors"]), file=sys.stderr)
+    return counts
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,461 @@
+"""
+A CertLogic engine for the business rules of the EU DCC framework.
+
+CertLogic is the subset of JsonLogic used by the business rules, see
+https://github.com/ehn-dcc-development/dgc-business-rules/tree/main/certlogic
+
+Every rule is compiled once into nested Python closures, evaluating a
+compiled rule only calls them without looking at the JSON again.
+"""
+import json
+import re
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+
+
+class CertLogicError(ValueError):
+    """
+    Raised if a rule isn't valid CertLogic or can't be evaluated.
+    """
+
+
+def _is_truthy(value):
+    # the same as JsonLogic: false, null, 0, "", [] and {} are falsy
+    return bool(value)
+
+
+def parse_datetime(value):
+    """
+    Parses an ISO 8601 date or date-time. Dates and date-times without
+    a time zone are UTC.
+    """
+    if isinstance(value, datetime):
+        return value
+    if not isinstance(value, str):
+        raise CertLogicError("Not a date-time: %r" % (value,))
+    return _parse_datetime(value)
+
+
+# an offset without a colon, fromisoformat only takes one before 3.11
+UTC_OFFSET = re.compile(r"([+-]\d{2})(\d{2})$")
+
+
+# the same dates, like the validation clock, are parsed for every rule
+@lru_cache(maxsize=4096)
+def _parse_datetime(value):
+    if value.endswith("Z"):
+        value = value[:-1] + "+00:00"
+    elif "T" in value:
+        value = UTC_OFFSET.sub(r"\1:\2", value)
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise CertLogicError("Not a date-time: %r" % (value,))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def _date_of_birth(value):
+    """
+    Parses a date of birth, which may lack the day or the month. Like
+    CertLogic's dccDateOfBirth, missing parts are the end of the period.
+    """
+    if not isinstance(value, str):
+        raise CertLogicError("Not a date of birth: %r" % (value,))
+    parts = value[:10].split("-")
+    try:
+        year = int(parts[0])
+        if len(parts) == 1:
+            return datetime(year, 12, 31, tzinfo=timezone.utc)
+        month = int(parts[1])
+        if len(parts) == 2:
+            next_month = datetime(year + month // 12, month % 12 + 1, 1,
+                                  tzinfo=timezone.utc)
+            return next_month - timedelta(days=1)
+        return datetime(year, month, int(parts[2]), tzinfo=timezone.utc)
+    except (ValueError, IndexError):
+        raise CertLogicError("Not a date of birth: %r" % (value,))
+
+
+def _plus_time(value, amount, unit):
+    moment = parse_datetime(value)
+    if unit == "day":
+        return moment + timedelta(days=amount)
+    if unit == "hour":
+        return moment + timedelta(hours=amount)
+    if unit in ("month", "year"):
+        months = moment.month - 1 + (amount if unit == "month"
+                                     else amount * 12)
+        year = moment.year + months // 12
+        month = months % 12 + 1
+        day = moment.day
+        # clamp to the last day of the month, e.g. 31.1. + 1 month
+        while True:
+            try:
+                return moment.replace(year=year, month=month, day=day)
+            except ValueError:
+                day -= 1
+    raise CertLogicError("Unknown time unit: %r" % (unit,))
+
+
+# the separators of the fragments of a UVCI
+UVCI_SEPARATORS = re.compile(r"[/#:]")
+
+
+def _extract_from_uvci(uvci, index):
+    if not isinstance(uvci, str):
+        return None
+    if uvci.startswith("URN:UVCI:"):
+        uvci = uvci[len("URN:UVCI:"):]
+    fragments = UVCI_SEPARATORS.split(uvci)
+    if 0 <= index < len(fragments):
+        return fragments[index]
+    return None
+
+
+def _strict_equals(left, right):
+    return type(left) == type(right) and left == right
+
+
+def _compile_var(path):
+    if path == "" or path is None:
+        return lambda data: data
+    if isinstance(path, int):
+        path = str(path)
+    # list indices are looked up as int, dict keys as str
+    keys = tuple((key, int(key) if key.isdigit() else None)
+                 for key in path.split("."))
+
+    def var(data):
+        for key, index in keys:
+            if isinstance(data, dict):
+                data = data.get(key)
+            elif isinstance(data, list) and index is not None:
+                data = data[index] if index < len(data) else None
+            else:
+                return None
+            if data is None:
+                return None
+        return data
+    return var
+
+
+def _comparison(name, compare, operands, convert):
+    if len(operands) == 2:
+        first, second = operands
+
+        def compare_two(data):
+            return compare(convert(first(data)), convert(second(data)))
+        return compare_two
+    if len(operands) == 3:
+        first, second, third = operands
+
+        def compare_three(data):
+            middle = convert(second(data))
+            return compare(convert(first(data)), middle) and \
+                compare(middle, convert(third(data)))
+        return compare_three
+    raise CertLogicError("%s needs 2 or 3 operands" % name)
+
+
+def _integer(value):
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise CertLogicError("Not an integer: %r" % (value,))
+    return value
+
+
+COMPARISONS = {
+    "<": lambda a, b: a < b,
+    ">": lambda a, b: a > b,
+    "<=": lambda a, b: a <= b,
+    ">=": lambda a, b: a >= b,
+}
+DATE_COMPARISONS = {
+    "before": lambda a, b: a < b,
+    "after": lambda a, b: a > b,
+    "not-after": lambda a, b: a <= b,
+    "not-before": lambda a, b: a >= b,
+}
+
+
+def compile_logic(logic):
+    """
+    Compiles a CertLogic expression.
+    Returns:
+        evaluate: A function that evaluates the expression for a data
+        object.
+    Raises:
+        CertLogicError: If the expression isn't valid CertLogic.
+    """
+    if isinstance(logic, list):
+        items = [compile_logic(item) for item in logic]
+        return lambda data: [item(data) for item in items]
+    if not isinstance(logic, dict):
+        return lambda data: logic
+    if len(logic) != 1:
+        raise CertLogicError("An operation needs exactly one operator: %r"
+                             % (logic,))
+    (operator, operands), = logic.items()
+
+    if operator == "var":
+        return _compile_var(operands)
+    if not isinstance(operands, list):
+        operands = [operands]
+
+    if operator == "reduce":
+        if len(operands) != 3:
+            raise CertLogicError("reduce needs 3 operands")
+        items, reducer, initial = (compile_logic(operand)
+                                   for operand in operands)
+
+        def reduce(data):
+            accumulator = initial(data)
+            values = items(data)
+            for current in values if isinstance(values, list) else ():
+                accumulator = reducer({"accumulator": accumulator,
+                                       "current": current,
+                                       "data": data})
+            return accumulator
+        return reduce
+
+    compiled = [compile_logic(operand) for operand in operands]
+
+    if operator == "if":
+        if len(compiled) != 3:
+            raise CertLogicError("if needs 3 operands")
+        guard, then, otherwise = compiled
+        return lambda data: then(data) if _is_truthy(guard(data)) \
+            else otherwise(data)
+    if operator == "===":
+        if len(compiled) != 2:
+            raise CertLogicError("=== needs 2 operands")
+        left, right = compiled
+        return lambda data: _strict_equals(left(data), right(data))
+    if operator == "and":
+        if not compiled:
+            raise CertLogicError("and needs at least 1 operand")
+
+        def and_(data):
+            value = None
+            for operand in compiled:
+                value = operand(data)
+                if not _is_truthy(value):
+                    return value
+            return value
+        return and_
+    if operator == "!":
+        if len(compiled) != 1:
+            raise CertLogicError("! needs 1 operand")
+        operand, = compiled
+        return lambda data: not _is_truthy(operand(data))
+    if operator == "in":
+        if len(compiled) != 2:
+            raise CertLogicError("in needs 2 operands")
+        item, collection = compiled
+
+        def in_(data):
+            values = collection(data)
+            if not isinstance(values, list):
+                raise CertLogicError("in needs an array")
+            return item(data) in values
+        return in_
+    if operator == "+":
+        return lambda data: sum(_integer(operand(data))
+                                for operand in compiled)
+    if operator in COMPARISONS:
+        return _comparison(operator, COMPARISONS[operator], compiled,
+                           _integer)
+    if operator in DATE_COMPARISONS:
+        return _comparison(operator, DATE_COMPARISONS[operator], compiled,
+                           parse_datetime)
+    if operator == "plusTime":
+        if len(compiled) != 3:
+            raise CertLogicError("plusTime needs 3 operands")
+        value, amount, unit = compiled
+        return lambda data: _plus_time(value(data), _integer(amount(data)),
+                                       unit(data))
+    if operator == "extractFromUVCI":
+        if len(compiled) != 2:
+            raise CertLogicError("extractFromUVCI needs 2 operands")
+        uvci, index = compiled
+        return lambda data: _extract_from_uvci(uvci(data),
+                                               _integer(index(data)))
+    if operator == "dccDateOfBirth":
+        if len(compiled) != 1:
+            raise CertLogicError("dccDateOfBirth needs 1 operand")
+        value, = compiled
+        return lambda data: _date_of_birth(value(data))
+    raise CertLogicError("Unknown operator: %s" % operator)
+
+
+# the keys of the certificate types in the HCERT payload
+CERTIFICATE_TYPES = {"v": "Vaccination", "t": "Test", "r": "Recovery"}
+
+
+def certificate_type(hcert):
+    """
+    Returns the certificate type of an HCERT payload as it is named in
+    the rules, or None if it has no vaccination, test or recovery entry.
+    """
+    for key, name in CERTIFICATE_TYPES.items():
+        if hcert.get(key):
+            return name
+    return None
+
+
+def _version(rule):
+    try:
+        return tuple(int(part) for part in rule.get("Version", "").split("."))
+    except ValueError:
+        return ()
+
+
+class Rule:
+    """
+    A business rule with its compiled logic.
+    """
+    __slots__ = ("identifier", "type", "country", "certificate_type",
+                 "description", "valid_from", "valid_to", "evaluate")
+
+    def __init__(self, rule):
+        self.identifier = rule["Identifier"]
+        self.type = rule.get("Type", "Acceptance")
+        self.country = rule.get("Country")
+        self.certificate_type = rule.get("CertificateType", "General")
+        descriptions = rule.get("Description") or []
+        self.description = next(
+            (item.get("desc") for item in descriptions
+             if item.get("lang") == "en"),
+            descriptions[0].get("desc") if descriptions else None)
+        self.valid_from = parse_datetime(rule["ValidFrom"]) \
+            if rule.get("ValidFrom") else None
+        self.valid_to = parse_datetime(rule["ValidTo"]) \
+            if rule.get("ValidTo") else None
+        self.evaluate = compile_logic(rule["Logic"])
+
+    def applies(self, cert_type, now):
+        if self.certificate_type not in ("General", cert_type):
+            return False
+        if self.valid_from is not None and now < self.valid_from:
+            return False
+        if self.valid_to is not None and now > self.valid_to:
+            return False
+        return True
+
+
+def parse_value_sets(value_sets):
+    """
+    Parses the value sets as they are loaded from a certificate service.
+    Value sets may be nested in a "v" list and may be JSON encoded.
+    Returns:
+        value_sets: The codes of every value set by its id, like the
+        rules look them up in external.valueSets.
+    """
+    if isinstance(value_sets, dict) and "v" in value_sets:
+        value_sets = value_sets["v"]
+    elif isinstance(value_sets, dict):
+        return value_sets
+    parsed = {}
+    for value_set in value_sets or []:
+        if isinstance(value_set, dict) and "valueSetId" not in value_set \
+                and "v" in value_set:
+            value_set = value_set["v"]
+        if isinstance(value_set, (str, bytes)):
+            value_set = json.loads(value_set)
+        if isinstance(value_set, dict) and "valueSetId" in value_set:
+            parsed[value_set["valueSetId"]] = \
+                list(value_set.get("valueSetValues") or {})
+    return parsed
+
+
+class RuleSet:
+    """
+    A set of compiled business rules. Only the newest version of every
+    rule is kept.
+    """
+
+    def __init__(self, rules, value_sets=None):
+        newest = {}
+        for rule in rules:
+            identifier = rule.get("Identifier")
+            if identifier is None:
+                continue
+            if identifier not in newest or \
+                    _version(rule) > _version(newest[identifier]):
+                newest[identifier] = rule
+        self.rules = []
+        for identifier, rule in sorted(newest.items()):
+            try:
+                self.rules.append(Rule(rule))
+            except Exception as e:
+                print("Could not compile the rule %s: %s" % (identifier, e))
+        self.value_sets = value_sets or {}
+
+    @classmethod
+    def from_rules(cls, rules, value_sets=None):
+        """
+        Compiles the rules as they are loaded from a certificate service.
+        Rules may be nested in a "r" list and may be JSON encoded, the
+        value sets are parsed with parse_value_sets.
+        """
+        if isinstance(rules, dict):
+            rules = rules.get("r", [])
+        parsed = []
+        for rule in rules or []:
+            if isinstance(rule, dict) and "Logic" not in rule and "r" in rule:
+                rule = rule["r"]
+            if isinstance(rule, (str, bytes)):
+                rule = json.loads(rule)
+            if isinstance(rule, dict):
+                parsed.append(rule)
+        return cls(parsed, parse_value_sets(value_sets))
+
+    def __len__(self):
+        return len(self.rules)
+
+    def evaluate(self, claims, now=None):
+        """
+        Evaluates the rules that apply to a certificate.
+        Returns:
+            results: A list with the identifier, type, description and
+            result of every rule. The result is "passed", "failed" or
+            "open" if the rule couldn't be evaluated.
+        """
+        hcert = claims.get(-260, {}).get(1) if isinstance(claims, dict) \
+            else None
+        if not isinstance(hcert, dict):
+            return []
+        if now is None:
+            now = datetime.now(timezone.utc)
+        cert_type = certificate_type(hcert)
+        # the data is built once, only the country changes between rules
+        external = {
+            "validationClock": now.isoformat(),
+            "valueSets": self.value_sets,
+            "countryCode": None,
+            "exp": _claim_time(claims.get(4)),
+            "iat": _claim_time(claims.get(6)),
+        }
+        data = {"payload": hcert, "external": external}
+        results = []
+        for rule in self.rules:
+            if not rule.applies(cert_type, now):
+                continue
+            external["countryCode"] = rule.country
+            try:
+                result = "passed" if _is_truthy(rule.evaluate(data)) \
+                    else "failed"
+            except Exception:
+                result = "open"
+            results.append({"identifier": rule.identifier,
+                            "type": rule.type,
+                            "description": rule.description,
+                            "result": result})
+        return results
+
+
+def _claim_time(timestamp):
+    if not isinstance(timestamp, (int, float)):
+        return None
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat()
@@ -1,12 +1,11 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
 import cbor2
-import cryptography
 import requests
-from cryptography.exceptions import InvalidSignature
-from cryptography.hazmat.primitives import hashes
-from cryptography.x509 import load_der_x509_certificate
-from cwt import COSE, load_pem_hcert_dsc
 
-from .certificate_loader import CertificateLoader
+from .certificate_loader import DOWNLOAD_TIMEOUT, CertificateLoader
+from .signed_artifact import SignedArtifactVerifier
 
 # This is the AT production certificate
 root_certificate = """-----BEGIN CERTIFICATE-----
@@ -24,16 +23,26 @@ yEepU0gCIQCGaqJpOwPXBmgoOsehnJkA0+TZX8V2p1Bg/nqnuYqXFg==
 
 
 class CertificateLoader_AT(CertificateLoader):
-    def __init__(self):
+    def __init__(self, url='https://dgc-trust.qr.gv.at',
+                 file_prefix='at', root_certificate=root_certificate):
         super().__init__()
-        self._cert_url = 'https://dgc-trust.qr.gv.at/trustlist'
-        self._cert_filename = 'at_trustlist'
-        self._signature_url = 'https://dgc-trust.qr.gv.at/trustlistsig'
-        self._business_rules_url = 'https://dgc-trust.qr.gv.at/rules'
-        self._business_rules_filename = 'at_rules'
-        self._business_rules_sig = 'https://dgc-trust.qr.gv.at/rulessig'
-        self._build_certlist()
-        self._load_rules()
+        self._cert_url = url + '/trustlist'
+        self._cert_filename = file_prefix + '_trustlist'
+        self._signature_url = url + '/trustlistsig'
+        self._business_rules_url = url + '/rules'
+        self._business_rules_filename = file_prefix + '_rules'
+        self._business_rules_sig = url + '/rulessig'
+        self._value_sets_url = url + '/valuesets'
+        self._value_sets_filename = file_prefix + '_valuesets'
+        self._value_sets_sig = url + '/valuesetssig'
+        self._verifier = SignedArtifactVerifier(root_certificate)
+        # the trust list and the rules are independent of each other,
+        # so they are loaded and verified at the same time
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            certlist = executor.submit(self._build_certlist)
+            rules = executor.submit(self._load_rules)
+            certlist.result()
+            rules.result()
 
     def _read_certs_from_file(self):
         """
@@ -85,6 +94,25 @@ class CertificateLoader_AT(CertificateLoader):
 
         return rules, signature
 
+    def _read_value_sets_from_file(self):
+        """
+        Try to read the value sets and the signature from a file.
+        Returns:
+            value_sets: The CBOR encoded value sets.
+            signature: A signature of the value sets.
+        Fails:
+            None, None: if any of the files are not found.
+        """
+        try:
+            with open("./data/"+self._value_sets_filename, "rb") as f:
+                value_sets = f.read()
+            with open("./data/"+self._value_sets_filename+".sig", "rb") as s:
+                signature = bytes(s.read())
+        except FileNotFoundError:
+            return None, None
+
+        return value_sets, signature
+
     def _save_certs(self, certs_str, signature):
         """
         Stores the certificates and the signature in a file
@@ -103,6 +131,15 @@ class CertificateLoader_AT(CertificateLoader):
         with open("./data/" + self._business_rules_filename+".sig", 'wb') as s:
             s.write(signature)
 
+    def _save_value_sets(self, value_sets, signature):
+        """
+        Stores the value sets and the signature in a file
+        """
+        with open("./data/" + self._value_sets_filename, 'wb') as f:
+            f.write(value_sets)
+        with open("./data/" + self._value_sets_filename+".sig", 'wb') as s:
+            s.write(signature)
+
     def _load_certs(self):
         """
         Load the certificates from the filesystem
@@ -134,13 +171,15 @@ class CertificateLoader_AT(CertificateLoader):
 
     def _load_rules(self):
         """
-        Load the rules from the filesystem
+        Load the value sets and the rules from the filesystem
         or downloads them if they are not present.
         Returns:
             rules_json: An array DSC certificates.
         Fails:
             None: If the certificates cannot be loaded.
         """
+        # the rules are compiled with the value sets they refer to
+        self._load_value_sets()
         signature = ""
         rules = {}
         failed = False
@@ -159,58 +198,57 @@ class CertificateLoader_AT(CertificateLoader):
         # or can't be verified
         if failed:
             rules = self._download_rules()
-        rules = cbor2.loads(rules)
-        self.rules = rules
+        self._set_rules(cbor2.loads(rules))
+
+    def _load_value_sets(self):
+        """
+        Load the value sets from the filesystem
+        or downloads them if they are not present or can't be verified.
+        Rules that use value sets are open without them, so a failure
+        doesn't stop the rules from loading.
+        """
+        try:
+            value_sets, signature = self._read_value_sets_from_file()
+            if value_sets is None or \
+                    not self._validate_value_sets(value_sets, signature):
+                value_sets = self._download_value_sets()
+            self._set_value_sets(cbor2.loads(value_sets))
+        except Exception as e:
+            print("Could not load the Austrian value sets: %s" % e)
 
     def _validate_certs(self, certs, signature):
         """
-        Validates the json data against the signature
+        Validates the certificate list against the signature
         Returns:
             True if the signature is valid
         Raises:
             InvalidSignature: If the signature is invalid.
         """
-        hash_digest = hashes.Hash(hashes.SHA256())
-        hash_digest.update(certs)
-        hash_digest = hash_digest.finalize()
-        try:
-            ctx = COSE.new()
-            cosekey = load_pem_hcert_dsc(root_certificate)
-            signature_decoded = ctx.decode(signature, cosekey)
-            cert_sigature = cbor2.loads(signature_decoded)[2]
-
-            if cert_sigature != hash_digest:
-                raise InvalidSignature("The certificate signature is invalid.")
-
-        except InvalidSignature:
-            raise InvalidSignature(
-                "Could not validate the signature of the AT certificates!")
-        return True
+        with self._timed("verify"):
+            return self._verifier.verify(certs, signature, "AT certificates")
 
     def _validate_rules(self, rules, signature):
         """
-        Validates the json data against the signature
+        Validates the rules against the signature
         Returns:
             True if the signature is valid
         Raises:
             InvalidSignature: If the signature is invalid.
         """
-        hash_digest = hashes.Hash(hashes.SHA256())
-        hash_digest.update(rules)
-        hash_digest = hash_digest.finalize()
-        try:
-            ctx = COSE.new()
-            cosekey = load_pem_hcert_dsc(root_certificate)
-            signature_decoded = ctx.decode(signature, cosekey)
-            cert_sigature = cbor2.loads(signature_decoded)[2]
+        with self._timed("verify"):
+            return self._verifier.verify(rules, signature, "AT rules")
 
-            if cert_sigature != hash_digest:
-                raise InvalidSignature("The rules signature is invalid.")
-
-        except InvalidSignature:
-            raise InvalidSignature(
-                "Could not validate the signature of the AT rules!")
-        return True
+    def _validate_value_sets(self, value_sets, signature):
+        """
+        Validates the value sets against the signature
+        Returns:
+            True if the signature is valid
+        Raises:
+            InvalidSignature: If the signature is invalid.
+        """
+        with self._timed("verify"):
+            return self._verifier.verify(value_sets, signature,
+                                         "AT value sets")
 
     def _download_certs(self):
         """
@@ -220,14 +258,25 @@ class CertificateLoader_AT(CertificateLoader):
         Returns:
             cert_json: A dictionary containing the certificates.
         """
-        resp = requests.get(self._cert_url)
-        resp.raise_for_status()
-        certs = resp.content
+        with self._timed("download"):
+            resp = requests.get(self._cert_url, timeout=DOWNLOAD_TIMEOUT)
+            resp.raise_for_status()
+            certs = resp.content
+
+            resp = requests.get(self._signature_url, timeout=DOWNLOAD_TIMEOUT)
+            resp.raise_for_status()
+            signature = resp.content
 
-        resp = requests.get(self._signature_url)
-        resp.raise_for_status()
-        signature = resp.content
+        return self._store_certs(certs, signature)
 
+    def _store_certs(self, certs, signature):
+        """
+        Verifies a downloaded certificate list and stores it in a file.
+        Returns:
+            certs: The certificate list.
+        Raises:
+            InvalidSignature: If the signature is invalid.
+        """
         if self._validate_certs(certs, signature):
             self._save_certs(certs, signature)
             return certs
@@ -244,14 +293,27 @@ class CertificateLoader_AT(CertificateLoader):
         Returns:
             cert_json: A dictionary containing the certificates.
         """
-        resp = requests.get(self._business_rules_url)
-        resp.raise_for_status()
-        rules = resp.content
+        with self._timed("download"):
+            resp = requests.get(self._business_rules_url,
+                                timeout=DOWNLOAD_TIMEOUT)
+            resp.raise_for_status()
+            rules = resp.content
 
-        resp = requests.get(self._business_rules_sig)
-        resp.raise_for_status()
-        signature = resp.content
+            resp = requests.get(self._business_rules_sig,
+                                timeout=DOWNLOAD_TIMEOUT)
+            resp.raise_for_status()
+            signature = resp.content
 
+        return self._store_rules(rules, signature)
+
+    def _store_rules(self, rules, signature):
+        """
+        Verifies downloaded rules and stores them in a file.
+        Returns:
+            rules: The rules.
+        Raises:
+            InvalidSignature: If the signature is invalid.
+        """
         if self._validate_rules(rules, signature):
             self._save_rules(rules, signature)
             return rules
@@ -260,18 +322,115 @@ class CertificateLoader_AT(CertificateLoader):
                 "Could not validate the Austrian certificate list.")
             return None
 
+    def _download_value_sets(self):
+        """
+        Downloads the signed value sets of the rules from the official
+        austrian servers.
+
+        Returns:
+            value_sets: The CBOR encoded value sets.
+        """
+        with self._timed("download"):
+            resp = requests.get(self._value_sets_url,
+                                timeout=DOWNLOAD_TIMEOUT)
+            resp.raise_for_status()
+            value_sets = resp.content
+
+            resp = requests.get(self._value_sets_sig,
+                                timeout=DOWNLOAD_TIMEOUT)
+            resp.raise_for_status()
+            signature = resp.content
+
+        return self._store_value_sets(value_sets, signature)
+
+    def _store_value_sets(self, value_sets, signature):
+        """
+        Verifies downloaded value sets and stores them in a file.
+        Returns:
+            value_sets: The value sets.
+        Raises:
+            InvalidSignature: If the signature is invalid.
+        """
+        if self._validate_value_sets(value_sets, signature):
+            self._save_value_sets(value_sets, signature)
+            return value_sets
+        raise ValueError("Could not validate the Austrian value sets.")
+
+    async def _refresh_value_sets(self, downloader):
+        """
+        Downloads the value sets and their signature and applies them if
+        they changed on the server. The trust list and the rules are
+        refreshed even if this fails.
+        """
+        value_sets_urls = (self._value_sets_url, self._value_sets_sig)
+        try:
+            with self._timed("download"):
+                (value_sets, value_sets_changed), (signature, sig_changed) = \
+                    await downloader.fetch_all(*value_sets_urls)
+            if not (value_sets_changed or sig_changed):
+                return
+            value_sets = await asyncio.to_thread(
+                self._store_value_sets, value_sets, signature)
+            await asyncio.to_thread(self._set_value_sets,
+                                    cbor2.loads(value_sets))
+        except Exception as e:
+            downloader.forget(*value_sets_urls)
+            print("Could not update the Austrian value sets: %s" % e)
+
     def _build_certlist(self):
         """
-        Builds the list of certificates from json data and stores it.
+        Builds the list of certificates from CBOR data and stores it.
+        Unchanged lists are read from the compiled cache.
         """
         certs_str = self._load_certs()
         if certs_str is None:
             raise ValueError("Could not load the certificates.")
 
-        certs_cbor = cbor2.loads(certs_str)
+        # build a new list, so the old one stays untouched until it is
+        # replaced as a whole
+        self._certs = self._compile_certlist(certs_str)
 
-        for cert in certs_cbor['c']:
-            x509 = load_der_x509_certificate(cert['c'])
-            cert_pem = x509.public_bytes(
-                cryptography.hazmat.primitives.serialization.Encoding.PEM).decode('utf-8')
-            self._certs.append(load_pem_hcert_dsc(cert_pem))
+    async def refresh_async(self, downloader):
+        """
+        Downloads the trust list, the rules and their signatures at the
+        same time and applies the parts that changed on the server. The
+        value sets are applied first, so changed rules use them.
+        Verifying and building runs in a thread, so the event loop isn't
+        blocked.
+        Returns:
+            True if certificates were added or removed.
+        """
+        cert_urls = (self._cert_url, self._signature_url)
+        rules_urls = (self._business_rules_url, self._business_rules_sig)
+        await self._refresh_value_sets(downloader)
+        with self._timed("download"):
+            (certs, certs_changed), (signature, signature_changed), \
+                (rules, rules_changed), (rules_sig, rules_sig_changed) = \
+                await downloader.fetch_all(*cert_urls, *rules_urls)
+
+        if rules_changed or rules_sig_changed:
+            try:
+                rules = await asyncio.to_thread(
+                    self._store_rules, rules, rules_sig)
+                rules = cbor2.loads(rules)
+                await asyncio.to_thread(self._set_rules, rules)
+            except Exception as e:
+                downloader.forget(*rules_urls)
+                print("Could not update the Austrian rules: %s" % e)
+
+        if not (certs_changed or signature_changed):
+            return False
+        try:
+            certs = await asyncio.to_thread(self._store_certs, certs, signature)
+            self._certs = await asyncio.to_thread(self._compile_certlist, certs)
+        except Exception:
+            downloader.forget(*cert_urls)
+            raise
+        return self._certs_changed()
+
+    def _extract_certs(self, certs_str):
+        """
+        Extracts the DER encoded DSCs from the CBOR data.
+        """
+        certs_cbor = cbor2.loads(certs_str)
+        return [cert['c'] for cert in certs_cbor['c']]
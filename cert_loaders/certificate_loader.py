@@ -1,6 +1,18 @@
+import hashlib
 import json
 
-from cwt import load_pem_hcert_dsc
+import cbor2
+from cryptography.hazmat.primitives.serialization import (Encoding,
+                                                          PublicFormat)
+from cwt import COSEKey, load_pem_hcert_dsc
+
+from business_rules import RuleSet
+from metrics import LOADER_STAGE_SECONDS
+
+from .helper import der_public_key_info, load_der_hcert_dsc
+
+# seconds to wait for a certificate server before giving up
+DOWNLOAD_TIMEOUT = 30
 
 
 class CertificateLoader:
@@ -18,6 +30,17 @@ class CertificateLoader:
         self._cert_url = None
         self._cert_filename = None
         self.rules = None
+        # the value sets the rules look codes up in
+        self.value_sets = None
+        # the rules compiled for evaluation, the generation counts reloads
+        self.rule_set = None
+        self.rules_generation = 0
+        # the keys of the current list by the SHA256 fingerprint of their
+        # certificate and the SHA256 hash of the current signed list
+        self._keys_by_fingerprint = {}
+        self._certs_digest = None
+        # the added, removed and unchanged certificates of the last update
+        self.last_diff = None
 
     def __call__(self):
         """
@@ -25,6 +48,36 @@ class CertificateLoader:
         """
         return self._certs
 
+    def _timed(self, stage):
+        """
+        Measures the time of a download, verify or build step.
+        """
+        return LOADER_STAGE_SECONDS.time(loader=type(self).__name__,
+                                         stage=stage)
+
+    def _set_rules(self, rules):
+        """
+        Replaces the rules and compiles them once for evaluation.
+        Rules that can't be compiled are still served, but not evaluated.
+        """
+        try:
+            rule_set = RuleSet.from_rules(rules, self.value_sets)
+            print("Compiled %i business rules." % len(rule_set))
+        except Exception as e:
+            print("Could not compile the business rules: %s" % e)
+            rule_set = None
+        self.rules = rules
+        self.rule_set = rule_set
+        self.rules_generation += 1
+
+    def _set_value_sets(self, value_sets):
+        """
+        Replaces the value sets and compiles the rules again with them.
+        """
+        self.value_sets = value_sets
+        if self.rules is not None:
+            self._set_rules(self.rules)
+
     def _save_certs(self, certs_json):
         """
         Stores the certificates in a file
@@ -73,14 +126,170 @@ class CertificateLoader:
         """
 
         certs_json = self._load_certs()
-        for certs in certs_json:
-            self._certs.append(load_pem_hcert_dsc(certs))
+        self._certs = [load_pem_hcert_dsc(certs) for certs in certs_json]
+
+    def _extract_certs(self, certs_str):
+        """
+        Extracts the DER encoded DSCs from the signed certificate list.
+        This method needs to be implemented in every subclass that uses
+        _compile_certlist.
+        Returns:
+            certs: A list of DER encoded certificates.
+        """
+        return []
+
+    def _compile_certlist(self, certs_str):
+        """
+        Turns the signed certificate list into COSE keys.
+        The new list is compared to the current one by the SHA256
+        fingerprints of the certificates. Only added certificates are
+        parsed, keys of unchanged certificates are reused and keys of
+        removed certificates are dropped.
+        The keys are cached in a compiled file next to the list. The cache
+        is keyed by the SHA256 hash of the signed list, so X.509 parsing is
+        skipped as long as the list doesn't change. The cached keys are
+        checked against the certificates of the signed list.
+        Returns:
+            certs: A list of COSE keys.
+        """
+        with self._timed("build"):
+            digest = hashlib.sha256(certs_str).digest()
+            if digest == self._certs_digest:
+                keys = self._keys_by_fingerprint
+            else:
+                certs = self._extract_certs(certs_str)
+                keys = self._read_compiled_certs(digest, certs)
+                if keys is None:
+                    keys = self._diff_certlist(certs)
+                    self._save_compiled_certs(digest, keys)
+            self._summarize_diff(keys)
+            self._keys_by_fingerprint = keys
+            self._certs_digest = digest
+        return list(keys.values())
+
+    def _diff_certlist(self, certs):
+        """
+        Builds the keys of a new certificate list. Certificates that are
+        in the current list keep their key.
+        Returns:
+            keys: A dictionary of COSE keys by certificate fingerprint.
+        """
+        keys = {}
+        for cert in certs:
+            fingerprint = hashlib.sha256(cert).digest()
+            if fingerprint in keys:
+                continue
+            key = self._keys_by_fingerprint.get(fingerprint)
+            if key is None:
+                key = load_der_hcert_dsc(cert)
+            keys[fingerprint] = key
+        return keys
+
+    def _summarize_diff(self, keys):
+        """
+        Compares the new keys to the current ones and logs the changes.
+        """
+        old = self._keys_by_fingerprint.keys()
+        new = keys.keys()
+        self.last_diff = {
+            "added": len(new - old),
+            "removed": len(old - new),
+            "unchanged": len(new & old),
+        }
+        print("%s certificates: %i added, %i removed, %i unchanged." %
+              (type(self).__name__, self.last_diff["added"],
+               self.last_diff["removed"], self.last_diff["unchanged"]))
+
+    def _certs_changed(self):
+        """
+        Returns:
+            True if the last update added or removed a certificate.
+        """
+        if self.last_diff is None:
+            return True
+        return bool(self.last_diff["added"] or self.last_diff["removed"])
+
+    def _read_compiled_certs(self, digest, certs):
+        """
+        Reads the compiled keys of a certificate list from a file.
+        The file isn't trusted, every key must be the public key of one
+        of the DER encoded certificates of the verified list.
+        Returns:
+            keys: A dictionary of COSE keys by certificate fingerprint.
+        Fails:
+            None: If there is no compiled file for this list or it
+            doesn't match the certificates.
+        """
+        try:
+            with open("./data/" + self._cert_filename + ".keys", "rb") as f:
+                compiled = cbor2.load(f)
+            if compiled["hash"] != digest:
+                return None
+            keys = {fingerprint: COSEKey.new(key) for fingerprint, key
+                    in zip(compiled["fingerprints"], compiled["keys"])}
+            if not self._keys_match_certs(keys, certs):
+                print("The compiled certificates don't match the list.")
+                return None
+            return keys
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print("Could not read the compiled certificates: %s" % e)
+            return None
+
+    def _keys_match_certs(self, keys, certs):
+        """
+        Checks that the keys are exactly the public keys of the
+        certificates, with the kid of their fingerprint.
+        """
+        certs_by_fingerprint = {hashlib.sha256(cert).digest(): cert
+                                for cert in certs}
+        if keys.keys() != certs_by_fingerprint.keys():
+            return False
+        for fingerprint, key in keys.items():
+            if key.kid != fingerprint[:8]:
+                return False
+            public_key_info = key.key.public_bytes(
+                Encoding.DER, PublicFormat.SubjectPublicKeyInfo)
+            if public_key_info != der_public_key_info(
+                    certs_by_fingerprint[fingerprint]):
+                return False
+        return True
+
+    def _save_compiled_certs(self, digest, keys):
+        """
+        Stores the compiled keys of a certificate list in a file.
+        """
+        compiled = {
+            "hash": digest,
+            "fingerprints": list(keys),
+            "keys": [key.to_dict() for key in keys.values()],
+        }
+        try:
+            with open("./data/" + self._cert_filename + ".keys", "wb") as f:
+                cbor2.dump(compiled, f)
+        except OSError as e:
+            print("Could not save the compiled certificates: %s" % e)
 
     def update_certs(self):
         """
         Redownloads the certificates and updates the list stored in RAM.
+        The list is replaced as a whole, callers holding the old list
+        are not affected.
+        Returns:
+            True if the certificate list changed.
         """
         print("Updating the certificate lists")
         self._download_certs()
         self._build_certlist()
+        return self._certs_changed()
 
+    async def refresh_async(self, downloader):
+        """
+        Redownloads the certificates with an AsyncDownloader and updates
+        the list stored in RAM if they changed. Loaders without a remote
+        list have nothing to refresh.
+        Returns:
+            True if the certificate list changed.
+        """
+        return False
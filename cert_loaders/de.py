@@ -1,4 +1,8 @@
+import asyncio
+import hashlib
 import json
+import os
+import time
 from base64 import b64decode
 
 import requests
@@ -7,20 +11,50 @@ from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.asymmetric.ec import ECDSA
 from cryptography.hazmat.primitives.asymmetric.utils import \
     encode_dss_signature
-from cryptography.hazmat.primitives.serialization import load_pem_public_key
-from cwt.helpers.hcert import load_pem_hcert_dsc
+from cryptography.hazmat.primitives.serialization import (
+    Encoding, PublicFormat, load_pem_public_key)
 
-from cert_loaders.helper import create_chunked_cert
+from .certificate_loader import DOWNLOAD_TIMEOUT, CertificateLoader
 
-from .certificate_loader import CertificateLoader
+
+SIGN_KEY_URL = ('https://github.com/Digitaler-Impfnachweis/covpass-ios/raw/'
+                'main/Certificates/%s/CA/pubkey.pem')
+
+
+def public_key_sha256(pubkey):
+    """
+    Returns the hex SHA256 hash of the SubjectPublicKeyInfo of a key.
+    """
+    return hashlib.sha256(pubkey.public_bytes(
+        Encoding.DER, PublicFormat.SubjectPublicKeyInfo)).hexdigest()
 
 
 class CertificateLoader_DE(CertificateLoader):
-    def __init__(self):
+    def __init__(self,
+                 cert_url='https://de.dscg.ubirch.com/trustList/DSC/',
+                 cert_filename='de.json',
+                 cert_sign_key=SIGN_KEY_URL % 'PROD_RKI',
+                 cert_sign_key_sha256_env='DE_SIGN_KEY_SHA256'):
         super().__init__()
-        self._cert_url = 'https://de.dscg.ubirch.com/trustList/DSC/'
-        self._cert_filename = 'de.json'
-        self._cert_sign_key = 'https://github.com/Digitaler-Impfnachweis/covpass-ios/raw/main/Certificates/PROD_RKI/CA/pubkey.pem'
+        self._cert_url = cert_url
+        self._cert_filename = cert_filename
+        self._cert_sign_key = cert_sign_key
+        self._cert_sign_key_filename = cert_filename + '.pubkey.pem'
+        # A pinned key is used as is and never downloaded
+        self._cert_sign_key_pinned = os.getenv("DE_SIGN_KEY_FILE")
+        # The SHA256 hash of the key, the cached and the downloaded key
+        # are only used if they match it
+        self._cert_sign_key_sha256 = os.getenv(cert_sign_key_sha256_env, "") \
+            .replace(":", "").lower() or None
+        if self._cert_sign_key_sha256 is None \
+                and not self._cert_sign_key_pinned:
+            print("The DE signing key isn't pinned, set %s to the SHA256 "
+                  "hash of its public key." % cert_sign_key_sha256_env)
+        # The downloaded key is cached in a file and in memory for 30 days
+        self._cert_sign_key_max_age = int(
+            os.getenv("DE_SIGN_KEY_MAX_AGE", 30 * 86400))
+        self._sign_key = None
+        self._sign_key_expires = 0
         self._build_certlist()
 
     def _read_certs_from_file(self):
@@ -86,30 +120,122 @@ class CertificateLoader_DE(CertificateLoader):
             certs_str = self._download_certs()
         return certs_str
 
-    def _validate_json(self, certs_str, signature):
+    def _load_sign_key(self, pubkey_str):
+        """
+        Parses a signing key and checks it against the pinned hash.
+        Returns:
+            pubkey: The public key of the certificate list.
+        Raises:
+            ValueError: If the key can't be parsed.
+            InvalidSignature: If the key doesn't match the pinned hash.
+        """
+        pubkey = load_pem_public_key(pubkey_str)
+        if self._cert_sign_key_sha256 is not None and \
+                public_key_sha256(pubkey) != self._cert_sign_key_sha256:
+            raise InvalidSignature(
+                "The DE signing key doesn't match the pinned SHA256 hash.")
+        return pubkey
+
+    def _get_sign_key(self, refresh=False):
+        """
+        Returns the parsed key that signs the certificate list.
+        The key is taken from the pinned file if DE_SIGN_KEY_FILE is set.
+        Otherwise the iOS Corona Warn App key stored on GitHub is used. It
+        is cached in memory and in a file until it expires. A failed
+        download falls back to an expired cached key. The cached and the
+        downloaded key are checked against the pinned hash.
+        Returns:
+            pubkey: The public key of the certificate list.
+        Raises:
+            InvalidSignature: If no key matches the pinned hash.
+        """
+        now = time.time()
+        if self._sign_key is not None and not refresh \
+                and now < self._sign_key_expires:
+            return self._sign_key
+
+        if self._cert_sign_key_pinned:
+            with open(self._cert_sign_key_pinned, "rb") as f:
+                self._sign_key = self._load_sign_key(f.read())
+            self._sign_key_expires = float("inf")
+            return self._sign_key
+
+        path = "./data/" + self._cert_sign_key_filename
+        try:
+            with open(path, "rb") as f:
+                pubkey = self._load_sign_key(f.read())
+            expires = os.path.getmtime(path) + self._cert_sign_key_max_age
+        except FileNotFoundError:
+            pubkey = None
+            expires = 0
+        except (ValueError, InvalidSignature) as e:
+            print("Ignoring the cached DE signing key: %s" % e)
+            pubkey = None
+            expires = 0
+
+        if pubkey is None or refresh or now >= expires:
+            try:
+                resp = requests.get(self._cert_sign_key,
+                                    timeout=DOWNLOAD_TIMEOUT)
+                resp.raise_for_status()
+                return self._set_sign_key(resp.content)
+            except Exception as e:
+                if pubkey is None:
+                    raise
+                print("Could not refresh the DE signing key, "
+                      "using the cached key: %s" % e)
+
+        self._sign_key = pubkey
+        self._sign_key_expires = expires
+        return self._sign_key
+
+    def _set_sign_key(self, pubkey_str):
+        """
+        Checks a downloaded signing key, stores it in a file and uses it
+        until it expires.
+        Returns:
+            pubkey: The public key of the certificate list.
+        Raises:
+            InvalidSignature: If the key doesn't match the pinned hash.
+        """
+        pubkey = self._load_sign_key(pubkey_str)
+        with open("./data/" + self._cert_sign_key_filename, "wb") as f:
+            f.write(pubkey_str)
+        self._sign_key = pubkey
+        self._sign_key_expires = time.time() + self._cert_sign_key_max_age
+        return pubkey
+
+    def _validate_json(self, certs_str, signature, refresh_key=True):
         """
         Validates the json data against the signature with the
-        iOS Corona Warn App key stored on GitHub.
+        iOS Corona Warn App key. The key is downloaded again if the
+        signature doesn't match, unless refresh_key is False.
         Returns:
             True if the signature is valid
         Raises:
             InvalidSignature: If the signature is invalid.
         """
-        resp = requests.get(self._cert_sign_key)
-        resp.raise_for_status()
-        pubkey_str = resp.content
-        pubkey = load_pem_public_key(pubkey_str)
-        x = int.from_bytes(
-            signature[:len(signature)//2], byteorder="big", signed=False)
-        y = int.from_bytes(
-            signature[len(signature)//2:], byteorder="big", signed=False)
-        signature = encode_dss_signature(x, y)
-        try:
-            pubkey.verify(signature,
-                          certs_str, ECDSA(hashes.SHA256()))
-        except InvalidSignature:
-            raise InvalidSignature(
-                "Could not validate the signature of the DE certificates!")
+        with self._timed("verify"):
+            pubkey = self._get_sign_key()
+            x = int.from_bytes(
+                signature[:len(signature)//2], byteorder="big", signed=False)
+            y = int.from_bytes(
+                signature[len(signature)//2:], byteorder="big", signed=False)
+            signature = encode_dss_signature(x, y)
+            try:
+                try:
+                    pubkey.verify(signature,
+                                  certs_str, ECDSA(hashes.SHA256()))
+                except InvalidSignature:
+                    if self._cert_sign_key_pinned or not refresh_key:
+                        raise
+                    # the key may have been replaced since it was cached
+                    pubkey = self._get_sign_key(refresh=True)
+                    pubkey.verify(signature,
+                                  certs_str, ECDSA(hashes.SHA256()))
+            except InvalidSignature:
+                raise InvalidSignature(
+                    "Could not validate the signature of the DE certificates!")
         return True
 
     def _download_certs(self):
@@ -120,13 +246,23 @@ class CertificateLoader_DE(CertificateLoader):
         Returns:
             cert_json: A dictionary containing the certificates.
         """
-        resp = requests.get(self._cert_url)
-        resp.raise_for_status()
+        with self._timed("download"):
+            resp = requests.get(self._cert_url, timeout=DOWNLOAD_TIMEOUT)
+            resp.raise_for_status()
+
+        return self._store_certs(resp.content)
 
-        raw_cert = resp.content
+    def _store_certs(self, raw_cert, refresh_key=True):
+        """
+        Verifies a downloaded certificate list and stores it in a file.
+        Returns:
+            certs_str: The certificate list without the signature.
+        Raises:
+            ValueError: If the signature of the list is invalid.
+        """
         signature_b64, certs_str = raw_cert.split(b'\n', 1)
         signature = b64decode(signature_b64)
-        if self._validate_json(certs_str, signature):
+        if self._validate_json(certs_str, signature, refresh_key):
             self._save_certs(certs_str, signature)
             return certs_str
         else:
@@ -136,14 +272,65 @@ class CertificateLoader_DE(CertificateLoader):
     def _build_certlist(self):
         """
         Builds the list of certificates from json data and stores it.
+        Unchanged lists are read from the compiled cache.
         """
         certs_str = self._load_certs()
         if certs_str is None:
             raise ValueError("Could not load the certificates.")
 
+        # build a new list, so the old one stays untouched until it is
+        # replaced as a whole
+        self._certs = self._compile_certlist(certs_str)
+
+    async def _refresh_sign_key(self, downloader):
+        """
+        Downloads the signing key with the shared client and applies it
+        if it changed on the server. The cached key is kept if this fails.
+        """
+        if self._cert_sign_key_pinned:
+            return
+        try:
+            with self._timed("download"):
+                pubkey_str, changed = await downloader.fetch(
+                    self._cert_sign_key)
+            if changed:
+                await asyncio.to_thread(self._set_sign_key, pubkey_str)
+            else:
+                self._sign_key_expires = \
+                    time.time() + self._cert_sign_key_max_age
+        except Exception as e:
+            downloader.forget(self._cert_sign_key)
+            print("Could not refresh the DE signing key, "
+                  "using the cached key: %s" % e)
+
+    async def refresh_async(self, downloader):
+        """
+        Redownloads the signing key and the certificate list if they
+        changed on the server. Verifying and building the list runs in a
+        thread, so the event loop isn't blocked.
+        Returns:
+            True if certificates were added or removed.
+        """
+        await self._refresh_sign_key(downloader)
+        with self._timed("download"):
+            raw_cert, changed = await downloader.fetch(self._cert_url)
+        if not changed:
+            return False
+        try:
+            # the key was just refreshed, it isn't downloaded again
+            certs_str = await asyncio.to_thread(
+                self._store_certs, raw_cert, False)
+            self._certs = await asyncio.to_thread(
+                self._compile_certlist, certs_str)
+        except Exception:
+            downloader.forget(self._cert_url)
+            raise
+        return self._certs_changed()
+
+    def _extract_certs(self, certs_str):
+        """
+        Extracts the DER encoded DSCs from the json data.
+        """
         certs_json = json.loads(certs_str)
         certs_json = certs_json["certificates"]
-
-        for cert in certs_json:
-            cert_data = create_chunked_cert(cert["rawData"])
-            self._certs.append(load_pem_hcert_dsc(cert_data))
+        return [b64decode(cert["rawData"]) for cert in certs_json]
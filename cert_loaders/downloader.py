@@ -0,0 +1,58 @@
+import asyncio
+
+
+class AsyncDownloader:
+    """
+    Downloads certificate lists with a shared async HTTP client.
+
+    The ETag and Last-Modified headers of every download are remembered
+    and sent back as If-None-Match and If-Modified-Since, so the server
+    can answer with 304 Not Modified if a list didn't change.
+    """
+
+    def __init__(self, client):
+        self._client = client
+        self._cache = {}
+
+    async def fetch(self, url):
+        """
+        Downloads a file unless it didn't change since the last download.
+        Returns:
+            content, changed: The content of the file and whether it
+            changed since the last download.
+        Raises:
+            httpx.HTTPError: If the download fails.
+        """
+        headers = {}
+        cached = self._cache.get(url)
+        if cached is not None:
+            etag, last_modified, _ = cached
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+
+        resp = await self._client.get(url, headers=headers)
+        if resp.status_code == 304 and cached is not None:
+            return cached[2], False
+        resp.raise_for_status()
+        self._cache[url] = (resp.headers.get("etag"),
+                            resp.headers.get("last-modified"),
+                            resp.content)
+        return resp.content, True
+
+    async def fetch_all(self, *urls):
+        """
+        Downloads several files at the same time.
+        Returns:
+            results: A list of (content, changed) in the order of urls.
+        """
+        return await asyncio.gather(*[self.fetch(url) for url in urls])
+
+    def forget(self, *urls):
+        """
+        Drops the cached state of files whose content was rejected, so
+        they are downloaded in full next time.
+        """
+        for url in urls:
+            self._cache.pop(url, None)
@@ -1,6 +1,89 @@
+from cryptography.hazmat.primitives.asymmetric.ec import EllipticCurvePublicKey
+from cryptography.hazmat.primitives.asymmetric.rsa import RSAPublicKey
+from cryptography.hazmat.primitives.hashes import SHA256
+from cryptography.x509 import load_der_x509_certificate
+from cwt import COSEKey
+from cwt.algs.ec2 import EC2Key
+from cwt.const import COSE_KEY_TYPES
+from cwt.utils import uint_to_bytes
+
 
 def create_chunked_cert(cert):
         chunk_size = 64
         # crt_string = base64_encode(crt)[0].decode("ascii").replace("\n",'')
         chunked = '\n'.join(cert[i:i+chunk_size] for i in range(0, len(cert), chunk_size))
         return f"-----BEGIN CERTIFICATE-----\n{chunked}\n-----END CERTIFICATE-----\n"
+
+
+def load_der_hcert_dsc(cert):
+    """
+    Loads a DER encoded DSC as a COSE key.
+    This is the same as cwt.load_pem_hcert_dsc, but skips the round trip
+    through PEM. The kid is the 8 byte truncated SHA256 fingerprint of
+    the certificate.
+    Returns:
+        cose_key: The public key of the DSC.
+    """
+    x509 = load_der_x509_certificate(cert)
+    public_key = x509.public_key()
+    params = {2: x509.fingerprint(SHA256())[0:8]}
+    if isinstance(public_key, RSAPublicKey):
+        public_numbers = public_key.public_numbers()
+        params[1] = COSE_KEY_TYPES["RSA"]
+        params[3] = -37  # PS256
+        params[-1] = uint_to_bytes(public_numbers.n)
+        params[-2] = uint_to_bytes(public_numbers.e)
+    elif isinstance(public_key, EllipticCurvePublicKey):
+        params[3] = -7  # ES256
+        params.update(EC2Key.to_cose_key(public_key))
+    else:
+        raise ValueError("Unsupported key type: %s" % type(public_key))
+    return COSEKey.new(params)
+
+
+def _der_item(data, offset):
+    """
+    Reads the header of the DER item at offset.
+    Returns:
+        (start, end): The offsets of the content of the item and of the
+        first byte after it.
+    Raises:
+        ValueError: If the item is truncated.
+    """
+    if offset + 2 > len(data):
+        raise ValueError("Truncated DER item")
+    length = data[offset + 1]
+    start = offset + 2
+    if length & 0x80:
+        size = length & 0x7F
+        length = int.from_bytes(data[start:start + size], "big")
+        start += size
+    end = start + length
+    if end > len(data):
+        raise ValueError("Truncated DER item")
+    return start, end
+
+
+def der_public_key_info(cert):
+    """
+    Finds the SubjectPublicKeyInfo of a DER encoded certificate without
+    parsing the whole certificate.
+    Returns:
+        public_key_info: The DER encoded SubjectPublicKeyInfo.
+    Raises:
+        ValueError: If the data isn't a certificate.
+    """
+    if cert[:1] != b"\x30":
+        raise ValueError("Not a DER encoded certificate")
+    # Certificate ::= SEQUENCE { tbsCertificate SEQUENCE { ... } ... }
+    offset, _ = _der_item(cert, 0)
+    offset, _ = _der_item(cert, offset)
+    # the optional version is followed by the serial number, signature,
+    # issuer, validity and subject
+    skip = 6 if cert[offset:offset + 1] == b"\xa0" else 5
+    for _ in range(skip):
+        _, offset = _der_item(cert, offset)
+    _, end = _der_item(cert, offset)
+    if cert[offset:offset + 1] != b"\x30":
+        raise ValueError("Not a DER encoded certificate")
+    return bytes(cert[offset:end])
@@ -0,0 +1,43 @@
+import cbor2
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes
+from cwt import COSE, load_pem_hcert_dsc
+
+
+class SignedArtifactVerifier:
+    """
+    Verifies artifacts with a detached signature, like the Austrian trust
+    list and business rules.
+
+    The signature is a COSE message signed by the root certificate. Its
+    payload holds the SHA256 hash of the artifact under the key 2. The
+    root certificate is parsed once and the COSE context is reused for
+    every verification.
+    """
+
+    def __init__(self, root_certificate):
+        self._cose_key = load_pem_hcert_dsc(root_certificate)
+        self._ctx = COSE.new()
+
+    def verify(self, artifact, signature, name="artifact"):
+        """
+        Validates the artifact against the signature
+        Returns:
+            True if the signature is valid
+        Raises:
+            InvalidSignature: If the signature is invalid.
+        """
+        hash_digest = hashes.Hash(hashes.SHA256())
+        hash_digest.update(artifact)
+        hash_digest = hash_digest.finalize()
+        try:
+            signature_decoded = self._ctx.decode(signature, self._cose_key)
+            artifact_signature = cbor2.loads(signature_decoded)[2]
+
+            if artifact_signature != hash_digest:
+                raise InvalidSignature("The %s signature is invalid." % name)
+
+        except InvalidSignature:
+            raise InvalidSignature(
+                "Could not validate the signature of the %s!" % name)
+        return True
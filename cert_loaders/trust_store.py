@@ -0,0 +1,115 @@
+import time
+
+import cbor2
+from cwt import COSEKey
+
+
+class TrustStore:
+    """
+    An immutable collection of DSC keys indexed by their key id (kid).
+
+    The kid of a DSC is the 8 byte truncated SHA256 fingerprint of the
+    certificate. It is written into the COSE header of every DCC, so the
+    signer can be looked up directly instead of trying every known key.
+
+    Every key remembers the certificate loaders (sources) it came from, so
+    a lookup can be restricted to the trust list of one country.
+
+    A trust store is never changed after it is built. A refresh builds a
+    new snapshot with the next generation number and replaces the
+    reference to the old one.
+    """
+
+    def __init__(self, certs=None, generation=0, loaded_at=None,
+                 sources=None):
+        self.generation = generation
+        self.loaded_at = time.time() if loaded_at is None else loaded_at
+        self._certs = tuple(certs or ())
+        if sources is None:
+            sources = [frozenset()] * len(self._certs)
+        self._sources = tuple(sources)
+        index = {}
+        for cert, cert_sources in zip(self._certs, self._sources):
+            index.setdefault(cert.kid, []).append((cert, cert_sources))
+        self._index = {kid: tuple(keys) for kid, keys in index.items()}
+
+    @classmethod
+    def merge(cls, certs_by_source, generation=0):
+        """
+        Builds one trust store from the certificates of several loaders.
+        A key that is in several lists is only stored once and keeps
+        all of its sources.
+        """
+        certs = []
+        sources = []
+        positions = {}
+        for source, source_certs in certs_by_source.items():
+            for cert in source_certs:
+                key_id = (cert.kid,
+                          cbor2.dumps(cert.to_dict(), canonical=True))
+                position = positions.get(key_id)
+                if position is None:
+                    positions[key_id] = len(certs)
+                    certs.append(cert)
+                    sources.append(frozenset([source]))
+                else:
+                    sources[position] = sources[position] | {source}
+        return cls(certs, generation=generation, sources=sources)
+
+    def __len__(self):
+        return len(self._certs)
+
+    def __iter__(self):
+        return iter(self._certs)
+
+    def find(self, kid, source=None):
+        """
+        Returns the keys that may have signed a DCC with the given kid.
+        If a source is given, only keys from that source are returned.
+        Returns:
+            keys: A list of COSE keys. All keys if no kid is given and an
+            empty list if the kid is unknown.
+        """
+        if not kid:
+            return [cert for cert, cert_sources
+                    in zip(self._certs, self._sources)
+                    if source is None or source in cert_sources]
+        return [cert for cert, cert_sources in self._index.get(kid, ())
+                if source is None or source in cert_sources]
+
+    def sources(self, kid):
+        """
+        Returns the names of the loaders that provided the kid.
+        """
+        names = set()
+        for _, cert_sources in self._index.get(kid, ()):
+            names |= cert_sources
+        return names
+
+    def count_by_source(self):
+        """
+        Returns the number of keys each loader provided.
+        """
+        counts = {}
+        for cert_sources in self._sources:
+            for source in cert_sources:
+                counts[source] = counts.get(source, 0) + 1
+        return counts
+
+    def next(self, certs_by_source):
+        """
+        Builds the snapshot that replaces this one.
+        """
+        return TrustStore.merge(certs_by_source, self.generation + 1)
+
+    def __reduce__(self):
+        # the COSE keys can't be pickled, e.g. to send the trust store to
+        # a worker process, they are rebuilt from their dicts instead
+        return (_restore_trust_store,
+                ([cert.to_dict() for cert in self._certs], self.generation,
+                 self.loaded_at, self._sources))
+
+
+def _restore_trust_store(keys, generation, loaded_at, sources):
+    return TrustStore([COSEKey.new(key) for key in keys], generation,
+                      loaded_at, sources)
@@ -0,0 +1,112 @@
+"""
+Decoders for the layers of the HC1 payload.
+"""
+import struct
+import zlib
+
+import base45
+
+# a QR code holds at most 4296 alphanumeric characters, the limits leave
+# room for anything a scanner can produce
+MAX_DCC_LENGTH = 8 * 1024
+MAX_PAYLOAD_SIZE = 64 * 1024
+
+BASE45_CHARSET = b"0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ $%*+-./:"
+
+
+class PayloadTooLarge(ValueError):
+    """
+    Raised if a DCC exceeds a size limit. The code tells the limits apart.
+    """
+    code = "payload_too_large"
+
+
+class InputTooLong(PayloadTooLarge):
+    code = "input_too_long"
+
+
+class DecompressedTooLarge(PayloadTooLarge):
+    code = "decompressed_too_large"
+
+
+# maps every byte to its base45 value, bytes outside of the charset to 255
+_B45_TABLE = bytearray([255]) * 256
+for _value, _char in enumerate(BASE45_CHARSET):
+    _B45_TABLE[_char] = _value
+_B45_TABLE = bytes(_B45_TABLE)
+
+
+def b45decode(data):
+    """
+    Decodes base45 (RFC 9285) like base45.b45decode, but translates the
+    characters with a lookup table and packs the output in one call
+    instead of building it byte by byte.
+    Other input types than str and bytes-like objects are passed on to
+    the base45 package.
+    Returns:
+        data: The decoded bytes.
+    Raises:
+        ValueError: If the data isn't valid base45.
+    """
+    if isinstance(data, str):
+        try:
+            data = data.rstrip("\n").encode("ascii")
+        except UnicodeEncodeError:
+            raise ValueError("Invalid base45 string")
+    elif not isinstance(data, (bytes, bytearray, memoryview)):
+        return base45.b45decode(data)
+
+    values = bytes(data).translate(_B45_TABLE)
+    if 255 in values:
+        raise ValueError("Invalid base45 string")
+
+    rest = len(values) % 3
+    if rest == 1:
+        raise ValueError("Invalid base45 string")
+    end = len(values) - rest
+    words = [c + d * 45 + e * 2025 for c, d, e in zip(
+        values[0:end:3], values[1:end:3], values[2:end:3])]
+    try:
+        decoded = struct.pack(">%iH" % len(words), *words)
+    except struct.error:
+        # a triple above 0xFFFF
+        raise ValueError("Invalid base45 string")
+    if rest:
+        last = values[end] + values[end + 1] * 45
+        if last > 0xFF:
+            raise ValueError("Invalid base45 string")
+        decoded += bytes((last,))
+    return decoded
+
+
+def check_length(dcc, max_length=MAX_DCC_LENGTH):
+    """
+    Rejects a DCC before any decoding if it's longer than max_length.
+    Raises:
+        InputTooLong: If the DCC is too long.
+    """
+    if len(dcc) > max_length:
+        raise InputTooLong("The DCC is longer than %i characters."
+                           % max_length)
+
+
+def zlib_decompress(data, max_size=MAX_PAYLOAD_SIZE):
+    """
+    Decompresses zlib data like zlib.decompress, but stops as soon as
+    the output exceeds max_size, so a compression bomb never takes more
+    than max_size bytes of memory.
+    Returns:
+        data: The decompressed bytes.
+    Raises:
+        DecompressedTooLarge: If the output exceeds max_size.
+        zlib.error: If the data is invalid or truncated.
+    """
+    decompressor = zlib.decompressobj()
+    decompressed = decompressor.decompress(data, max_size + 1)
+    if len(decompressed) > max_size:
+        raise DecompressedTooLarge(
+            "The decompressed DCC is larger than %i bytes." % max_size)
+    if not decompressor.eof:
+        raise zlib.error("Error -5 while decompressing data: "
+                         "incomplete or truncated stream")
+    return decompressed
@@ -0,0 +1,55 @@
+"""
+Encodes validation results straight to JSON.
+
+FastAPI validates a returned dict against the response model, walks it
+once more with jsonable_encoder and then encodes it with json.dumps. The
+results are built by the validator and need neither, so FastJSONResponse
+encodes them in one pass, with orjson if it's installed. The output is
+the same JSON FastAPI produces, orjson only writes floats in exponent
+notation differently, like 1e16 instead of 1e+16. Content orjson can't
+encode is encoded with the standard library.
+"""
+import json
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(obj):
+    # types orjson doesn't know, like the bytes of a cti claim, are
+    # encoded like FastAPI encodes them
+    return jsonable_encoder(obj)
+
+
+def dumps(content):
+    """
+    Encodes content like FastAPI's JSONResponse after jsonable_encoder.
+    Integer keys, like the ones of the claims, become strings.
+    Returns:
+        data: The UTF-8 encoded JSON.
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(content, default=_default,
+                                option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            # the claims of an unverified DCC can hold what orjson can't
+            # encode, like integers above 64 bits or bytes keys
+            pass
+    return json.dumps(jsonable_encoder(content), ensure_ascii=False,
+                      allow_nan=False, indent=None,
+                      separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    A JSONResponse that skips jsonable_encoder.
+    """
+
+    def render(self, content):
+        return dumps(content)
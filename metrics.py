@@ -0,0 +1,234 @@
+"""
+A minimal metrics registry that renders the Prometheus text format.
+
+The metrics are kept per process. With the process validation backend
+the validation metrics are collected inside of the workers.
+"""
+import time
+from bisect import bisect_left
+from itertools import accumulate
+from threading import Lock
+
+# latency buckets in seconds, from 10 microseconds up to 10 seconds
+DEFAULT_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+                   0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0)
+
+REGISTRY = []
+
+
+def _format_labels(labelnames, labelvalues, extra=()):
+    labels = list(zip(labelnames, labelvalues)) + list(extra)
+    if not labels:
+        return ""
+    return "{" + ",".join('%s="%s"' % (name, value)
+                          for name, value in labels) + "}"
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple([str(labels[name]) for name in self.labelnames])
+
+    def clear(self):
+        """
+        Drops all values, e.g. after the warm-up of a benchmark.
+        """
+        with self._lock:
+            self._values.clear()
+
+    def samples(self):
+        """
+        Returns the lines of the metric in the Prometheus text format.
+        """
+        with self._lock:
+            values = dict(self._values)
+        return ["%s%s %r" % (self.name,
+                             _format_labels(self.labelnames, key), value)
+                for key, value in values.items()]
+
+    def render(self):
+        return "\n".join(["# HELP %s %s" % (self.name, self.documentation),
+                          "# TYPE %s %s" % (self.name, self.type)]
+                         + self.samples())
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(Metric):
+    """
+    A value that can go up and down. If a function is given, the value is
+    read from it whenever the metrics are rendered.
+    """
+    type = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), function=None):
+        super().__init__(name, documentation, labelnames)
+        self._function = function
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def set_function(self, function):
+        self._function = function
+
+    def samples(self):
+        if self._function is not None:
+            self.set(self._function())
+        return super().samples()
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(),
+                 buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        # only the first bucket that holds the value is counted, the
+        # buckets are summed up when they are read
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # one counter per bucket and +Inf, the sum and the count
+                counts = self._values[key] = \
+                    [0] * (len(self.buckets) + 1) + [0, 0]
+            counts[index] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+    def time(self, **labels):
+        """
+        Returns a context manager that observes the time spent in it.
+        """
+        return _Timer(self, labels)
+
+    def _cumulative(self, counts):
+        return list(accumulate(counts[:len(self.buckets)]))
+
+    def count(self, **labels):
+        counts = self._values.get(self._key(labels))
+        return counts[-1] if counts else 0
+
+    def sum(self, **labels):
+        counts = self._values.get(self._key(labels))
+        return counts[-2] if counts else 0
+
+    def quantile(self, q, **labels):
+        """
+        Estimates a quantile like Prometheus' histogram_quantile, by
+        interpolating linearly inside of the bucket that contains it.
+        Returns:
+            value: The estimated quantile, the largest finite bucket
+            bound if it is in the +Inf bucket.
+        Fails:
+            None: If nothing was observed.
+        """
+        counts = self._values.get(self._key(labels))
+        if not counts or not counts[-1]:
+            return None
+        rank = q * counts[-1]
+        lower_bound = 0.0
+        lower_count = 0
+        for bound, count in zip(self.buckets, self._cumulative(counts)):
+            if count >= rank:
+                if count == lower_count:
+                    return bound
+                return lower_bound + (bound - lower_bound) * \
+                    (rank - lower_count) / (count - lower_count)
+            lower_bound = bound
+            lower_count = count
+        return self.buckets[-1]
+
+    def samples(self):
+        with self._lock:
+            values = {key: list(counts)
+                      for key, counts in self._values.items()}
+        lines = []
+        for key, counts in values.items():
+            for bound, count in zip(self.buckets, self._cumulative(counts)):
+                lines.append("%s_bucket%s %i" % (
+                    self.name,
+                    _format_labels(self.labelnames, key, [("le", bound)]),
+                    count))
+            labels = _format_labels(self.labelnames, key)
+            lines.append("%s_bucket%s %i" % (
+                self.name,
+                _format_labels(self.labelnames, key, [("le", "+Inf")]),
+                counts[-1]))
+            lines.append("%s_sum%s %r" % (self.name, labels, counts[-2]))
+            lines.append("%s_count%s %i" % (self.name, labels, counts[-1]))
+        return lines
+
+
+class _Timer:
+    """
+    Observes the seconds from entering to leaving it in a histogram. A
+    class instead of a generator based context manager, it's entered
+    several times per validation.
+    """
+    __slots__ = ("_histogram", "_labels", "_start")
+
+    def __init__(self, histogram, labels):
+        self._histogram = histogram
+        self._labels = labels
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._histogram.observe(time.perf_counter() - self._start,
+                                **self._labels)
+        return False
+
+
+def render():
+    """
+    Renders all registered metrics in the Prometheus text format.
+    """
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+VALIDATIONS = Counter(
+    "occv_validations_total",
+    "Validated certificates by result.",
+    ["result"])
+VALIDATION_STAGE_SECONDS = Histogram(
+    "occv_validation_stage_seconds",
+    "Time spent in each stage of the validation.",
+    ["stage"])
+LOADER_STAGE_SECONDS = Histogram(
+    "occv_loader_stage_seconds",
+    "Time spent downloading, verifying and building certificate lists.",
+    ["loader", "stage"])
+TRUST_LIST_SIZE = Gauge(
+    "occv_trust_list_size",
+    "Number of certificates in the trust store in use.")
+TRUST_LIST_AGE_SECONDS = Gauge(
+    "occv_trust_list_age_seconds",
+    "Seconds since the certificate lists were last refreshed successfully.")
@@ -1,21 +1,53 @@
 import os
+import time
+from typing import List, Union
 
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
-from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel
-
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, conlist
+
+import metrics
+from codec import MAX_DCC_LENGTH, MAX_PAYLOAD_SIZE, PayloadTooLarge
+from json_response import FastJSONResponse, dumps
+from refresh_scheduler import RefreshScheduler
+from static_cache import StaticAsset, StaticCache, asset_response
+from stream_validation import dump_result, read_lines, validate_lines
+from validation_pool import PoolSaturated, ValidationPool
 from validator import DCCValidator
 
 print("Open Covid Certificate Validator")
 
 # get the server country from the environment
 CERT_COUNTRY = os.getenv("CERT_COUNTRY", "XX")
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", 1000))
 DEV_MODE = os.getenv("DEV_MODE", 'False').lower() in ('true', '1', 't')
+# the backend that runs the validation: inline, thread or process
+VALIDATION_BACKEND = os.getenv("VALIDATION_BACKEND", "thread")
+VALIDATION_WORKERS = int(os.getenv("VALIDATION_WORKERS", 0)) or None
+VALIDATION_QUEUE_SIZE = os.getenv("VALIDATION_QUEUE_SIZE")
+if VALIDATION_QUEUE_SIZE is not None:
+    VALIDATION_QUEUE_SIZE = int(VALIDATION_QUEUE_SIZE)
+
+# caches the results of repeatedly scanned DCCs, disabled if 0
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", 0))
+RESULT_CACHE_TTL = int(os.getenv("RESULT_CACHE_TTL", 300))
+RESULT_CACHE_MAX_BYTES = int(
+    os.getenv("RESULT_CACHE_MAX_BYTES", 16 * 1024 * 1024))
+
+# the number of lines of a stream that are validated at the same time,
+# defaults to the number of validation workers
+STREAM_CONCURRENCY = int(os.getenv("STREAM_CONCURRENCY", 0)) or None
+# DCCs above these limits are rejected with 413 before they are decoded
+MAX_DCC_LENGTH = int(os.getenv("MAX_DCC_LENGTH", MAX_DCC_LENGTH))
+MAX_PAYLOAD_SIZE = int(os.getenv("MAX_PAYLOAD_SIZE", MAX_PAYLOAD_SIZE))
+# seconds between two certificate refreshes and the download timeout
+CERT_UPDATE_INTERVAL = int(os.getenv("CERT_UPDATE_INTERVAL", 86400))
+DOWNLOAD_TIMEOUT = float(os.getenv("DOWNLOAD_TIMEOUT", 30))
 
 print("Certificate country: " + CERT_COUNTRY)
 print("Development mode: "+str(DEV_MODE))
+print("Validation backend: " + VALIDATION_BACKEND)
 
 api_description = """
     Open Covid Certificate Validator API
@@ -43,13 +75,55 @@ if DEV_MODE:
     )
 
 # initialize the validation server
-validator = DCCValidator(country=CERT_COUNTRY, dev_mode=DEV_MODE)
+validator_options = {
+    "cache_size": RESULT_CACHE_SIZE,
+    "cache_ttl": RESULT_CACHE_TTL,
+    "cache_max_bytes": RESULT_CACHE_MAX_BYTES,
+    "max_dcc_length": MAX_DCC_LENGTH,
+    "max_payload_size": MAX_PAYLOAD_SIZE,
+}
+# the certificates are refreshed by the RefreshScheduler on the event loop
+validator = DCCValidator(country=CERT_COUNTRY, dev_mode=DEV_MODE,
+                         auto_update=False, **validator_options)
+validation_pool = ValidationPool(validator,
+                                 backend=VALIDATION_BACKEND,
+                                 workers=VALIDATION_WORKERS,
+                                 queue_size=VALIDATION_QUEUE_SIZE,
+                                 country=CERT_COUNTRY,
+                                 dev_mode=DEV_MODE,
+                                 validator_options=validator_options)
+if STREAM_CONCURRENCY is None:
+    STREAM_CONCURRENCY = validation_pool.workers
+refresh_scheduler = RefreshScheduler(validator,
+                                     interval=CERT_UPDATE_INTERVAL,
+                                     timeout=DOWNLOAD_TIMEOUT)
+
+
+@app.on_event("startup")
+async def start_refresh_scheduler():
+    await refresh_scheduler.start()
+
+
+@app.on_event("shutdown")
+async def stop_refresh_scheduler():
+    await refresh_scheduler.stop()
+
+
+@app.on_event("shutdown")
+def shutdown_validation_pool():
+    validation_pool.shutdown()
 
 # defines the schema for the request
 
 
 class DCCQuery(BaseModel):
     dcc: str = None
+    # the trust list to validate against, all loaded lists if not set
+    source: str = None
+    # evaluate the business rules against the certificate
+    rules: bool = False
+    # only return the verdict, exp and the certificate type
+    minimal: bool = False
 
     class Config:
         schema_extra = {
@@ -63,6 +137,8 @@ class DCCQuery(BaseModel):
 class DCCData(BaseModel):
     valid: bool = False
     dccdata: dict = None
+    # the results of the business rules, only if they were requested
+    rules: List[dict] = None
 
     class Config:
         schema_extra = {
@@ -103,14 +179,101 @@ class DCCData(BaseModel):
         }
 
 
+# defines the schema for the response of a minimal request
+class DCCMinimalData(BaseModel):
+    valid: bool = False
+    # valid, undecodable, unknown_signer, invalid_signature,
+    # invalid_claims, expired or not_yet_valid
+    reason: str = None
+    exp: int = None
+    # vaccination, test or recovery
+    type: str = None
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "valid": True,
+                "reason": "valid",
+                "exp": 1635876000,
+                "type": "vaccination"
+            }
+        }
+
+
+# defines the schema for a batch request
+class DCCBatchQuery(BaseModel):
+    dccs: conlist(str, min_items=1, max_items=MAX_BATCH_SIZE)
+    source: str = None
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "dccs": ["HC1:NCF0XN%...", "HC1:6BF+70790..."]
+            }
+        }
+
+
+# defines the schema for a single result of a batch request
+class DCCBatchItem(BaseModel):
+    valid: bool = False
+    dccdata: dict = None
+    error: str = None
+
+
+# defines the schema for the response of a batch request
+class DCCBatchData(BaseModel):
+    results: List[DCCBatchItem] = []
+
+
+# the frontend is loaded into memory once
 folder = 'web/dist/'
-app.mount("/static/", StaticFiles(directory=folder), name="static")
+static_files = StaticCache(folder)
+
+
+# the encoded rules and the rules generation they were encoded for
+business_rules_asset = (None, None)
+
+
+def get_business_rules_asset():
+    """
+    Encodes the rules once per rules generation, like FastAPI would
+    encode them, and keeps the bytes with their ETag and gzip variant.
+    """
+    global business_rules_asset
+    generation, asset = business_rules_asset
+    current = validator.get_rules_generation()
+    if asset is None or generation != current:
+        body = dumps(validator.get_business_rules())
+        asset = StaticAsset("business_rules.json", body, time.time())
+        business_rules_asset = (current, asset)
+    return asset
 
 
 @app.get("/business_rules/")
 def business_rules(request: Request):
-    business_rules = validator.get_business_rules()
-    return business_rules
+    """
+    returns the business rules, 304 if the client has them already
+    """
+    return asset_response(get_business_rules_asset(), request.headers)
+
+
+@app.get("/status/")
+def status(request: Request):
+    """
+    returns the size, generation and load time of the trust store in use
+    """
+    return validator.get_status()
+
+
+@app.get("/metrics", response_class=PlainTextResponse,
+         include_in_schema=False)
+def read_metrics(request: Request):
+    """
+    returns the metrics of this process in the Prometheus text format
+    """
+    return PlainTextResponse(metrics.render(),
+                             media_type="text/plain; version=0.0.4")
+
 
 if DEV_MODE:
     @app.get("/update_certs/")
@@ -119,35 +282,57 @@ if DEV_MODE:
         return None 
 
 
-@app.get("/", response_class=FileResponse, include_in_schema=False)
-def read_index(request: Request):
-    path = folder + 'index.html'
-    return FileResponse(path)
+@app.get("/static/{path:path}", include_in_schema=False)
+def read_static(request: Request, path: str):
+    return static_files.response(path, request.headers, fallback=False)
 
 
-@app.get("/{catchall:path}", response_class=FileResponse,
-         include_in_schema=False)
+@app.get("/", include_in_schema=False)
 def read_index(request: Request):
-    # check first if requested file exists
-    path = request.path_params["catchall"]
-    file = folder+path
+    return static_files.response(static_files.index, request.headers)
+
+
+@app.get("/{catchall:path}", include_in_schema=False)
+def read_file(request: Request, catchall: str):
+    # returns the requested file or the index for unknown paths
+    return static_files.response(catchall, request.headers)
 
-    print('look for: ', path, file)
-    if os.path.exists(file):
-        return FileResponse(file)
 
-    # otherwise return index files
-    index = folder + 'index.html'
-    return FileResponse(index)
+def check_source(source):
+    """
+    rejects requests for trust lists that aren't loaded
+    """
+    if source is not None and source not in validator.sources:
+        raise HTTPException(status_code=422, detail=str(
+            "Unknown certificate source. Available sources: " +
+            ", ".join(validator.sources)))
 
-@app.post("/", response_model=DCCData)
+
+@app.post("/", response_model=Union[DCCData, DCCMinimalData])
 async def validate_dcc(dcc: DCCQuery):
     """
     post call to read validate a received DCC
+    the business rules are evaluated if rules is set
+    only the verdict without personal data is returned if minimal is set
     """
+    check_source(dcc.source)
+    source = dcc.source
+    evaluate_rules = dcc.rules
+    minimal = dcc.minimal
     dcc = dcc.dcc
     try:
-        valid, dcc_data = validator.validate(dcc)
+        if minimal:
+            return FastJSONResponse(await validation_pool.validate(
+                dcc, source, minimal=True))
+        valid, dcc_data = await validation_pool.validate(dcc, source)
+    except PoolSaturated as error:
+        print(error)
+        raise HTTPException(status_code=503, detail=str(
+            "Server busy, try again later."), headers={"Retry-After": "1"})
+    except PayloadTooLarge as error:
+        print(error)
+        raise HTTPException(status_code=413, detail=str(error),
+                            headers={"X-Error-Code": error.code})
     except Exception as error:
         print(error)
         raise HTTPException(status_code=415, detail=str(
@@ -155,4 +340,63 @@ async def validate_dcc(dcc: DCCQuery):
         dcc_data = None
         valid = False
 
-    return DCCData(valid=valid, dccdata=dcc_data)
+    # the result is encoded directly, the model only documents it
+    result = {"valid": valid, "dccdata": dcc_data}
+    if evaluate_rules:
+        # the rules only apply to certificates that are valid at all
+        result["rules"] = validator.evaluate_rules(dcc_data) \
+            if valid else None
+    return FastJSONResponse(result)
+
+
+@app.post("/batch/", response_model=DCCBatchData)
+async def validate_dcc_batch(batch: DCCBatchQuery):
+    """
+    post call to validate a list of DCCs at once
+    the results are returned in the order of the request
+    """
+    check_source(batch.source)
+    try:
+        results = await validation_pool.validate_batch(
+            batch.dccs, batch.source)
+    except PoolSaturated as error:
+        print(error)
+        raise HTTPException(status_code=503, detail=str(
+            "Server busy, try again later."), headers={"Retry-After": "1"})
+
+    return FastJSONResponse({"results": [
+        {"valid": valid, "dccdata": dcc_data, "error": error}
+        for valid, dcc_data, error in results]})
+
+
+class DuplexStreamingResponse(StreamingResponse):
+    """
+    streams the response while the request body is still being read
+    the disconnect listener of StreamingResponse would swallow the body,
+    a disconnect ends request.stream() with ClientDisconnect instead
+    """
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+
+@app.post("/stream/", response_class=DuplexStreamingResponse)
+async def validate_dcc_stream(request: Request, source: str = None):
+    """
+    post call to validate newline delimited DCCs, e.g. a scan log
+    the results are streamed back as NDJSON in the order they complete,
+    every result carries the line number of its DCC
+    """
+    check_source(source)
+
+    async def validate(dcc):
+        # a stream waits for free workers instead of failing
+        return await validation_pool.validate(dcc, source, wait=True)
+
+    lines = read_lines(request.stream(), validator.max_dcc_length)
+    results = validate_lines(lines, validate, STREAM_CONCURRENCY)
+    return DuplexStreamingResponse(
+        (dump_result(result) async for result in results),
+        media_type="application/x-ndjson")
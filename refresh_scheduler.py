@@ -0,0 +1,65 @@
+import asyncio
+
+import httpx
+
+from cert_loaders.downloader import AsyncDownloader
+
+
+class RefreshScheduler:
+    """
+    Refreshes the certificates of a validator on the event loop.
+
+    All downloads share one pooled async HTTP client with timeouts.
+    Unchanged lists are answered with 304 Not Modified by the servers,
+    so a refresh without changes costs a few small requests.
+    """
+
+    def __init__(self, validator, interval=86400, timeout=30.0):
+        self.interval = interval
+        self.timeout = timeout
+        self._validator = validator
+        self._client = None
+        self._downloader = None
+        self._task = None
+
+    async def start(self):
+        """
+        Opens the HTTP client and starts the periodic refresh.
+        """
+        self._client = httpx.AsyncClient(timeout=self.timeout,
+                                         follow_redirects=True)
+        self._downloader = AsyncDownloader(self._client)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Stops the periodic refresh and closes the HTTP client.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def refresh(self):
+        """
+        Refreshes the certificates once.
+        Returns:
+            True if a new trust store was published.
+        """
+        print("Refreshing the certificates.")
+        try:
+            return await self._validator.refresh_async(self._downloader)
+        except Exception as e:
+            print("Could not refresh the certificates: %s" % e)
+            return False
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.refresh()
@@ -0,0 +1,98 @@
+import sys
+import time
+from collections import OrderedDict
+from threading import Lock
+
+
+def estimate_size(obj):
+    """
+    Estimates the memory used by a validation result, including the
+    dicts, lists and tuples inside of it.
+    """
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += estimate_size(key) + estimate_size(value)
+    elif isinstance(obj, (list, tuple)):
+        for value in obj:
+            size += estimate_size(value)
+    return size
+
+
+class ResultCache:
+    """
+    A bounded LRU cache for validation results.
+
+    Entries are dropped when they are older than the TTL, when the
+    certificate inside of them expires, when there are more than
+    max_entries entries or when the estimated size of all entries exceeds
+    max_bytes. The least recently used entries are dropped first.
+    """
+
+    def __init__(self, max_entries=1024, ttl=300, max_bytes=16 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._bytes = 0
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """
+        Returns the cached result for the key.
+        Fails:
+            None: If the key isn't cached or the entry expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, size, result = entry
+                if expires > time.time():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return result
+                del self._entries[key]
+                self._bytes -= size
+            self.misses += 1
+            return None
+
+    def put(self, key, result, expires=None):
+        """
+        Caches a result until the TTL runs out or until expires,
+        whichever comes first. The size of the result is estimated once,
+        so it must not grow while it's cached.
+        """
+        expires_ttl = time.time() + self.ttl
+        if expires is None or expires > expires_ttl:
+            expires = expires_ttl
+        size = estimate_size(result)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old_entry = self._entries.pop(key, None)
+            if old_entry is not None:
+                self._bytes -= old_entry[1]
+            self._entries[key] = (expires, size, result)
+            self._bytes += size
+            while len(self._entries) > self.max_entries \
+                    or self._bytes > self.max_bytes:
+                _, (_, old_size, _) = self._entries.popitem(last=False)
+                self._bytes -= old_size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
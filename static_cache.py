@@ -0,0 +1,166 @@
+"""
+Serves the web frontend from memory.
+
+All files are read, hashed and compressed once when the server starts,
+so a request neither touches the disk nor compresses anything.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+from email.utils import formatdate, parsedate_to_datetime
+
+from fastapi.responses import Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# files with a content hash in their name, like bundle.3f2a1b9c.js, never
+# change and may be cached for a year
+HASHED_NAME = re.compile(r"\.[0-9a-f]{8,}\.")
+IMMUTABLE = "public, max-age=31536000, immutable"
+# everything else has to be revalidated with its ETag
+REVALIDATE = "no-cache"
+
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json",
+                      "image/svg+xml")
+
+
+class StaticAsset:
+    """
+    A file of the frontend with its precompressed variants.
+    """
+
+    def __init__(self, path, body, mtime):
+        self.content_type = mimetypes.guess_type(path)[0] \
+            or "application/octet-stream"
+        self.etag = '"%s"' % hashlib.sha256(body).hexdigest()[:32]
+        self.last_modified = formatdate(mtime, usegmt=True)
+        self.mtime = int(mtime)
+        self.cache_control = IMMUTABLE if HASHED_NAME.search(
+            os.path.basename(path)) else REVALIDATE
+        # the variants by content encoding, the smallest one is preferred
+        self.variants = {"identity": body}
+        if self.content_type.startswith(COMPRESSIBLE_TYPES):
+            compressed = {"gzip": gzip.compress(body, 9, mtime=0)}
+            if brotli is not None:
+                compressed["br"] = brotli.compress(body)
+            for encoding, variant in compressed.items():
+                if len(variant) < len(body):
+                    self.variants[encoding] = variant
+
+    def etag_for(self, encoding):
+        if encoding == "identity":
+            return self.etag
+        return self.etag[:-1] + "-" + encoding + '"'
+
+
+def _accepted_encodings(header):
+    """
+    Reads the encodings with a q-value above 0 from Accept-Encoding.
+    """
+    encodings = set()
+    for item in header.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name and quality > 0:
+            encodings.add(name.strip().lower())
+    return encodings
+
+
+class StaticCache:
+    """
+    Loads all files below a directory into memory and builds the
+    responses for them, including conditional and compressed responses.
+    """
+
+    def __init__(self, directory, index="index.html"):
+        self.index = index
+        self.assets = {}
+        if not os.path.isdir(directory):
+            print("Static directory %s not found." % directory)
+            return
+        for root, _, files in os.walk(directory):
+            for name in files:
+                filename = os.path.join(root, name)
+                path = os.path.relpath(filename, directory).replace(
+                    os.sep, "/")
+                with open(filename, "rb") as f:
+                    body = f.read()
+                self.assets[path] = StaticAsset(
+                    path, body, os.path.getmtime(filename))
+        print("Loaded %i static files into memory." % len(self.assets))
+
+    def get(self, path):
+        return self.assets.get(path.lstrip("/"))
+
+    def response(self, path, headers, fallback=True):
+        """
+        Builds the response for a file.
+        If the file doesn't exist the index is returned, unless fallback
+        is False.
+        Returns:
+            response: The file, 304 if the client has it already or 404.
+        """
+        asset = self.get(path)
+        if asset is None and fallback:
+            asset = self.get(self.index)
+        if asset is None:
+            return Response(status_code=404)
+
+        return asset_response(asset, headers)
+
+
+def asset_response(asset, headers):
+    """
+    Builds the response for an asset in the encoding the client prefers.
+    Returns:
+        response: The asset or 304 if the client has it already.
+    """
+    accepted = _accepted_encodings(headers.get("accept-encoding", ""))
+    encoding = min((name for name in asset.variants
+                    if name == "identity" or name in accepted),
+                   key=lambda name: len(asset.variants[name]))
+    response_headers = {
+        "ETag": asset.etag_for(encoding),
+        "Last-Modified": asset.last_modified,
+        "Cache-Control": asset.cache_control,
+        "Vary": "Accept-Encoding",
+    }
+
+    if _not_modified(asset, headers):
+        return Response(status_code=304, headers=response_headers)
+
+    if encoding != "identity":
+        response_headers["Content-Encoding"] = encoding
+    return Response(asset.variants[encoding],
+                    media_type=asset.content_type,
+                    headers=response_headers)
+
+
+def _not_modified(asset, headers):
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = set()
+        for tag in if_none_match.split(","):
+            tag = tag.strip()
+            tags.add(tag[2:] if tag.startswith("W/") else tag)
+        return "*" in tags or any(asset.etag_for(encoding) in tags
+                                  for encoding in asset.variants)
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return asset.mtime <= since
+    return False
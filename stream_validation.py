@@ -0,0 +1,157 @@
+"""
+Validation of newline delimited DCCs, e.g. replayed scan logs.
+
+Only the current line of the input and the validations in flight are
+kept in memory, the results are written out as they complete.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from codec import MAX_DCC_LENGTH, InputTooLong, PayloadTooLarge
+from json_response import dumps
+
+STREAM_ERROR = "Data format incompatible."
+# bytes read from a file at once
+CHUNK_SIZE = 64 * 1024
+# the prefix of a DCC, it's allowed on top of the maximum length of a line
+PREFIX = b"HC1:"
+
+
+async def read_lines(chunks, max_length=MAX_DCC_LENGTH):
+    """
+    Splits an async stream of byte chunks into lines.
+    Only the incomplete line at the end of a chunk is buffered, up to
+    max_length bytes plus the prefix. A longer line is yielded as an
+    InputTooLong error instead and the input is dropped up to the next
+    newline.
+    Yields:
+        line: The bytes of a line without the newline, or InputTooLong.
+    """
+    limit = max_length + len(PREFIX)
+    parts = []
+    size = 0
+    too_long = False
+    async for chunk in chunks:
+        start = 0
+        while True:
+            end = chunk.find(b"\n", start)
+            piece = chunk[start:] if end < 0 else chunk[start:end]
+            if not too_long:
+                size += len(piece)
+                too_long = size > limit
+                if too_long:
+                    parts = []
+                else:
+                    # the parts are joined once the line is complete
+                    parts.append(piece)
+            if end < 0:
+                break
+            yield _line(parts, too_long, max_length)
+            parts, size, too_long = [], 0, False
+            start = end + 1
+    if size or too_long:
+        yield _line(parts, too_long, max_length)
+
+
+def _line(parts, too_long, max_length):
+    if too_long:
+        return InputTooLong("The DCC is longer than %i characters."
+                            % max_length)
+    return b"".join(parts)
+
+
+def _error_result(number, message):
+    return {"line": number, "valid": False, "dccdata": None,
+            "error": message}
+
+
+async def _validate_line(validate, number, line):
+    try:
+        valid, dcc_data = await validate(line.decode())
+        return {"line": number, "valid": valid, "dccdata": dcc_data,
+                "error": None}
+    except Exception as error:
+        print(error)
+        message = str(error) if isinstance(error, PayloadTooLarge) \
+            else STREAM_ERROR
+        return _error_result(number, message)
+
+
+async def validate_lines(lines, validate, concurrency):
+    """
+    Validates every non-empty line with the async validate function.
+    Lines that read_lines rejected as too long get an error result.
+    At most concurrency lines are validated at the same time, no more
+    lines are read until one of them completes.
+    Yields:
+        result: A dictionary with the line number, valid, dccdata and
+        error in the order the validations complete.
+    """
+    pending = set()
+    number = 0
+    try:
+        async for line in lines:
+            number += 1
+            if isinstance(line, PayloadTooLarge):
+                yield _error_result(number, str(line))
+                continue
+            line = line.strip()
+            if not line:
+                continue
+            if len(pending) >= concurrency:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+            pending.add(asyncio.ensure_future(
+                _validate_line(validate, number, line)))
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
+    finally:
+        # the reader went away, e.g. the client closed the connection
+        for task in pending:
+            task.cancel()
+
+
+def dump_result(result):
+    """
+    Encodes a result as one line of NDJSON, like the other responses.
+    """
+    try:
+        line = dumps(result)
+    except Exception:
+        line = dumps({"line": result["line"], "valid": result["valid"],
+                      "dccdata": None, "error": STREAM_ERROR})
+    return line + b"\n"
+
+
+def validate_file(validator, input, output, concurrency, source=None):
+    """
+    Validates newline delimited DCCs from a binary file like stdin and
+    writes the results as NDJSON to a binary file like stdout.
+    The validations run in a pool of concurrency threads.
+    """
+    async def chunks():
+        read = getattr(input, "read1", input.read)
+        while True:
+            chunk = await asyncio.to_thread(read, CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            async def validate(dcc):
+                return await loop.run_in_executor(
+                    executor, validator.validate, dcc, source)
+
+            lines = read_lines(chunks(), validator.max_dcc_length)
+            async for result in validate_lines(lines, validate, concurrency):
+                output.write(dump_result(result))
+                output.flush()
+
+    asyncio.run(run())
@@ -0,0 +1,92 @@
+import csv
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from cwt import load_pem_hcert_dsc
+
+from bulk_validate import iter_records, main
+from cert_loaders.trust_store import TrustStore
+from test_helper import create_test_dcc, create_test_dsc
+from validator import DCCValidator
+
+
+class BulkValidateTests(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self._out = tempfile.TemporaryDirectory()
+        self.cert_pem, signing_key = create_test_dsc()
+        self.dcc = create_test_dcc(signing_key)
+        os.makedirs(os.path.join(self._tmp.name, "XX", "2DCode", "raw"))
+        self.fixture = os.path.join(self._tmp.name, "XX", "2DCode", "raw",
+                                    "1.json")
+        with open(self.fixture, "w") as f:
+            json.dump({"PREFIX": self.dcc}, f)
+        self.log = os.path.join(self._tmp.name, "scans.log")
+        with open(self.log, "w") as f:
+            f.write("%s\n\nHC1:FFFFFFFF\n" % self.dcc)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+        self._out.cleanup()
+
+    def test_iter_records(self):
+        """
+        Check that fixtures and scan logs are read with their positions.
+        """
+        records = list(iter_records([self._tmp.name]))
+        self.assertEqual(records, [(self.log + ":1", self.dcc),
+                                   (self.log + ":3", "HC1:FFFFFFFF"),
+                                   (self.fixture, self.dcc)])
+
+    def test_main_jsonl(self):
+        """
+        Check that every record is written in order and counted.
+        """
+        output = os.path.join(self._out.name, "out.jsonl")
+        counts = main(["--country", "XX", "--workers", "2",
+                       "--output", output, self._tmp.name])
+        with open(output) as f:
+            results = [json.loads(line) for line in f]
+        self.assertEqual([result["record"] for result in results],
+                         [self.log + ":1", self.log + ":3", self.fixture])
+        # the test DSC isn't in the certificate list
+        self.assertEqual([result["reason"] for result in results],
+                         ["unknown_signer", "undecodable", "unknown_signer"])
+        self.assertEqual(sum(counts.values()), 3)
+        self.assertEqual(counts["valid"], 0)
+
+    def test_trust_store_of_parent(self):
+        """
+        Check that the workers validate with the trust store the parent
+        loaded instead of loading their own.
+        """
+        trust_store = TrustStore.merge(
+            {"XX": [load_pem_hcert_dsc(self.cert_pem)]})
+        output = os.path.join(self._out.name, "out.jsonl")
+        with mock.patch.object(DCCValidator, "get_trust_store",
+                               return_value=trust_store):
+            counts = main(["--country", "XX", "--workers", "2",
+                           "--output", output, self._tmp.name])
+        self.assertEqual(counts["valid"], 2)
+
+    def test_main_csv(self):
+        """
+        Check the CSV output.
+        """
+        output = os.path.join(self._out.name, "out.csv")
+        main(["--country", "XX", "--workers", "1", "--format", "csv",
+              "--output", output, self.log])
+        with open(output, newline="") as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(rows[0], ["record", "valid", "reason", "error"])
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[1], [self.log + ":1", "False", "unknown_signer",
+                                   ""])
+
+
+if __name__ == '__main__':
+    unittest.main()
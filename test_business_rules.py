@@ -0,0 +1,240 @@
+import json
+import unittest
+from datetime import datetime, timezone
+
+import cbor2
+
+from business_rules import (CertLogicError, RuleSet, compile_logic,
+                            parse_datetime)
+from cert_loaders.certificate_loader import CertificateLoader
+from validator import DCCValidator
+
+NOW = datetime(2021, 7, 1, 12, tzinfo=timezone.utc)
+
+HCERT = {
+    "ver": "1.0.0",
+    "dob": "1964-08-12",
+    "nam": {"fn": "Mustermann", "fnt": "MUSTERMANN",
+            "gn": "Erika", "gnt": "ERIKA"},
+    "v": [{
+        "ci": "URN:UVCI:01DE/IZ12345A/5CWLU12RNOB9RXSEOP6FG8#W",
+        "co": "DE",
+        "dn": 2,
+        "dt": "2021-05-29",
+        "is": "Robert Koch-Institut",
+        "ma": "ORG-100031184",
+        "mp": "EU/1/20/1507",
+        "sd": 2,
+        "tg": "840539006",
+        "vp": "1119349007",
+    }],
+}
+CLAIMS = {1: "DE", 4: 1643356073, 6: 1622316073, -260: {1: HCERT}}
+
+
+def rule(identifier, logic, certificate_type="Vaccination",
+         version="1.0.0", **fields):
+    rule = {
+        "Identifier": identifier,
+        "Type": "Acceptance",
+        "Country": "AT",
+        "Version": version,
+        "CertificateType": certificate_type,
+        "Description": [{"lang": "de", "desc": "Beschreibung"},
+                        {"lang": "en", "desc": "Description of " +
+                         identifier}],
+        "ValidFrom": "2021-06-01T00:00:00Z",
+        "ValidTo": "2030-06-01T00:00:00Z",
+        "Logic": logic,
+    }
+    rule.update(fields)
+    return rule
+
+
+RULES = [
+    rule("VR-AT-0000", {"if": [
+        {"var": "payload.v.0"},
+        {"in": [{"var": "payload.v.0.mp"},
+                ["EU/1/20/1528", "EU/1/20/1507", "EU/1/21/1529"]]},
+        True]}),
+    rule("VR-AT-0001", {"if": [
+        {"var": "payload.v.0"},
+        {"not-before": [
+            {"plusTime": [{"var": "external.validationClock"}, 0, "day"]},
+            {"plusTime": [{"var": "payload.v.0.dt"}, 14, "day"]}]},
+        True]}),
+    rule("VR-AT-0002", {"if": [
+        {"var": "payload.v.0"},
+        {">=": [{"var": "payload.v.0.dn"}, {"var": "payload.v.0.sd"}]},
+        True]}),
+    rule("TR-AT-0000", {"===": [{"var": "payload.t.0.tr"}, "260415000"]},
+         certificate_type="Test"),
+    rule("GR-AT-0000", {"before": [
+        {"dccDateOfBirth": [{"var": "payload.dob"}]},
+        {"plusTime": [{"var": "external.validationClock"}, -12, "year"]}]},
+        certificate_type="General"),
+]
+
+
+class CompileTests(unittest.TestCase):
+
+    def evaluate(self, logic, data=None):
+        return compile_logic(logic)(data or {})
+
+    def test_operations(self):
+        data = {"a": {"b": [1, 2, 3]}, "s": "x"}
+        self.assertEqual(self.evaluate({"var": "a.b.1"}, data), 2)
+        self.assertIsNone(self.evaluate({"var": "a.c.0"}, data))
+        self.assertEqual(self.evaluate({"+": [1, {"var": "a.b.2"}]}, data), 4)
+        self.assertTrue(self.evaluate({"===": [{"var": "s"}, "x"]}, data))
+        self.assertFalse(self.evaluate({"===": [1, True]}))
+        self.assertEqual(self.evaluate({"and": [1, 0, 2]}), 0)
+        self.assertTrue(self.evaluate({"!": [[]]}))
+        self.assertTrue(self.evaluate({"<": [1, 2, 3]}))
+        self.assertFalse(self.evaluate({"<=": [1, 3, 2]}))
+        self.assertEqual(self.evaluate({"if": [0, "a", "b"]}), "b")
+        self.assertEqual(self.evaluate(
+            {"reduce": [{"var": "a.b"},
+                        {"+": [{"var": "accumulator"}, {"var": "current"}]},
+                        0]}, data), 6)
+        self.assertEqual(self.evaluate(
+            {"extractFromUVCI": ["URN:UVCI:01:AT:10807843F94AEE0EE5093FBC"
+                                 "254BD813#B", 1]}), "AT")
+
+    def test_dates(self):
+        self.assertTrue(self.evaluate({"after": [
+            {"plusTime": ["2021-01-31", 1, "month"]}, "2021-02-27"]}))
+        self.assertEqual(
+            self.evaluate({"plusTime": ["2021-01-31", 1, "month"]}),
+            datetime(2021, 2, 28, tzinfo=timezone.utc))
+        self.assertEqual(
+            self.evaluate({"dccDateOfBirth": ["1964-02"]}),
+            datetime(1964, 2, 29, tzinfo=timezone.utc))
+        self.assertTrue(self.evaluate({"not-after": [
+            "2021-05-29T00:00:00Z", "2021-05-29", "2021-05-30T10:00:00+02:00"]}))
+
+    def test_time_zones(self):
+        """
+        Check the forms of time zones the rules use, not all of them are
+        understood by datetime.fromisoformat before Python 3.11.
+        """
+        expected = datetime(2021, 6, 1, 10, tzinfo=timezone.utc)
+        for value in ("2021-06-01T10:00:00Z", "2021-06-01T12:00:00+0200",
+                      "2021-06-01T12:00:00+02:00", "2021-06-01T08:30:00-0130",
+                      "2021-06-01T10:00:00"):
+            with self.subTest(value=value):
+                self.assertEqual(parse_datetime(value), expected)
+
+    def test_invalid(self):
+        cases = [
+            {"unknown": [1]},
+            {"if": [1, 2]},
+            {"var": "a", "if": [1, 2, 3]},
+            {"<": [1]},
+        ]
+        for logic in cases:
+            with self.subTest(logic=logic):
+                with self.assertRaises(CertLogicError):
+                    compile_logic(logic)
+        with self.assertRaises(CertLogicError):
+            self.evaluate({"<": ["1", 2]})
+
+
+class RuleSetTests(unittest.TestCase):
+
+    def test_evaluate(self):
+        rule_set = RuleSet(RULES)
+        results = rule_set.evaluate(CLAIMS, NOW)
+        self.assertEqual(
+            {result["identifier"]: result["result"] for result in results},
+            {"GR-AT-0000": "passed", "VR-AT-0000": "passed",
+             "VR-AT-0001": "passed", "VR-AT-0002": "passed"})
+        self.assertEqual(results[1]["description"],
+                         "Description of VR-AT-0000")
+
+        hcert = dict(HCERT, v=[dict(HCERT["v"][0], mp="CVnCoV",
+                                    dt="2021-06-30")])
+        results = rule_set.evaluate({-260: {1: hcert}}, NOW)
+        self.assertEqual(
+            [result["result"] for result in results],
+            ["passed", "failed", "failed", "passed"])
+
+    def test_open(self):
+        """
+        Check that a rule that can't be evaluated is neither passed nor
+        failed.
+        """
+        hcert = dict(HCERT, dob="unknown")
+        results = RuleSet(RULES).evaluate({-260: {1: hcert}}, NOW)
+        self.assertEqual(results[0]["result"], "open")
+
+    def test_validity(self):
+        rule_set = RuleSet(RULES)
+        before = datetime(2021, 5, 1, tzinfo=timezone.utc)
+        self.assertEqual(rule_set.evaluate(CLAIMS, before), [])
+        self.assertEqual(rule_set.evaluate({1: "DE"}, NOW), [])
+
+    def test_newest_version(self):
+        rule_set = RuleSet([
+            rule("VR-AT-0000", False, version="1.0.9"),
+            rule("VR-AT-0000", True, version="1.0.10"),
+            rule("VR-AT-0000", False, version="1.0.2"),
+        ])
+        self.assertEqual(len(rule_set), 1)
+        self.assertEqual(rule_set.evaluate(CLAIMS, NOW)[0]["result"],
+                         "passed")
+
+    def test_from_rules(self):
+        """
+        Check the formats rules are distributed in, broken rules are
+        skipped.
+        """
+        rules = {"r": [
+            {"i": "VR-AT-0000", "r": json.dumps(RULES[0])},
+            json.dumps(RULES[1]),
+            RULES[2],
+            rule("VR-AT-0003", {"unknown": []}),
+        ]}
+        rule_set = RuleSet.from_rules(cbor2.loads(cbor2.dumps(rules)))
+        self.assertEqual([rule.identifier for rule in rule_set.rules],
+                         ["VR-AT-0000", "VR-AT-0001", "VR-AT-0002"])
+
+    def test_value_sets(self):
+        """
+        Check that the distributed value sets are parsed and looked up by
+        the rules.
+        """
+        value_set = {"valueSetId": "vaccines-covid-19-names",
+                     "valueSetValues": {"EU/1/20/1507": {"display": "x"},
+                                        "EU/1/20/1528": {"display": "y"}}}
+        value_sets = {"v": [{"i": "vaccines-covid-19-names",
+                             "v": json.dumps(value_set)}]}
+        rules = [rule("VR-AT-0004", {"in": [
+            {"var": "payload.v.0.mp"},
+            {"var": "external.valueSets.vaccines-covid-19-names"}]})]
+        rule_set = RuleSet.from_rules(rules, value_sets)
+        self.assertEqual(rule_set.value_sets, {
+            "vaccines-covid-19-names": ["EU/1/20/1507", "EU/1/20/1528"]})
+        self.assertEqual(rule_set.evaluate(CLAIMS, NOW)[0]["result"],
+                         "passed")
+        self.assertEqual(RuleSet.from_rules(rules).evaluate(
+            CLAIMS, NOW)[0]["result"], "open")
+
+
+class ValidatorTests(unittest.TestCase):
+
+    def test_evaluate_rules(self):
+        validator = DCCValidator(country="XX", certs=[], auto_update=False)
+        self.assertIsNone(validator.evaluate_rules(CLAIMS, NOW))
+
+        loader = CertificateLoader()
+        loader._set_rules({"r": RULES})
+        self.assertEqual(loader.rules_generation, 1)
+        validator._cert_loaders = {"XX": loader}
+        results = validator.evaluate_rules(CLAIMS, NOW)
+        self.assertEqual(len(results), 4)
+        self.assertIsNone(validator.evaluate_rules(None, NOW))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,349 @@
+import asyncio
+import datetime
+import hashlib
+import json
+import os
+import tempfile
+import unittest
+from base64 import b64encode
+from unittest import mock
+
+import cbor2
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+from cryptography.hazmat.primitives.asymmetric.utils import \
+    decode_dss_signature
+from cryptography.hazmat.primitives.serialization import (Encoding,
+                                                          PublicFormat)
+from cryptography.x509 import (CertificateBuilder, Name, NameAttribute,
+                               load_pem_x509_certificate,
+                               random_serial_number)
+from cryptography.x509.oid import NameOID
+from cwt import COSE, load_pem_hcert_dsc
+
+from cert_loaders.at import CertificateLoader_AT
+from cert_loaders.certificate_loader import CertificateLoader
+from cert_loaders.de import CertificateLoader_DE, public_key_sha256
+from cert_loaders.helper import der_public_key_info, load_der_hcert_dsc
+from cert_loaders.signed_artifact import SignedArtifactVerifier
+from test_helper import create_test_dsc
+
+
+class ListLoader(CertificateLoader):
+    """
+    A loader whose signed list is a plain concatenation of DER certificates.
+    """
+
+    def __init__(self, certs):
+        super().__init__()
+        self._cert_filename = 'test_list'
+        self._ders = certs
+
+    def _extract_certs(self, certs_str):
+        return self._ders
+
+
+class CompiledCertlistTests(unittest.TestCase):
+
+    def setUp(self):
+        self._cwd = os.getcwd()
+        self._tmp = tempfile.TemporaryDirectory()
+        os.chdir(self._tmp.name)
+        os.mkdir("data")
+        self.pems = [create_test_dsc("DSC %i" % i)[0] for i in range(2)]
+        self.ders = [load_pem_x509_certificate(pem.encode()).public_bytes(
+            Encoding.DER) for pem in self.pems]
+
+    def tearDown(self):
+        os.chdir(self._cwd)
+        self._tmp.cleanup()
+
+    def test_der_matches_pem(self):
+        """
+        Check that loading a DER certificate gives the same key as PEM.
+        """
+        for pem, der in zip(self.pems, self.ders):
+            self.assertEqual(load_der_hcert_dsc(der).to_dict(),
+                             load_pem_hcert_dsc(pem).to_dict())
+
+    def test_compiled_cache(self):
+        """
+        Check that an unchanged list is read from the compiled cache and
+        a changed list is parsed again.
+        """
+        loader = ListLoader(self.ders)
+        certs = loader._compile_certlist(b"list 1")
+        self.assertTrue(os.path.exists("data/test_list.keys"))
+
+        loader = ListLoader(self.ders)
+        with mock.patch("cert_loaders.certificate_loader.load_der_hcert_dsc",
+                        wraps=load_der_hcert_dsc) as load:
+            cached = loader._compile_certlist(b"list 1")
+            load.assert_not_called()
+        self.assertEqual([cert.to_dict() for cert in cached],
+                         [cert.to_dict() for cert in certs])
+
+        loader._ders = self.ders[:1]
+        changed = loader._compile_certlist(b"list 2")
+        self.assertEqual(len(changed), 1)
+
+    def test_compiled_cache_tampered(self):
+        """
+        Check that a compiled file with a key that isn't in the verified
+        list is ignored.
+        """
+        ListLoader(self.ders)._compile_certlist(b"list 1")
+        with open("data/test_list.keys", "rb") as f:
+            compiled = cbor2.load(f)
+        other_pem = create_test_dsc("Other DSC")[0]
+        other_key = load_pem_hcert_dsc(other_pem).to_dict()
+        other_key[2] = compiled["keys"][0][2]
+        compiled["keys"][0] = other_key
+        with open("data/test_list.keys", "wb") as f:
+            cbor2.dump(compiled, f)
+
+        certs = ListLoader(self.ders)._compile_certlist(b"list 1")
+        self.assertEqual([cert.to_dict() for cert in certs],
+                         [load_der_hcert_dsc(der).to_dict()
+                          for der in self.ders])
+
+    def test_public_key_info(self):
+        """
+        Check that the SubjectPublicKeyInfo is found in EC and RSA
+        certificates.
+        """
+        rsa_key = rsa.generate_private_key(public_exponent=65537,
+                                           key_size=2048)
+        name = Name([NameAttribute(NameOID.COMMON_NAME, "RSA DSC")])
+        now = datetime.datetime.utcnow()
+        rsa_cert = (CertificateBuilder()
+                    .subject_name(name).issuer_name(name)
+                    .public_key(rsa_key.public_key())
+                    .serial_number(random_serial_number())
+                    .not_valid_before(now)
+                    .not_valid_after(now + datetime.timedelta(days=1))
+                    .sign(rsa_key, hashes.SHA256()))
+        certs = [load_pem_x509_certificate(pem.encode())
+                 for pem in self.pems] + [rsa_cert]
+        for cert in certs:
+            self.assertEqual(
+                der_public_key_info(cert.public_bytes(Encoding.DER)),
+                cert.public_key().public_bytes(
+                    Encoding.DER, PublicFormat.SubjectPublicKeyInfo))
+        with self.assertRaises(ValueError):
+            der_public_key_info(self.ders[0][:100])
+
+    def test_diff(self):
+        """
+        Check that only added certificates are parsed on an update and
+        that the changes are summarized.
+        """
+        loader = ListLoader(self.ders[:1])
+        first, = loader._compile_certlist(b"list 1")
+        self.assertEqual(loader.last_diff,
+                         {"added": 1, "removed": 0, "unchanged": 0})
+
+        loader._ders = self.ders
+        with mock.patch("cert_loaders.certificate_loader.load_der_hcert_dsc",
+                        wraps=load_der_hcert_dsc) as load:
+            certs = loader._compile_certlist(b"list 2")
+            load.assert_called_once_with(self.ders[1])
+        self.assertIs(certs[0], first)
+        self.assertEqual(loader.last_diff,
+                         {"added": 1, "removed": 0, "unchanged": 1})
+        self.assertTrue(loader._certs_changed())
+
+        loader._ders = self.ders[1:]
+        certs = loader._compile_certlist(b"list 3")
+        self.assertEqual(len(certs), 1)
+        self.assertEqual(loader.last_diff,
+                         {"added": 0, "removed": 1, "unchanged": 1})
+
+        loader._compile_certlist(b"list 3")
+        self.assertFalse(loader._certs_changed())
+
+
+class SignKeyTests(unittest.TestCase):
+
+    def setUp(self):
+        self._cwd = os.getcwd()
+        self._tmp = tempfile.TemporaryDirectory()
+        os.chdir(self._tmp.name)
+        os.mkdir("data")
+        self.key = key = ec.generate_private_key(ec.SECP256R1())
+        self.pubkey_pem = key.public_key().public_bytes(
+            Encoding.PEM, PublicFormat.SubjectPublicKeyInfo)
+        self.pubkey_sha256 = public_key_sha256(key.public_key())
+        with mock.patch.object(CertificateLoader_DE, "_build_certlist"):
+            self.loader = CertificateLoader_DE()
+
+    def tearDown(self):
+        os.chdir(self._cwd)
+        self._tmp.cleanup()
+
+    def _response(self):
+        response = mock.Mock(content=self.pubkey_pem)
+        response.raise_for_status.return_value = None
+        return response
+
+    def test_download_once(self):
+        """
+        Check that the key is downloaded once and reused afterwards.
+        """
+        with mock.patch("requests.get",
+                        return_value=self._response()) as get:
+            pubkey = self.loader._get_sign_key()
+            self.assertIs(self.loader._get_sign_key(), pubkey)
+            self.assertEqual(get.call_count, 1)
+        self.assertTrue(os.path.exists(
+            "data/" + self.loader._cert_sign_key_filename))
+
+        # a new loader reads the cached file instead of downloading
+        with mock.patch.object(CertificateLoader_DE, "_build_certlist"):
+            loader = CertificateLoader_DE()
+        with mock.patch("requests.get") as get:
+            loader._get_sign_key()
+            get.assert_not_called()
+
+    def test_expired_key_falls_back(self):
+        """
+        Check that an expired key is kept if it can't be refreshed.
+        """
+        with open("data/" + self.loader._cert_sign_key_filename, "wb") as f:
+            f.write(self.pubkey_pem)
+        self.loader._cert_sign_key_max_age = 0
+        with mock.patch("requests.get", side_effect=OSError) as get:
+            self.assertIsNotNone(self.loader._get_sign_key())
+            get.assert_called_once()
+
+    def test_pinned_hash(self):
+        """
+        Check that the cached and the downloaded key are only used if they
+        match the pinned hash.
+        """
+        other_pem = ec.generate_private_key(ec.SECP256R1()).public_key() \
+            .public_bytes(Encoding.PEM, PublicFormat.SubjectPublicKeyInfo)
+        with open("data/" + self.loader._cert_sign_key_filename, "wb") as f:
+            f.write(other_pem)
+        with mock.patch.dict(os.environ,
+                             {"DE_SIGN_KEY_SHA256": self.pubkey_sha256}), \
+                mock.patch.object(CertificateLoader_DE, "_build_certlist"):
+            loader = CertificateLoader_DE()
+
+        # the tampered cached key is replaced by the downloaded key
+        with mock.patch("requests.get",
+                        return_value=self._response()) as get:
+            pubkey = loader._get_sign_key()
+            get.assert_called_once()
+        self.assertEqual(public_key_sha256(pubkey), self.pubkey_sha256)
+
+        # a downloaded key that doesn't match is never used
+        loader._cert_sign_key_sha256 = public_key_sha256(
+            ec.generate_private_key(ec.SECP256R1()).public_key())
+        with mock.patch("requests.get", return_value=self._response()):
+            with self.assertRaises(InvalidSignature):
+                loader._get_sign_key(refresh=True)
+        with open("data/" + loader._cert_sign_key_filename, "rb") as f:
+            self.assertEqual(f.read(), self.pubkey_pem)
+
+    def test_refresh_async(self):
+        """
+        Check that a refresh fetches the key with the shared downloader
+        instead of blocking on requests.
+        """
+        dsc_der = load_pem_x509_certificate(
+            create_test_dsc()[0].encode()).public_bytes(Encoding.DER)
+        certs_str = json.dumps({"certificates": [
+            {"rawData": b64encode(dsc_der).decode()}]}).encode()
+        r, s = decode_dss_signature(
+            self.key.sign(certs_str, ec.ECDSA(hashes.SHA256())))
+        signature = r.to_bytes(32, "big") + s.to_bytes(32, "big")
+        files = {self.loader._cert_url:
+                 b64encode(signature) + b"\n" + certs_str,
+                 self.loader._cert_sign_key: self.pubkey_pem}
+        downloader = mock.Mock()
+        downloader.fetch = mock.AsyncMock(
+            side_effect=lambda url: (files[url], True))
+
+        with mock.patch("requests.get") as get:
+            self.assertTrue(asyncio.run(
+                self.loader.refresh_async(downloader)))
+            get.assert_not_called()
+        self.assertEqual(len(self.loader()), 1)
+        self.assertEqual(public_key_sha256(self.loader._sign_key),
+                         public_key_sha256(self.key.public_key()))
+
+    def test_pinned_key(self):
+        """
+        Check that a pinned key is never downloaded.
+        """
+        with open("pinned.pem", "wb") as f:
+            f.write(self.pubkey_pem)
+        self.loader._cert_sign_key_pinned = "pinned.pem"
+        with mock.patch("requests.get") as get:
+            self.assertIsNotNone(self.loader._get_sign_key())
+            get.assert_not_called()
+
+
+def sign_artifact(signing_key, artifact):
+    """
+    Creates a detached signature like the ones of the AT trust list.
+    """
+    payload = cbor2.dumps({2: hashlib.sha256(artifact).digest()})
+    return COSE.new(alg_auto_inclusion=True).encode_and_sign(
+        payload, signing_key)
+
+
+class SignedArtifactTests(unittest.TestCase):
+
+    def setUp(self):
+        self._cwd = os.getcwd()
+        self._tmp = tempfile.TemporaryDirectory()
+        os.chdir(self._tmp.name)
+        os.mkdir("data")
+        self.root_pem, self.root_key = create_test_dsc("Root")
+
+    def tearDown(self):
+        os.chdir(self._cwd)
+        self._tmp.cleanup()
+
+    def test_verify(self):
+        """
+        Check that the artifact hash and the signature are verified.
+        """
+        verifier = SignedArtifactVerifier(self.root_pem)
+        signature = sign_artifact(self.root_key, b"rules")
+        self.assertTrue(verifier.verify(b"rules", signature))
+        with self.assertRaises(InvalidSignature):
+            verifier.verify(b"other rules", signature)
+
+    def test_at_loader_from_files(self):
+        """
+        Check that the AT loader verifies the cached list, rules and
+        value sets.
+        """
+        dsc_pem = create_test_dsc()[0]
+        dsc_der = load_pem_x509_certificate(dsc_pem.encode()).public_bytes(
+            Encoding.DER)
+        trustlist = cbor2.dumps({"c": [{"i": b"kid", "c": dsc_der}]})
+        rules = cbor2.dumps({"r": []})
+        value_sets = cbor2.dumps({"v": [{"valueSetId": "disease-agent-targeted",
+                                         "valueSetValues": {"840539006": {}}}]})
+        for name, artifact in (("at_trustlist", trustlist),
+                               ("at_rules", rules),
+                               ("at_valuesets", value_sets)):
+            with open("data/" + name, "wb") as f:
+                f.write(artifact)
+            with open("data/" + name + ".sig", "wb") as f:
+                f.write(sign_artifact(self.root_key, artifact))
+
+        loader = CertificateLoader_AT(root_certificate=self.root_pem)
+        self.assertEqual(loader()[0].kid, load_pem_hcert_dsc(dsc_pem).kid)
+        self.assertEqual(loader.rules, {"r": []})
+        self.assertEqual(loader.rule_set.value_sets,
+                         {"disease-agent-targeted": ["840539006"]})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import random
+import unittest
+import zlib
+
+import base45
+
+from codec import (DecompressedTooLarge, InputTooLong, b45decode,
+                   check_length, zlib_decompress)
+from validator import DCCValidator
+
+
+class Base45Tests(unittest.TestCase):
+
+    def test_equivalence(self):
+        """
+        Check that the output is byte for byte the same as base45's.
+        """
+        rng = random.Random(45)
+        for length in range(0, 600, 7):
+            data = bytes(rng.randrange(256) for _ in range(length))
+            encoded = base45.b45encode(data)
+            self.assertEqual(b45decode(encoded), data)
+            self.assertEqual(b45decode(encoded), base45.b45decode(encoded))
+            self.assertEqual(b45decode(encoded.decode() + "\n"), data)
+            self.assertEqual(b45decode(memoryview(encoded)), data)
+
+    def test_invalid(self):
+        """
+        Check that everything base45 rejects is rejected with a ValueError.
+        """
+        cases = [
+            b"A",            # a single character
+            b"GGW",          # a triple above 0xFFFF
+            b"::",           # a pair above 0xFF
+            b"aa",           # lower case
+            b"AB\n",         # newlines are only stripped from strings
+            "ABä",      # not ASCII
+            b"\xff\xffA",
+        ]
+        rng = random.Random(9285)
+        alphabet = base45.BASE45_CHARSET.encode() + b"abc#\n\x00\x80"
+        cases += [bytes(rng.choice(alphabet) for _ in range(rng.randrange(8)))
+                  for _ in range(2000)]
+        for case in cases:
+            try:
+                expected = base45.b45decode(case)
+            except ValueError:
+                with self.assertRaises(ValueError, msg=repr(case)):
+                    b45decode(case)
+            else:
+                self.assertEqual(b45decode(case), expected, repr(case))
+
+    def test_fallback(self):
+        """
+        Check that other types are handled by the base45 package.
+        """
+        with self.assertRaises(TypeError):
+            b45decode(45)
+
+
+class LimitTests(unittest.TestCase):
+
+    def test_zlib_decompress(self):
+        """
+        Check that the output is the same as zlib.decompress's.
+        """
+        data = b"DCC" * 1000
+        self.assertEqual(zlib_decompress(zlib.compress(data)), data)
+        self.assertEqual(zlib_decompress(zlib.compress(data), len(data)), data)
+        with self.assertRaises(zlib.error):
+            zlib_decompress(zlib.compress(data)[:-5])
+        with self.assertRaises(zlib.error):
+            zlib_decompress(b"xnot zlib")
+
+    def test_compression_bomb(self):
+        """
+        Check that a compression bomb is stopped at the limit.
+        """
+        bomb = zlib.compress(bytes(64 * 1024 * 1024), 9)
+        with self.assertRaises(DecompressedTooLarge) as context:
+            zlib_decompress(bomb, 1024)
+        self.assertEqual(context.exception.code, "decompressed_too_large")
+
+    def test_validator_limits(self):
+        """
+        Check that the validator rejects oversized DCCs with their code.
+        """
+        validator = DCCValidator("XX", certs=[], auto_update=False)
+        bomb = "HC1:" + base45.b45encode(
+            zlib.compress(bytes(2 * 1024 * 1024), 9)).decode()
+        with self.assertRaises(DecompressedTooLarge):
+            validator.validate(bomb)
+        with self.assertRaises(InputTooLong):
+            validator.validate("HC1:" + "A" * 9000)
+        with self.assertRaises(InputTooLong):
+            check_length("A" * 11, 10)
+
+        results = validator.validate_batch(["HC1:" + "A" * 9000])
+        self.assertEqual(results[0][0], False)
+        self.assertIn("longer than", results[0][2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,16 @@
+import datetime
 import glob
 import json
 import os
+import zlib
+
+import cbor2
+from base45 import b45encode
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+from cwt import COSE, COSEKey, load_pem_hcert_dsc
 
 
 def load_fixtures(test_case):
@@ -12,3 +22,57 @@ def load_fixtures(test_case):
             tests.append((filename, json.load(f)))
 
     return tests
+
+
+def create_test_dsc(common_name="OCCV Test DSC"):
+    """
+    Creates a self-signed EC P-256 document signing certificate.
+    Returns:
+        cert_pem: The PEM encoded certificate.
+        signing_key: A COSE key that signs DCCs for the certificate.
+    """
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, common_name)])
+    now = datetime.datetime.utcnow()
+    cert = (x509.CertificateBuilder()
+            .subject_name(name)
+            .issuer_name(name)
+            .public_key(key.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(now - datetime.timedelta(days=1))
+            .not_valid_after(now + datetime.timedelta(days=365))
+            .sign(key, hashes.SHA256()))
+    cert_pem = cert.public_bytes(serialization.Encoding.PEM).decode()
+    key_pem = key.private_bytes(serialization.Encoding.PEM,
+                                serialization.PrivateFormat.PKCS8,
+                                serialization.NoEncryption())
+    kid = load_pem_hcert_dsc(cert_pem).kid
+    signing_key = COSEKey.from_pem(key_pem, alg="ES256", kid=kid)
+    return cert_pem, signing_key
+
+
+def create_test_dcc(signing_key, claims=None):
+    """
+    Signs the claims with the key and encodes them like a DCC QR code.
+    The claims can also be given CBOR encoded, to sign malformed ones.
+    Returns:
+        dcc: The HC1: prefixed DCC string.
+    """
+    if claims is None:
+        now = int(datetime.datetime.now().timestamp())
+        claims = {1: "DE", 4: now + 86400, 6: now, -260: {1: {
+            "ver": "1.3.0",
+            "nam": {"fn": "Mustermann", "fnt": "MUSTERMANN",
+                    "gn": "Erika", "gnt": "ERIKA"},
+            "dob": "1964-08-12",
+            "v": [{"tg": "840539006", "vp": "1119349007",
+                   "mp": "EU/1/20/1507", "ma": "ORG-100031184",
+                   "dn": 2, "sd": 2, "dt": "2021-05-29", "co": "DE",
+                   "is": "Robert Koch-Institut",
+                   "ci": "URN:UVCI:01DE/IZ12345A/5CWLU12RNOB9RXSEOP6FG8#W"}]
+        }}}
+    ctx = COSE.new(alg_auto_inclusion=True, kid_auto_inclusion=True)
+    if not isinstance(claims, bytes):
+        claims = cbor2.dumps(claims)
+    message = ctx.encode_and_sign(claims, signing_key)
+    return "HC1:" + b45encode(zlib.compress(message)).decode()
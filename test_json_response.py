@@ -0,0 +1,86 @@
+import asyncio
+import json
+import unittest
+from unittest import mock
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+import json_response
+from occv import DCCBatchData, DCCData
+
+CLAIMS = {
+    1: "AT",
+    4: 1635876000,
+    6: 1620324000,
+    7: b"cti",
+    -260: {1: {
+        "v": [{"dn": 1, "ma": "ORG-100030215", "co": "AT",
+               "ci": "URN:UVCI:01:AT:10807843F94AEE0EE5093FBC254BD813#B"}],
+        "nam": {"fnt": "MUSTERFRAU<GOESSINGER", "fn": "Musterfrau-Gößinger",
+                "gnt": "GABRIELE", "gn": "Gabriele"},
+        "ver": "1.0.0",
+        "dob": "1998-02-26",
+    }},
+}
+
+
+def fastapi_render(model, content):
+    """
+    Encodes content like FastAPI does for a route with a response model,
+    unset fields like the rules are left out.
+    """
+    field = create_response_field(name="Response", type_=model)
+    content = asyncio.run(serialize_response(
+        field=field, response_content=content, exclude_unset=True))
+    return JSONResponse(content).body
+
+
+class FastJSONResponseTests(unittest.TestCase):
+
+    def check_same(self, model, content):
+        expected = fastapi_render(model, content)
+        self.assertEqual(json_response.FastJSONResponse(content).body,
+                         expected)
+        with mock.patch.object(json_response, "orjson", None):
+            self.assertEqual(json_response.FastJSONResponse(content).body,
+                             expected)
+
+    def test_wire_format(self):
+        """
+        Check that the results are encoded byte for byte like FastAPI
+        encodes them, with and without orjson.
+        """
+        self.check_same(DCCData, {"valid": True, "dccdata": CLAIMS})
+        self.check_same(DCCData, {"valid": False, "dccdata": None})
+        self.check_same(DCCData, {"valid": False, "dccdata": {}})
+        self.check_same(DCCData, {"valid": True, "dccdata": CLAIMS, "rules": [
+            {"identifier": "VR-AT-0000", "type": "Acceptance",
+             "description": None, "result": "passed"}]})
+        self.check_same(DCCBatchData, {"results": [
+            {"valid": True, "dccdata": CLAIMS, "error": None},
+            {"valid": False, "dccdata": None, "error": "Too long."},
+        ]})
+
+    def test_orjson_fallback(self):
+        """
+        Check that claims orjson can't encode are encoded like FastAPI
+        encodes them instead of failing.
+        """
+        self.check_same(DCCData, {"valid": False, "dccdata": {4: 2 ** 70}})
+        self.check_same(DCCData, {"valid": False, "dccdata": {b"a": 1}})
+        self.check_same(DCCBatchData, {"results": [
+            {"valid": True, "dccdata": CLAIMS, "error": None},
+            {"valid": False, "dccdata": {4: 2 ** 70, b"a": 1},
+             "error": None},
+        ]})
+
+    def test_keys(self):
+        data = json.loads(json_response.dumps({"dccdata": CLAIMS}))
+        self.assertEqual(list(data["dccdata"]), ["1", "4", "6", "7", "-260"])
+        self.assertEqual(data["dccdata"]["7"], "cti")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+
+from metrics import REGISTRY, Counter, Histogram
+
+
+class MetricsTests(unittest.TestCase):
+
+    def tearDown(self):
+        del REGISTRY[-1]
+
+    def test_counter(self):
+        counter = Counter("test_total", "A test counter.", ["result"])
+        counter.inc(result="valid")
+        counter.inc(2, result="valid")
+        self.assertEqual(counter.value(result="valid"), 3)
+        self.assertIn('test_total{result="valid"} 3', counter.render())
+
+    def test_histogram(self):
+        """
+        Check that the buckets are cumulative.
+        """
+        histogram = Histogram("test_seconds", "A test histogram.",
+                              buckets=(0.1, 1.0))
+        histogram.observe(0.05)
+        histogram.observe(0.5)
+        histogram.observe(5)
+        lines = histogram.render().split("\n")
+        self.assertIn('test_seconds_bucket{le="0.1"} 1', lines)
+        self.assertIn('test_seconds_bucket{le="1.0"} 2', lines)
+        self.assertIn('test_seconds_bucket{le="+Inf"} 3', lines)
+        self.assertIn('test_seconds_count 3', lines)
+        self.assertEqual(histogram.count(), 3)
+
+    def test_histogram_quantile(self):
+        """
+        Check that quantiles are interpolated inside of their bucket.
+        """
+        histogram = Histogram("test_seconds", "A test histogram.",
+                              buckets=(1.0, 2.0, 4.0))
+        self.assertIsNone(histogram.quantile(0.5))
+        for value in (0.5, 1.5, 1.5, 3.0):
+            histogram.observe(value)
+        self.assertEqual(histogram.quantile(0.25), 1.0)
+        self.assertEqual(histogram.quantile(0.5), 1.5)
+        self.assertEqual(histogram.quantile(1.0), 4.0)
+        self.assertEqual(histogram.sum(), 6.5)
+        histogram.clear()
+        self.assertEqual(histogram.count(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,7 +2,10 @@ import json
 
 from fastapi.testclient import TestClient
 
+import occv
+from cert_loaders.certificate_loader import CertificateLoader
 from occv import app
+from test_helper import create_test_dcc, create_test_dsc
 
 DEV_MODE = True
 
@@ -78,3 +81,191 @@ def test_validate_dcc_none():
                            json=None
                            )
     assert response.status_code == 422
+
+
+def test_validate_dcc_batch():
+    response = client.post("/batch/",
+                           json={"dccs": [test_dcc, "HC1:FFFFFFFF", test_dcc]}
+                           )
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert len(results) == 3
+    assert results[0] == results[2]
+    assert results[0]["dccdata"] == test_response["dccdata"]
+    assert results[1]["valid"] is False
+
+
+def test_validate_dcc_batch_empty():
+    response = client.post("/batch/",
+                           json={"dccs": []}
+                           )
+    assert response.status_code == 422
+
+
+def test_status():
+    response = client.get("/status/")
+    assert response.status_code == 200
+    assert response.json()["generation"] == 0
+    assert response.json()["certificates"] == 1
+    assert response.json()["last_refreshed"] >= response.json()["loaded_at"]
+
+
+def test_metrics():
+    client.post("/", json={"dcc": test_dcc})
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert 'occv_validations_total{result="invalid"}' in response.text
+    assert 'occv_validation_stage_seconds_count{stage="verify"}' \
+        in response.text
+    assert "# TYPE occv_trust_list_size gauge" in response.text
+
+
+def test_validate_dcc_unknown_source():
+    response = client.post("/",
+                           json={"dcc": test_dcc, "source": "FR"}
+                           )
+    assert response.status_code == 422
+
+
+def test_validate_dcc_stream():
+    body = "\n".join([test_dcc, "", "HC1:FFFFFFFF", test_dcc]) + "\n"
+    response = client.post("/stream/", content=body)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    results = sorted((json.loads(line) for line in response.text.splitlines()),
+                     key=lambda result: result["line"])
+    assert [result["line"] for result in results] == [1, 3, 4]
+    assert results[0]["dccdata"] == test_response["dccdata"]
+    assert results[1]["valid"] is False
+
+
+def test_validate_dcc_stream_too_long():
+    body = test_dcc + "\n" + "A" * 100000
+    response = client.post("/stream/", content=body)
+    assert response.status_code == 200
+    results = sorted((json.loads(line) for line in response.text.splitlines()),
+                     key=lambda result: result["line"])
+    assert [result["line"] for result in results] == [1, 2]
+    assert results[1]["error"] == "The DCC is longer than 8192 characters."
+
+
+def test_validate_dcc_stream_unknown_source():
+    response = client.post("/stream/?source=FR", content=test_dcc)
+    assert response.status_code == 422
+
+
+def test_validate_dcc_too_long():
+    response = client.post("/",
+                           json={"dcc": "HC1:" + "A" * 100000}
+                           )
+    assert response.status_code == 413
+    assert response.headers["x-error-code"] == "input_too_long"
+
+
+def test_read_static():
+    response = client.get("/static/bundle.js")
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+    response = client.get("/bundle.js", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert client.get("/static/missing.js").status_code == 404
+    assert client.get("/some/route").text == client.get("/").text
+
+
+def test_validate_dcc_rules():
+    response = client.post("/",
+                           json={"dcc": test_dcc, "rules": True}
+                           )
+    assert response.status_code == 200
+    # the test trust list comes without business rules
+    assert response.json()["rules"] is None
+    assert response.json()["dccdata"] == test_response["dccdata"]
+    assert "rules" not in client.post("/", json={"dcc": test_dcc}).json()
+
+
+def test_validate_dcc_rules_invalid():
+    loader = CertificateLoader()
+    loader._set_rules({"r": [{"Identifier": "GR-AT-0000", "Type": "Acceptance",
+                              "Logic": True}]})
+    loaders = occv.validator._cert_loaders
+    occv.validator._cert_loaders = {"XX": loader}
+    try:
+        assert occv.validator.get_rule_set() is not None
+        response = client.post("/", json={"dcc": test_dcc, "rules": True})
+        assert response.status_code == 200
+        # the test DCC expired, so no rule is evaluated
+        assert response.json()["valid"] is False
+        assert response.json()["rules"] is None
+    finally:
+        occv.validator._cert_loaders = loaders
+
+
+def test_business_rules():
+    response = client.get("/business_rules/")
+    assert response.status_code == 200
+    assert response.json() is None
+    etag = response.headers["etag"]
+    response = client.get("/business_rules/",
+                          headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+
+
+def test_business_rules_reload():
+    loader = CertificateLoader()
+    loader._set_rules({"r": [{"Identifier": "GR-AT-0000",
+                              "Logic": True}] * 100})
+    loaders = occv.validator._cert_loaders
+    occv.validator._cert_loaders = {"XX": loader}
+    try:
+        response = client.get("/business_rules/",
+                              headers={"Accept-Encoding": "gzip"})
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.json() == loader.rules
+        etag = response.headers["etag"]
+
+        loader._set_rules({"r": []})
+        response = client.get("/business_rules/",
+                              headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.json() == {"r": []}
+        assert response.headers["etag"] != etag
+    finally:
+        occv.validator._cert_loaders = loaders
+
+
+def test_validate_dcc_minimal():
+    response = client.post("/",
+                           json={"dcc": test_dcc, "minimal": True}
+                           )
+    assert response.status_code == 200
+    assert response.json() == {
+        "valid": False,
+        "reason": "expired",
+        "exp": test_response["dccdata"]["4"],
+        "type": "vaccination",
+    }
+    response = client.post("/",
+                           json={"dcc": "HC1:", "minimal": True}
+                           )
+    assert response.json()["reason"] == "undecodable"
+
+
+def test_validate_dcc_unencodable_claims():
+    signing_key = create_test_dsc()[1]
+    hcert = {1: {"ver": "1.3.0", "v": [{"dn": 1}]}}
+    wide = create_test_dcc(signing_key, {4: 2 ** 70, -260: hcert})
+    bytes_key = create_test_dcc(signing_key, {b"a": 1, -260: hcert})
+    for dcc in (wide, bytes_key):
+        response = client.post("/", json={"dcc": dcc})
+        assert response.status_code == 200
+        assert response.json()["valid"] is False
+    assert client.post("/", json={"dcc": wide}).json()["dccdata"]["4"] \
+        == 2 ** 70
+    response = client.post("/", json={"dcc": wide, "minimal": True})
+    assert response.json()["exp"] == 2 ** 70
+    response = client.post("/batch/", json={"dccs": [wide, bytes_key,
+                                                      test_dcc]})
+    assert response.status_code == 200
+    assert [result["error"] for result in response.json()["results"]] \
+        == [None, None, None]
@@ -0,0 +1,166 @@
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cbor2
+from cryptography.hazmat.primitives.serialization import Encoding
+from cryptography.x509 import load_pem_x509_certificate
+
+from cert_loaders.at import CertificateLoader_AT
+from refresh_scheduler import RefreshScheduler
+from test_certificate_loader import sign_artifact
+from test_helper import create_test_dcc, create_test_dsc
+from validator import DCCValidator
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    Serves the files of the server with an ETag and answers conditional
+    requests with 304 Not Modified.
+    """
+
+    def do_GET(self):
+        content = self.server.files.get(self.path)
+        if content is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+        etag = '"%x"' % hash(content)
+        if self.headers.get("If-None-Match") == etag:
+            self.server.statuses.append(304)
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.server.statuses.append(200)
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def trustlist(dsc_pem):
+    dsc_der = load_pem_x509_certificate(dsc_pem.encode()).public_bytes(
+        Encoding.DER)
+    return cbor2.dumps({"c": [{"i": b"kid", "c": dsc_der}]})
+
+
+class RefreshSchedulerTests(unittest.TestCase):
+
+    def setUp(self):
+        self._cwd = os.getcwd()
+        self._tmp = tempfile.TemporaryDirectory()
+        os.chdir(self._tmp.name)
+        os.mkdir("data")
+        self.root_pem, self.root_key = create_test_dsc("Root")
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+        self.server.files = {}
+        self.server.statuses = []
+        threading.Thread(target=self.server.serve_forever,
+                         daemon=True).start()
+        self.url = "http://127.0.0.1:%i" % self.server.server_port
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        os.chdir(self._cwd)
+        self._tmp.cleanup()
+
+    def _publish(self, certs, rules, value_sets=None):
+        if value_sets is None:
+            value_sets = cbor2.dumps({"v": []})
+        self.server.files = {
+            "/trustlist": certs,
+            "/trustlistsig": sign_artifact(self.root_key, certs),
+            "/rules": rules,
+            "/rulessig": sign_artifact(self.root_key, rules),
+            "/valuesets": value_sets,
+            "/valuesetssig": sign_artifact(self.root_key, value_sets),
+        }
+
+    def test_refresh(self):
+        """
+        Check that a changed list is downloaded and published and that an
+        unchanged list is answered with 304 Not Modified.
+        """
+        old_pem = create_test_dsc("Old")[0]
+        new_pem, new_key = create_test_dsc("New")
+        self._publish(trustlist(old_pem), cbor2.dumps({"r": []}))
+        loader = CertificateLoader_AT(url=self.url,
+                                      root_certificate=self.root_pem)
+        self.assertEqual(self.server.statuses, [200] * 6)
+        self.assertEqual(loader.rule_set.value_sets, {})
+
+        validator = DCCValidator(country="AT", certs=[], auto_update=False)
+        validator._cert_loaders = {"AT": loader}
+        dcc = create_test_dcc(new_key)
+        self.assertFalse(validator.validate(dcc)[0])
+
+        value_set = {"valueSetId": "country-2-codes",
+                     "valueSetValues": {"AT": {}, "DE": {}}}
+        value_sets = cbor2.dumps(
+            {"v": [{"i": "country-2-codes", "v": json.dumps(value_set)}]})
+        self._publish(trustlist(new_pem), cbor2.dumps({"r": [1]}), value_sets)
+        self.server.statuses.clear()
+
+        async def refresh_twice():
+            scheduler = RefreshScheduler(validator, interval=3600,
+                                         timeout=5)
+            await scheduler.start()
+            try:
+                first = await scheduler.refresh()
+                loaded_at = validator._trust_store.loaded_at
+                validator._refreshed_at["AT"] = 0
+                return first, await scheduler.refresh(), loaded_at
+            finally:
+                await scheduler.stop()
+
+        first, second, loaded_at = asyncio.run(refresh_twice())
+        self.assertTrue(first)
+        self.assertFalse(second)
+        self.assertEqual(self.server.statuses, [200] * 6 + [304] * 6)
+        self.assertTrue(validator.validate(dcc)[0])
+        self.assertEqual(validator.get_status()["generation"], 1)
+        self.assertEqual(loader.rules, {"r": [1]})
+        self.assertEqual(loader.rule_set.value_sets,
+                         {"country-2-codes": ["AT", "DE"]})
+        # the unchanged list counts as refreshed, the trust store is kept
+        self.assertEqual(validator._trust_store.loaded_at, loaded_at)
+        self.assertGreaterEqual(validator.get_last_refreshed(), loaded_at)
+
+    def test_refresh_rejects_bad_signature(self):
+        """
+        Check that a list with an invalid signature is not published.
+        """
+        self._publish(trustlist(create_test_dsc()[0]), cbor2.dumps({}))
+        loader = CertificateLoader_AT(url=self.url,
+                                      root_certificate=self.root_pem)
+        validator = DCCValidator(country="AT", certs=[], auto_update=False)
+        validator._cert_loaders = {"AT": loader}
+
+        self.server.files["/trustlist"] = trustlist(create_test_dsc()[0])
+
+        async def refresh():
+            scheduler = RefreshScheduler(validator, timeout=5)
+            await scheduler.start()
+            try:
+                return await scheduler.refresh()
+            finally:
+                await scheduler.stop()
+
+        validator._refreshed_at["AT"] = 0
+        self.assertFalse(asyncio.run(refresh()))
+        self.assertEqual(validator.get_status()["generation"], 0)
+        self.assertEqual(validator.get_last_refreshed(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
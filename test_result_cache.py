@@ -0,0 +1,109 @@
+import unittest
+
+from cwt import load_pem_hcert_dsc
+from freezegun import freeze_time
+
+from result_cache import ResultCache, estimate_size
+from test_helper import create_test_dcc, create_test_dsc
+from validator import DCCValidator
+
+
+class ResultCacheTests(unittest.TestCase):
+
+    def test_lru(self):
+        """
+        Check that the least recently used entry is dropped first.
+        """
+        cache = ResultCache(max_entries=2)
+        cache.put("a", [True, {}])
+        cache.put("b", [True, {}])
+        cache.get("a")
+        cache.put("c", [True, {}])
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.stats()["hits"], 2)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_memory_cap(self):
+        """
+        Check that the estimated size of the entries stays below the cap.
+        """
+        cache = ResultCache(max_entries=100, max_bytes=2000)
+        for i in range(10):
+            cache.put(i, [True, {"data": "x" * 500}])
+        self.assertLessEqual(cache.stats()["bytes"], 2000)
+        self.assertLess(len(cache), 10)
+
+    def test_expiry(self):
+        """
+        Check that entries expire with the TTL or their own expiry.
+        """
+        cache = ResultCache(ttl=60)
+        with freeze_time("2021-08-01 12:00:00") as frozen_time:
+            now = frozen_time().timestamp()
+            cache.put("ttl", [True, {}])
+            cache.put("exp", [True, {}], expires=now + 10)
+            frozen_time.tick(30)
+            self.assertIsNone(cache.get("exp"))
+            self.assertIsNotNone(cache.get("ttl"))
+            frozen_time.tick(31)
+            self.assertIsNone(cache.get("ttl"))
+
+    def test_validator_cache(self):
+        """
+        Check that the validator caches results until the certificates
+        are refreshed.
+        """
+        cert_pem, signing_key = create_test_dsc()
+        dcc_validator = DCCValidator(
+            "XX", certs=[load_pem_hcert_dsc(cert_pem)], cache_size=16)
+        dcc = create_test_dcc(signing_key)
+        first = dcc_validator.validate(dcc)
+        self.assertIs(dcc_validator.validate(dcc), first)
+        self.assertTrue(first[0])
+        self.assertEqual(dcc_validator.get_status()["result_cache"]["hits"], 1)
+
+        # a new trust store generation doesn't see the old results
+        dcc_validator._trust_store = dcc_validator._trust_store.next({})
+        self.assertFalse(dcc_validator.validate(dcc)[0])
+
+    def test_not_yet_valid(self):
+        """
+        Check that a not yet valid result is only cached until the DCC
+        becomes valid.
+        """
+        cert_pem, signing_key = create_test_dsc()
+        with freeze_time("2021-08-01 12:00:00") as frozen_time:
+            now = int(frozen_time().timestamp())
+            dcc_validator = DCCValidator(
+                "XX", certs=[load_pem_hcert_dsc(cert_pem)], cache_size=16,
+                auto_update=False)
+            dcc = create_test_dcc(signing_key, {
+                1: "DE", 4: now + 86400, 5: now + 120, 6: now,
+                -260: {1: {"ver": "1.3.0"}}})
+            self.assertEqual(dcc_validator.validate(dcc).reason,
+                             "not_yet_valid")
+            frozen_time.tick(61)
+            self.assertTrue(dcc_validator.validate(dcc)[0])
+
+    def test_validation_result_size(self):
+        """
+        Check that a cached ValidationResult is accounted with its
+        decoded claims and doesn't grow while it's cached.
+        """
+        cert_pem, signing_key = create_test_dsc()
+        dcc_validator = DCCValidator(
+            "XX", certs=[load_pem_hcert_dsc(cert_pem)], cache_size=16)
+        result = dcc_validator.validate(create_test_dcc(signing_key))
+        cache = dcc_validator._result_cache
+        size = cache.stats()["bytes"]
+        self.assertIsNotNone(result._dcc_data)
+        self.assertGreater(size, estimate_size(result.dcc_data))
+        self.assertEqual(estimate_size(result), size)
+
+        result.subject, result.vaccinations, result.certificate_type
+        self.assertEqual(estimate_size(result), size)
+
+
+if __name__ == '__main__':
+    unittest.main()
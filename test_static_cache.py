@@ -0,0 +1,91 @@
+import gzip
+import os
+import tempfile
+import unittest
+
+from static_cache import IMMUTABLE, REVALIDATE, StaticCache
+
+
+class StaticCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.files = {
+            "index.html": b"<html>" + b"index " * 100 + b"</html>",
+            "bundle.js": b"console.log('bundle');" * 100,
+            "bundle.0123abcd.js": b"console.log('hashed');" * 100,
+            "icon.png": b"\x89PNG" + bytes(100),
+        }
+        for name, body in self.files.items():
+            with open(os.path.join(self._tmp.name, name), "wb") as f:
+                f.write(body)
+        self.cache = StaticCache(self._tmp.name)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_response(self):
+        """
+        Check that files are served from memory with their headers.
+        """
+        response = self.cache.response("bundle.js", {})
+        self.assertEqual(response.body, self.files["bundle.js"])
+        self.assertEqual(response.headers["cache-control"], REVALIDATE)
+        self.assertIn("etag", response.headers)
+        self.assertIn("last-modified", response.headers)
+        self.assertNotIn("content-encoding", response.headers)
+
+        response = self.cache.response("bundle.0123abcd.js", {})
+        self.assertEqual(response.headers["cache-control"], IMMUTABLE)
+
+    def test_fallback(self):
+        """
+        Check that unknown paths get the index, unless the fallback is off.
+        """
+        response = self.cache.response("unknown/path", {})
+        self.assertEqual(response.body, self.files["index.html"])
+        response = self.cache.response("unknown.js", {}, fallback=False)
+        self.assertEqual(response.status_code, 404)
+
+    def test_gzip(self):
+        """
+        Check that text is compressed if the client accepts it.
+        """
+        response = self.cache.response(
+            "bundle.js", {"accept-encoding": "deflate, gzip;q=0.8"})
+        self.assertEqual(response.headers["content-encoding"], "gzip")
+        self.assertEqual(gzip.decompress(response.body),
+                         self.files["bundle.js"])
+        self.assertEqual(response.headers["vary"], "Accept-Encoding")
+
+        response = self.cache.response(
+            "bundle.js", {"accept-encoding": "gzip;q=0"})
+        self.assertNotIn("content-encoding", response.headers)
+
+        response = self.cache.response(
+            "icon.png", {"accept-encoding": "gzip"})
+        self.assertNotIn("content-encoding", response.headers)
+
+    def test_not_modified(self):
+        """
+        Check that a client with the current file gets 304.
+        """
+        response = self.cache.response("bundle.js", {})
+        etag = response.headers["etag"]
+        response = self.cache.response("bundle.js", {"if-none-match": etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.body, b"")
+
+        response = self.cache.response(
+            "bundle.js", {"if-none-match": '"other"'})
+        self.assertEqual(response.status_code, 200)
+
+        last_modified = self.cache.response("bundle.js", {}).headers[
+            "last-modified"]
+        response = self.cache.response(
+            "bundle.js", {"if-modified-since": last_modified})
+        self.assertEqual(response.status_code, 304)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import asyncio
+import json
+import unittest
+
+from codec import InputTooLong
+from stream_validation import dump_result, read_lines, validate_lines
+
+
+async def iterate(chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+async def collect(items):
+    return [item async for item in items]
+
+
+def lines_of(chunks, max_length=10):
+    return asyncio.run(collect(read_lines(iterate(chunks), max_length)))
+
+
+class ReadLinesTests(unittest.TestCase):
+
+    def test_split(self):
+        """
+        Check that lines are split like bytes.split across chunks.
+        """
+        chunks = [b"HC1:A", b"B\nC", b"D\n\nE", b"", b"F"]
+        self.assertEqual(lines_of(chunks), [b"HC1:AB", b"CD", b"", b"EF"])
+        self.assertEqual(lines_of([b"A\n"]), [b"A"])
+        self.assertEqual(lines_of([]), [])
+
+    def test_too_long(self):
+        """
+        Check that a line longer than the limit and the prefix is
+        rejected and dropped up to the next newline.
+        """
+        lines = lines_of([b"HC1:" + b"A" * 10 + b"\n", b"A" * 8, b"A" * 8,
+                          b"A\nB\n"])
+        self.assertEqual(lines[0], b"HC1:" + b"A" * 10)
+        self.assertIsInstance(lines[1], InputTooLong)
+        self.assertEqual(lines[2], b"B")
+        self.assertEqual(len(lines), 3)
+
+    def test_too_long_without_newline(self):
+        """
+        Check that an endless line without a newline is not buffered.
+        """
+        async def endless():
+            for _ in range(1000):
+                yield b"A" * 64 * 1024
+
+        lines = asyncio.run(collect(read_lines(endless(), 8192)))
+        self.assertEqual(len(lines), 1)
+        self.assertIsInstance(lines[0], InputTooLong)
+
+    def test_error_result(self):
+        """
+        Check that a rejected line gets an error result with its number.
+        """
+        async def validate(dcc):
+            return False, None
+
+        lines = read_lines(iterate([b"A" * 20 + b"\nB\n"]), 10)
+        results = asyncio.run(collect(validate_lines(lines, validate, 2)))
+        results.sort(key=lambda result: result["line"])
+        self.assertEqual(results[0], {
+            "line": 1, "valid": False, "dccdata": None,
+            "error": "The DCC is longer than 10 characters."})
+        self.assertEqual(results[1]["error"], None)
+
+
+class DumpResultTests(unittest.TestCase):
+
+    def test_dump_result(self):
+        """
+        Check that a result is encoded like the other responses, claims
+        orjson can't encode included.
+        """
+        result = {"line": 1, "valid": True, "error": None,
+                  "dccdata": {7: b"cti", 4: 2 ** 70, b"k": 1}}
+        line = dump_result(result)
+        self.assertTrue(line.endswith(b"\n"))
+        self.assertEqual(json.loads(line)["dccdata"],
+                         {"7": "cti", "4": 2 ** 70, "k": 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
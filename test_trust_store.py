@@ -0,0 +1,122 @@
+import pickle
+import unittest
+
+from cwt import load_pem_hcert_dsc
+
+from cert_loaders.trust_store import TrustStore
+from test_helper import create_test_dcc, create_test_dsc
+from validator import DCCValidator
+
+
+class TrustStoreTests(unittest.TestCase):
+
+    def setUp(self):
+        self.certs = []
+        self.signing_keys = []
+        for i in range(3):
+            cert_pem, signing_key = create_test_dsc("DSC %i" % i)
+            self.certs.append(load_pem_hcert_dsc(cert_pem))
+            self.signing_keys.append(signing_key)
+
+    def test_find_by_kid(self):
+        """
+        Check that a kid only returns the matching key.
+        """
+        trust_store = TrustStore(self.certs)
+        self.assertEqual(len(trust_store), 3)
+        for cert in self.certs:
+            self.assertEqual(trust_store.find(cert.kid), [cert])
+
+    def test_find_unknown_kid(self):
+        """
+        Check that an unknown kid returns no keys and a missing kid all keys.
+        """
+        trust_store = TrustStore(self.certs)
+        self.assertEqual(trust_store.find(b"\x00" * 8), [])
+        self.assertEqual(trust_store.find(None), self.certs)
+
+    def test_pickle(self):
+        """
+        Check that a trust store can be sent to a worker process.
+        """
+        trust_store = TrustStore.merge({"DE": self.certs[:2],
+                                        "AT": self.certs[1:]}, generation=3)
+        copy = pickle.loads(pickle.dumps(trust_store))
+        self.assertEqual(copy.generation, 3)
+        self.assertEqual(copy.loaded_at, trust_store.loaded_at)
+        self.assertEqual(copy.count_by_source(), {"DE": 2, "AT": 2})
+        self.assertEqual([cert.to_dict() for cert in copy.find(
+            self.certs[2].kid, "AT")], [self.certs[2].to_dict()])
+
+    def test_validate_with_index(self):
+        """
+        Check that the validator picks the signer from the index.
+        """
+        dcc_validator = DCCValidator("XX", certs=self.certs)
+        for signing_key in self.signing_keys:
+            valid, content = dcc_validator.validate(
+                create_test_dcc(signing_key))
+            self.assertTrue(valid)
+            self.assertEqual(content[1], "DE")
+
+    def test_validate_unknown_signer(self):
+        """
+        Check that a DCC signed by an unknown DSC is invalid.
+        """
+        dcc_validator = DCCValidator("XX", certs=self.certs[1:])
+        valid, content = dcc_validator.validate(
+            create_test_dcc(self.signing_keys[0]))
+        self.assertFalse(valid)
+        self.assertEqual(content[1], "DE")
+
+    def test_update_certs_swaps_snapshot(self):
+        """
+        Check that a refresh publishes a new snapshot and leaves the old
+        one untouched.
+        """
+        dcc_validator = DCCValidator("XX")
+        old_trust_store = dcc_validator._trust_store
+        old_certs = list(old_trust_store)
+        dcc_validator.update_certs()
+        new_trust_store = dcc_validator._trust_store
+        self.assertIsNot(new_trust_store, old_trust_store)
+        self.assertEqual(list(old_trust_store), old_certs)
+        self.assertEqual(len(new_trust_store), len(old_trust_store))
+        self.assertEqual(new_trust_store.generation,
+                         old_trust_store.generation + 1)
+        status = dcc_validator.get_status()
+        self.assertEqual(status["generation"], 1)
+        self.assertEqual(status["certificates"], 1)
+
+    def test_merge_sources(self):
+        """
+        Check that keys of several loaders are merged and de-duplicated.
+        """
+        trust_store = TrustStore.merge({
+            "DE": self.certs[:2],
+            "AT": self.certs[1:],
+        })
+        self.assertEqual(len(trust_store), 3)
+        self.assertEqual(trust_store.sources(self.certs[1].kid), {"DE", "AT"})
+        self.assertEqual(trust_store.count_by_source(), {"DE": 2, "AT": 2})
+        self.assertEqual(trust_store.find(self.certs[0].kid, "AT"), [])
+        self.assertEqual(trust_store.find(self.certs[0].kid, "DE"),
+                         [self.certs[0]])
+        self.assertEqual(trust_store.find(None, "AT"), self.certs[1:])
+
+    def test_validate_with_source(self):
+        """
+        Check that a DCC only validates against its own trust list when
+        a source is given.
+        """
+        dcc_validator = DCCValidator("DE,AT", certs=self.certs)
+        self.assertEqual(dcc_validator.sources, ["DE", "AT"])
+        dcc = create_test_dcc(self.signing_keys[0])
+        self.assertTrue(dcc_validator.validate(dcc)[0])
+        self.assertTrue(dcc_validator.validate(dcc, "AT")[0])
+        with self.assertRaises(ValueError):
+            dcc_validator.validate(dcc, "FR")
+
+
+if __name__ == '__main__':
+    unittest.main()
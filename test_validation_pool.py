@@ -0,0 +1,122 @@
+import asyncio
+import unittest
+from threading import Event
+
+from cwt import load_pem_hcert_dsc
+
+from test_helper import create_test_dcc, create_test_dsc
+from validation_pool import PoolSaturated, ValidationPool
+from validator import DCCValidator
+
+
+class BlockingValidator:
+    """
+    A validator that blocks until it is released.
+    """
+
+    def __init__(self):
+        self.release = Event()
+
+    def validate(self, dcc, source=None):
+        self.release.wait(5)
+        return [True, {}]
+
+
+class ValidationPoolTests(unittest.TestCase):
+
+    def test_backends(self):
+        """
+        Check that the inline and thread backends return the validator result.
+        """
+        cert_pem, signing_key = create_test_dsc()
+        dcc_validator = DCCValidator(
+            "XX", certs=[load_pem_hcert_dsc(cert_pem)], auto_update=False)
+        dcc = create_test_dcc(signing_key)
+        for backend in ('inline', 'thread'):
+            pool = ValidationPool(dcc_validator, backend=backend, workers=2)
+            valid, content = asyncio.run(pool.validate(dcc))
+            summary = asyncio.run(pool.validate(dcc, minimal=True))
+            pool.shutdown()
+            self.assertTrue(valid)
+            self.assertEqual(content[1], "DE")
+            self.assertEqual(summary["type"], "vaccination")
+
+    def test_process_backend(self):
+        """
+        Check that the process backend loads its own certificates.
+        """
+        pool = ValidationPool(None, backend='process', workers=1,
+                              country="XX")
+        valid, content = asyncio.run(pool.validate("HC1:FFFFFFFFFFFFFFFF"))
+        pool.shutdown()
+        self.assertFalse(valid)
+
+    def test_process_backend_refresh(self):
+        """
+        Check that the workers validate with the trust store of the
+        validator and get the new one when it's published.
+        """
+        cert_pem, signing_key = create_test_dsc()
+        dcc_validator = DCCValidator("XX", certs=[], auto_update=False)
+        pool = ValidationPool(dcc_validator, backend='process', workers=1,
+                              country="XX")
+        dcc = create_test_dcc(signing_key)
+        try:
+            self.assertFalse(asyncio.run(pool.validate(dcc))[0])
+            dcc_validator.set_trust_store(dcc_validator.get_trust_store().next(
+                {"XX": [load_pem_hcert_dsc(cert_pem)]}))
+            self.assertTrue(asyncio.run(pool.validate(dcc))[0])
+            self.assertTrue(asyncio.run(pool.validate_batch([dcc]))[0][0])
+        finally:
+            pool.shutdown()
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            ValidationPool(None, backend='fibers')
+
+    def test_saturation(self):
+        """
+        Check that requests above workers + queue size are rejected.
+        """
+        blocking_validator = BlockingValidator()
+        pool = ValidationPool(blocking_validator, backend='thread',
+                              workers=1, queue_size=1)
+
+        async def burst():
+            tasks = [asyncio.ensure_future(pool.validate("HC1:"))
+                     for _ in range(3)]
+            await asyncio.sleep(0.1)
+            blocking_validator.release.set()
+            return await asyncio.gather(*tasks, return_exceptions=True)
+
+        results = asyncio.run(burst())
+        pool.shutdown()
+        self.assertEqual(results[:2], [[True, {}], [True, {}]])
+        self.assertIsInstance(results[2], PoolSaturated)
+
+    def test_wait(self):
+        """
+        Check that a waiting request gets the slot of a finished one
+        instead of being rejected.
+        """
+        blocking_validator = BlockingValidator()
+        pool = ValidationPool(blocking_validator, backend='thread',
+                              workers=1, queue_size=1)
+
+        async def burst():
+            tasks = [asyncio.ensure_future(pool.validate("HC1:", wait=True))
+                     for _ in range(4)]
+            await asyncio.sleep(0.1)
+            waiting = len(pool._waiters)
+            blocking_validator.release.set()
+            return waiting, await asyncio.wait_for(asyncio.gather(*tasks), 5)
+
+        waiting, results = asyncio.run(burst())
+        pool.shutdown()
+        self.assertEqual(waiting, 2)
+        self.assertEqual(results, [[True, {}]] * 4)
+        self.assertEqual(len(pool._waiters), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,171 @@
+import pickle
+import time
+import unittest
+
+import cbor2
+from cwt import load_pem_hcert_dsc
+
+from test_helper import create_test_dcc, create_test_dsc
+from validation_result import ValidationResult
+from validator import DCCValidator
+
+
+class ValidationResultTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cert, key = create_test_dsc()
+        cls.key = key
+        cls.dcc = create_test_dcc(key)
+        cls.validator = DCCValidator(
+            country="XX", certs=[load_pem_hcert_dsc(cert)],
+            auto_update=False)
+
+    def test_unpack(self):
+        """
+        Check that a result still works like [valid, dcc_data].
+        """
+        result = self.validator.validate(self.dcc)
+        valid, dcc_data = result
+        self.assertTrue(valid)
+        self.assertTrue(result[0])
+        self.assertEqual(list(dcc_data), [1, 4, 6, -260])
+        self.assertEqual(dcc_data[-260][1]["nam"]["gn"], "Erika")
+        self.assertEqual(result, [True, dcc_data])
+
+    def test_fields(self):
+        """
+        Check the accessors of the claims.
+        """
+        result = self.validator.validate(self.dcc)
+        self.assertEqual(result.issuer, "DE")
+        self.assertEqual(result.exp, result.iat + 86400)
+        self.assertEqual(result.certificate_type, "vaccination")
+        self.assertEqual(result.subject["fn"], "Mustermann")
+        self.assertEqual(result.dob, "1964-08-12")
+        self.assertEqual(result.vaccinations[0]["dn"], 2)
+        self.assertIsNone(result.tests)
+        self.assertIsNone(result.recoveries)
+        self.assertEqual(result.dcc_data[-260][1]["dob"], result.dob)
+
+    def test_certificate_type(self):
+        """
+        Check that empty entries don't count, however they are encoded.
+        """
+        hcert = {1: {"ver": "1.3.0", "v": [], "t": [{"tt": "LP6464-4"}]}}
+        self.assertEqual(ValidationResult(False, {-260: hcert})
+                         .certificate_type, "test")
+        # an indefinite length empty array and trailing bytes
+        payload = b"\xa1\x39\x01\x03\xa1\x01\xa1\x61v\x9f\xff\x00"
+        result = ValidationResult(False, cbor2.loads(payload))
+        self.assertIsNone(result.certificate_type)
+
+    def test_pickle(self):
+        result = self.validator.validate(self.dcc)
+        copy = pickle.loads(pickle.dumps(result))
+        self.assertEqual(copy, result)
+        self.assertEqual(copy.certificate_type, "vaccination")
+
+    def test_undecodable(self):
+        """
+        Check the results of DCCs without claims.
+        """
+        self.assertEqual(self.validator.validate("HC1:"), [False, {}])
+        self.assertEqual(list(ValidationResult(False)), [False, None])
+        result = ValidationResult(False, dcc_data={})
+        self.assertEqual(list(result), [False, {}])
+        self.assertIsNone(result.exp)
+        self.assertIsNone(result.certificate_type)
+        result = ValidationResult(False, dcc_data=[1, 2])
+        self.assertIsNone(result.subject)
+
+    def test_claims_not_a_map(self):
+        result = ValidationResult(False, [1, 2])
+        self.assertEqual(result.dcc_data, [1, 2])
+        with self.assertRaises(ValueError):
+            result.top_level_claims()
+        result = ValidationResult(False, {-260: [1]})
+        with self.assertRaises(ValueError):
+            result.top_level_claims()
+
+    def test_malformed_hcert(self):
+        """
+        Check that a correctly signed DCC with a truncated HCERT payload
+        or invalid UTF-8 in it is rejected.
+        """
+        now = int(time.time())
+        claims = cbor2.dumps({4: now + 60, -260: {1: {"ver": "1.3.0"}}})
+        invalid_utf8 = claims.replace(b"1.3.0", b"1.3\xff0")
+        for payload in (claims[:-2], invalid_utf8):
+            with self.subTest(payload=payload):
+                result = self.validator.validate(
+                    create_test_dcc(self.key, payload))
+                self.assertEqual(result, [False, {}])
+                self.assertEqual(result.reason, "undecodable")
+
+
+class MinimalTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cert, cls.key = create_test_dsc()
+        cls.validator = DCCValidator(
+            country="XX", certs=[load_pem_hcert_dsc(cert)],
+            auto_update=False, cache_size=16)
+
+    def test_reasons(self):
+        now = int(time.time())
+        hcert = {1: {"ver": "1.3.0", "t": [{"tt": "LP6464-4"}], "v": []}}
+        cases = [
+            ({4: now + 60, -260: hcert}, True, "valid", "test"),
+            ({4: now - 3600, -260: hcert}, False, "expired", "test"),
+            ({4: now + 60, 5: now + 3600, -260: hcert}, False,
+             "not_yet_valid", "test"),
+            ({1: 1, -260: hcert}, False, "invalid_claims", "test"),
+            ({-260: [hcert]}, False, "invalid_claims", None),
+        ]
+        for claims, valid, reason, certificate_type in cases:
+            with self.subTest(reason=reason):
+                summary = self.validator.validate_minimal(
+                    create_test_dcc(self.key, claims))
+                self.assertEqual(summary, {"valid": valid, "reason": reason,
+                                           "exp": claims.get(4),
+                                           "type": certificate_type})
+
+        _, other_key = create_test_dsc("Other DSC")
+        summary = self.validator.validate_minimal(create_test_dcc(other_key))
+        self.assertEqual(summary["reason"], "unknown_signer")
+        self.assertEqual(summary["type"], "vaccination")
+        self.assertEqual(self.validator.validate_minimal("HC1:")["reason"],
+                         "undecodable")
+
+    def test_malformed_claims(self):
+        """
+        Check that the claims are decoded like cbor2 decodes them.
+        """
+        # exp is truncated
+        dcc = create_test_dcc(self.key, b"\xa2\x01\x62DE\x04\x1a\x00\xff")
+        self.assertEqual(self.validator.validate_minimal(dcc)["reason"],
+                         "undecodable")
+        # exp occurs twice, the last one counts
+        dcc = create_test_dcc(self.key, b"\xa2\x04\x01\x04\x82\x01\x02")
+        self.assertEqual(self.validator.validate_minimal(dcc),
+                         {"valid": False, "reason": "invalid_claims",
+                          "exp": [1, 2], "type": None})
+
+    def test_no_personal_data(self):
+        """
+        Check that only the verdict is returned and the result isn't
+        cached.
+        """
+        dcc = create_test_dcc(self.key)
+        self.assertEqual(set(self.validator.validate_minimal(dcc)),
+                         {"valid", "reason", "exp", "type"})
+        self.assertEqual(len(self.validator._result_cache), 0)
+        # but a result that is cached already is used
+        self.validator.validate(dcc)
+        self.assertTrue(self.validator.validate_minimal(dcc)["valid"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,9 @@
 import json
+import os
 import unittest
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from functools import lru_cache
 
 import dateutil
 from cwt.helpers.hcert import load_pem_hcert_dsc
@@ -10,74 +13,101 @@ from cert_loaders.helper import create_chunked_cert
 from test_helper import load_fixtures
 from validator import DCCValidator
 
+TEST_COUNTRIES = ["AE", "BE", "BG", "CH", "CY", "CZ", "DE", "DK", "EE", "ES", "FI", "FR", "GE",  "GB", "GR", "HR", "HU", "IE",
+                  "IS", "IT", "LI", "LT", "LU", "LV", "MA", "MT", "NL", "NO", "PL", "PT", "RO", "SE", "SG", "SI", "SK", "SM", "UA", "VA", "common"]
+
+# the number of processes the countries are tested in
+FIXTURE_WORKERS = int(os.getenv("FIXTURE_WORKERS", 0)) or os.cpu_count() or 1
+
+
+@lru_cache(maxsize=None)
+def load_fixture_dsc(certificate):
+    """
+    Parses the DSC of a fixture. Many fixtures share their DSC, so it is
+    only parsed once per process.
+    """
+    return load_pem_hcert_dsc(create_chunked_cert(certificate))
+
+
+def check_fixture(test_data):
+    """
+    Validates the DCC of a fixture at the VALIDATIONCLOCK of the fixture.
+    Returns:
+        failures: A list of the expectations that were not met.
+    """
+    test_time = test_data["TESTCTX"].get("VALIDATIONCLOCK")
+    test_time = dateutil.parser.parse(test_time)
+    test_expected_results = test_data.get("EXPECTEDRESULTS")
+    test_dcc = test_data.get("PREFIX")
+    test_verify = test_expected_results.get("EXPECTEDVERIFY")
+    test_decode = test_expected_results.get("EXPECTEDDECODE")
+    certs = [load_fixture_dsc(test_data["TESTCTX"]["CERTIFICATE"])]
+
+    failures = []
+    # freezegun patches the clock of the whole process, so fixtures are
+    # never validated in threads, only in processes
+    with freeze_time(test_time):
+        print("TESTTIME: " + str(datetime.now()))
+        dcc_validator = DCCValidator(
+            country="XX", certs=certs, dev_mode=False, auto_update=False)
+        valid, content = dcc_validator.validate(test_dcc)
+
+    if content is None:
+        failures.append("The content is None.")
+    if test_verify is not None and valid != test_verify:
+        failures.append("Expected to verify: %s, valid: %s" %
+                        (test_verify, valid))
+    if test_decode:
+        test_json = test_data.get("JSON")
+        try:
+            hcert = content[-260][1]
+        except Exception as e:
+            failures.append("Could not read the hcert: %r" % e)
+        else:
+            if hcert != test_json:
+                failures.append("CERT: %s\nJSON: %s" %
+                                (json.dumps(hcert), json.dumps(test_json)))
+    return failures
+
+
+def check_country(test_country):
+    """
+    Checks all fixtures of a country.
+    Returns:
+        results: A list of (title, failures) for every fixture.
+    """
+    results = []
+    for test_filename, test_data in load_fixtures(test_country):
+        test_description = test_data["TESTCTX"].get(
+            "DESCRIPTION",
+            "DESCRIPTION MISSING")
+
+        try:
+            test_title = test_filename + "\nDESCRIPTION: " + test_description
+        except:
+            test_title = test_filename
+        print("TESTING: " + test_title)
+        try:
+            failures = check_fixture(test_data)
+        except Exception as e:
+            failures = ["%s: %s" % (type(e).__name__, e)]
+        results.append((test_title, failures))
+    return results
+
 
 class DCCTests(unittest.TestCase):
 
     def test_generator(self):
         """
-        Generate test cases
+        Generate test cases, the countries are checked in parallel
+        processes
         """
-        test_countries = ["AE", "BE", "BG", "CH", "CY", "CZ", "DE", "DK", "EE", "ES", "FI", "FR", "GE",  "GB", "GR", "HR", "HU", "IE",
-                          "IS", "IT", "LI", "LT", "LU", "LV", "MA", "MT", "NL", "NO", "PL", "PT", "RO", "SE", "SG", "SI", "SK", "SM", "UA", "VA", "common"]
-        for test_country in test_countries:
-            test_fixtures = load_fixtures(test_country)
-            for test_case in test_fixtures:
-                test_filename = test_case[0]
-                test_data = test_case[1]
-                test_description = test_data["TESTCTX"].get(
-                    "DESCRIPTION",
-                    "DESCRIPTION MISSING")
-
-                try:
-                    test_title = test_filename + "\nDESCRIPTION: " + test_description
-                except:
-                    test_title = test_filename
-                with self.subTest(test_title, test_data=test_data):
-                    test_time = test_data["TESTCTX"].get("VALIDATIONCLOCK")
-                    test_time = dateutil.parser.parse(test_time)
-                    with freeze_time(test_time):
-                        self.maxDiff = None
-                        print("TESTING: " + test_title)
-                        print("TESTTIME: " + str(datetime.now()))
-                        test_expected_results = test_data.get(
-                            "EXPECTEDRESULTS")
-                        test_dcc = test_data.get("PREFIX")
-                        test_verify = test_expected_results.get(
-                            "EXPECTEDVERIFY"
-                            )
-                        test_decode = test_expected_results.get(
-                            "EXPECTEDDECODE"                            )
-                        print("Expected to verify: " + str(test_verify))
-                        print("Expected to decode: " + str(test_decode))
-                        print("Simulated time: " + datetime.now().isoformat())
-                        certs = []
-                        cert_data = create_chunked_cert(
-                            test_data["TESTCTX"]["CERTIFICATE"])
-                        certs.append(load_pem_hcert_dsc(cert_data))
-
-                        dcc_validator = DCCValidator(
-                            country="XX", certs=certs, dev_mode=False)
-                        valid = None
-                        content = None
-                        hcert = None
-                        valid, content = dcc_validator.validate(test_dcc)
-                        self.assertIsNotNone(content)
-                        if (test_verify is not None):
-                            if (test_verify):
-                                self.assertTrue(valid)
-                            else:
-                                self.assertFalse(valid)
-
-                        if (test_decode is not None):
-                            if (test_decode):
-                                test_json = test_data.get("JSON")
-                                hcert = content[-260][1]
-                                self.assertEqual(hcert, test_json)
-
-                        print("VALID:   " + str(valid))
-                        print("CONTENT: " + json.dumps(content))
-                        print("CERT: " + json.dumps(hcert))
-                        print("JSON: " + json.dumps(test_json))
+        with ProcessPoolExecutor(max_workers=FIXTURE_WORKERS) as executor:
+            country_results = executor.map(check_country, TEST_COUNTRIES)
+            for results in country_results:
+                for test_title, failures in results:
+                    with self.subTest(test_title):
+                        self.assertEqual(failures, [])
 
 
 if __name__ == '__main__':
@@ -1,9 +1,15 @@
+import io
+import json
 import os
 import unittest
+from unittest import mock
 
+from cwt import load_pem_hcert_dsc
 from freezegun.api import freeze_time
 
 from occv import DCCValidator
+from validator import main
+from test_helper import create_test_dcc, create_test_dsc
 
 DEV_MODE = True
 
@@ -54,6 +60,24 @@ class check_test_dcc(unittest.TestCase):
         self.assertEqual(str(content), "{}")
         self.assertFalse(valid)
 
+    def test_dcc_validator_expired(self):
+        """
+        Check that an expired dcc is invalid but its content is returned.
+        """
+        cert_pem, signing_key = create_test_dsc()
+        dcc_validator = DCCValidator(
+            "XX", certs=[load_pem_hcert_dsc(cert_pem)])
+        claims = {1: "DE", 4: 1622316073, 6: 1622216073,
+                  -260: {1: {"ver": "1.3.0", "dob": "1964-08-12"}}}
+        test_dcc = create_test_dcc(signing_key, claims)
+        valid, content = dcc_validator.validate(test_dcc)
+        self.assertFalse(valid)
+        self.assertEqual(content, claims)
+        with freeze_time("2021-05-29"):
+            valid, content = dcc_validator.validate(test_dcc)
+        self.assertTrue(valid)
+        self.assertEqual(content, claims)
+
     @freeze_time("2021-08-01")
     def test_dcc_validator_de_signature_check(self):
         """
@@ -84,6 +108,26 @@ class check_test_dcc(unittest.TestCase):
             self.assertIsNotNone(content)
             self.assertFalse(valid)
 
+    def test_main_stream(self):
+        """
+        Check that the stream mode writes one NDJSON result per DCC.
+        """
+        signing_key = create_test_dsc()[1]
+        test_dcc = create_test_dcc(signing_key)
+        stdin = io.TextIOWrapper(io.BytesIO(
+            ("%s\nHC1:FFFFFFFF\n" % test_dcc).encode()))
+        stdout = io.TextIOWrapper(io.BytesIO())
+        with mock.patch.dict(os.environ, {"CERT_COUNTRY": "XX"}), \
+                mock.patch("sys.stdin", stdin), \
+                mock.patch("sys.stdout", stdout):
+            main(argv=["--stream", "--concurrency", "2"])
+        results = [json.loads(line) for line
+                   in stdout.buffer.getvalue().decode().splitlines()]
+        self.assertEqual(sorted(result["line"] for result in results),
+                         [1, 2])
+        for result in results:
+            self.assertFalse(result["valid"])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,209 @@
+import asyncio
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from threading import BoundedSemaphore
+
+# The validator used inside of a process pool worker
+_worker_validator = None
+
+
+class PoolSaturated(Exception):
+    """
+    Raised if all workers are busy and the queue is full.
+    """
+
+
+def _init_worker(country, dev_mode, validator_options, trust_store=None):
+    """
+    Loads the certificates once per worker process, or uses the given
+    trust store of the parent process, which also refreshes it.
+    """
+    from validator import DCCValidator
+
+    global _worker_validator
+    if trust_store is None:
+        _worker_validator = DCCValidator(country=country, dev_mode=dev_mode,
+                                         **validator_options)
+        return
+    validator_options = dict(validator_options, auto_update=False)
+    _worker_validator = DCCValidator(country=country, certs=[],
+                                     dev_mode=dev_mode, **validator_options)
+    _worker_validator.set_trust_store(trust_store)
+
+
+def _validate_in_worker(dcc, source, minimal=False):
+    if minimal:
+        return _worker_validator.validate_minimal(dcc, source)
+    return _worker_validator.validate(dcc, source)
+
+
+def _validate_batch_in_worker(dccs, source, minimal=False):
+    return _worker_validator.validate_batch(dccs, source, minimal)
+
+
+class ValidationPool:
+    """
+    Runs the CPU bound DCC validation outside of the event loop.
+
+    Backends:
+        inline: Validate on the event loop, like a plain function call.
+        thread: Validate in a thread pool sharing the validator.
+        process: Validate in a process pool. The workers get the trust
+            store of the validator, the pool is restarted with the new
+            one when the validator publishes a new trust store. Without
+            a validator every worker loads its own certificates.
+
+    At most workers + queue_size validations are accepted at a time.
+    Everything above that is rejected with PoolSaturated instead of
+    queueing up, which keeps the latency of accepted requests stable.
+    Streams, which can't be rejected halfway, wait for a free slot.
+    """
+    BACKENDS = ('inline', 'thread', 'process')
+
+    def __init__(self, validator, backend='inline', workers=None,
+                 queue_size=None, country=None, dev_mode=False,
+                 validator_options=None):
+        if backend not in self.BACKENDS:
+            raise ValueError("Unknown validation backend: %s" % backend)
+        self.backend = backend
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_size = self.workers * 4 if queue_size is None else queue_size
+        self._validator = validator
+        self._slots = BoundedSemaphore(self.workers + self.queue_size)
+        # the futures of the validations waiting for a free slot
+        self._waiters = deque()
+
+        if backend == 'thread':
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix="validator")
+        elif backend == 'process':
+            self._worker_args = (country, dev_mode, validator_options or {})
+            self._trust_store = None
+            if validator is not None:
+                self._trust_store = validator.get_trust_store()
+            self._executor = self._start_workers()
+        else:
+            self._executor = None
+
+    def _start_workers(self):
+        return ProcessPoolExecutor(
+            max_workers=self.workers, initializer=_init_worker,
+            initargs=self._worker_args + (self._trust_store,))
+
+    def _sync_workers(self):
+        """
+        Restarts the worker processes with the trust store of the
+        validator if it published a new one. Validations that are in
+        flight finish in the old workers.
+        """
+        if self._trust_store is None:
+            return
+        trust_store = self._validator.get_trust_store()
+        if trust_store is not self._trust_store:
+            self._trust_store = trust_store
+            old_executor, self._executor = \
+                self._executor, self._start_workers()
+            old_executor.shutdown(wait=False)
+
+    async def _wait_for_slot(self):
+        """
+        Takes a slot, waiting until a running validation releases one.
+        """
+        while not self._slots.acquire(blocking=False):
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                # hand a wake-up this waiter can't use on to the next one
+                if waiter.done() and not waiter.cancelled():
+                    self._wake_waiters(1)
+                raise
+
+    def _wake_waiters(self, count):
+        while count and self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                count -= 1
+
+    def _release_slots(self, count=1):
+        for _ in range(count):
+            self._slots.release()
+        self._wake_waiters(count)
+
+    async def validate(self, dcc, source=None, minimal=False, wait=False):
+        """
+        Validates a DCC with the configured backend.
+        Only the summary of DCCValidator.validate_minimal is returned if
+        minimal is set. If wait is set, a saturated pool is waited for
+        instead of rejecting the DCC.
+        Returns:
+            [valid, dcc_data]: The result of DCCValidator.validate.
+        Raises:
+            PoolSaturated: If the pool can't accept more work.
+        """
+        if self._executor is None:
+            return self._validate(dcc, source, minimal)
+
+        if wait:
+            await self._wait_for_slot()
+        elif not self._slots.acquire(blocking=False):
+            raise PoolSaturated("The validation pool is saturated.")
+        try:
+            loop = asyncio.get_running_loop()
+            if self.backend == 'process':
+                self._sync_workers()
+                return await loop.run_in_executor(
+                    self._executor, _validate_in_worker, dcc, source,
+                    minimal)
+            return await loop.run_in_executor(
+                self._executor, self._validate, dcc, source, minimal)
+        finally:
+            self._release_slots()
+
+    def _validate(self, dcc, source, minimal):
+        if minimal:
+            return self._validator.validate_minimal(dcc, source)
+        return self._validator.validate(dcc, source)
+
+    async def validate_batch(self, dccs, source=None):
+        """
+        Validates a list of DCCs. The list is split into one chunk per
+        worker, so a batch is spread over all workers.
+        Returns:
+            results: The results of DCCValidator.validate_batch in order.
+        Raises:
+            PoolSaturated: If the pool can't accept all chunks.
+        """
+        if self._executor is None:
+            return self._validator.validate_batch(dccs, source)
+
+        chunk_size = max(1, -(-len(dccs) // self.workers))
+        chunks = [dccs[i:i + chunk_size]
+                  for i in range(0, len(dccs), chunk_size)]
+
+        acquired = 0
+        for _ in chunks:
+            if not self._slots.acquire(blocking=False):
+                self._release_slots(acquired)
+                raise PoolSaturated("The validation pool is saturated.")
+            acquired += 1
+        try:
+            loop = asyncio.get_running_loop()
+            if self.backend == 'process':
+                self._sync_workers()
+                function = _validate_batch_in_worker
+            else:
+                function = self._validator.validate_batch
+            chunk_results = await asyncio.gather(*[
+                loop.run_in_executor(self._executor, function, chunk, source)
+                for chunk in chunks])
+        finally:
+            self._release_slots(acquired)
+        return [result for chunk in chunk_results for result in chunk]
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
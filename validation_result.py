@@ -0,0 +1,157 @@
+"""
+The result of validating a DCC.
+"""
+from result_cache import estimate_size
+
+# the claim keys of the CWT and the HCERT payload
+ISSUER = 1
+EXPIRES = 4
+NOT_BEFORE = 5
+ISSUED_AT = 6
+HCERT = -260
+
+# the reasons for a verdict
+VALID = "valid"
+UNDECODABLE = "undecodable"
+UNKNOWN_SIGNER = "unknown_signer"
+INVALID_SIGNATURE = "invalid_signature"
+INVALID_CLAIMS = "invalid_claims"
+EXPIRED = "expired"
+NOT_YET_VALID = "not_yet_valid"
+
+# the entries of the certificate types in the HCERT payload
+CERTIFICATE_TYPES = (("v", "vaccination"), ("t", "test"),
+                     ("r", "recovery"))
+
+
+class ValidationResult:
+    """
+    The verdict, its reason and the claims of a DCC.
+
+    The claims are decoded with cbor2 as a whole. The fields that are
+    read most, like exp or the certificate type, have accessors.
+
+    It unpacks like the [valid, dcc_data] list validate used to return.
+    """
+    __slots__ = ("valid", "reason", "_dcc_data")
+
+    def __init__(self, valid, dcc_data=None, reason=UNDECODABLE):
+        """
+        Takes the claims like cbor2 decodes them, None if the DCC can't
+        be decoded at all.
+        """
+        self.valid = valid
+        self.reason = reason
+        self._dcc_data = dcc_data
+
+    def claim(self, key):
+        """
+        Returns a top level claim or None if the DCC doesn't have it.
+        """
+        if isinstance(self._dcc_data, dict):
+            return self._dcc_data.get(key)
+        return None
+
+    def top_level_claims(self):
+        """
+        Returns the claims without the HCERT payload, which is only
+        checked to be a map.
+        Raises:
+            ValueError: If the claims or the HCERT payload aren't maps.
+        """
+        if not isinstance(self._dcc_data, dict):
+            raise ValueError("The claims should be a map.")
+        if not isinstance(self._dcc_data.get(HCERT, {}), dict):
+            raise ValueError("hcert(-260) should be map.")
+        return {key: value for key, value in self._dcc_data.items()
+                if key != HCERT}
+
+    @property
+    def issuer(self):
+        return self.claim(ISSUER)
+
+    @property
+    def exp(self):
+        return self.claim(EXPIRES)
+
+    @property
+    def iat(self):
+        return self.claim(ISSUED_AT)
+
+    def hcert_field(self, name):
+        """
+        Returns a field of the HCERT payload, like "nam" or "v", or None
+        if the payload doesn't have it.
+        """
+        hcert = self.claim(HCERT)
+        if isinstance(hcert, dict) and isinstance(hcert.get(1), dict):
+            return hcert[1].get(name)
+        return None
+
+    @property
+    def subject(self):
+        return self.hcert_field("nam")
+
+    @property
+    def dob(self):
+        return self.hcert_field("dob")
+
+    @property
+    def vaccinations(self):
+        return self.hcert_field("v")
+
+    @property
+    def tests(self):
+        return self.hcert_field("t")
+
+    @property
+    def recoveries(self):
+        return self.hcert_field("r")
+
+    @property
+    def certificate_type(self):
+        """
+        Returns "vaccination", "test" or "recovery", or None if the
+        payload has no entry.
+        """
+        for name, certificate_type in CERTIFICATE_TYPES:
+            if self.hcert_field(name):
+                return certificate_type
+        return None
+
+    @property
+    def dcc_data(self):
+        """
+        Returns all claims like cbor2 decodes them.
+        """
+        return self._dcc_data
+
+    def summary(self):
+        """
+        Returns the verdict without personal data: valid, the reason, exp
+        and the certificate type.
+        """
+        return {"valid": self.valid, "reason": self.reason,
+                "exp": self.exp, "type": self.certificate_type}
+
+    def __iter__(self):
+        yield self.valid
+        yield self.dcc_data
+
+    def __getitem__(self, index):
+        return (self.valid, self.dcc_data)[index]
+
+    def __len__(self):
+        return 2
+
+    def __eq__(self, other):
+        if isinstance(other, (ValidationResult, list, tuple)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return "ValidationResult(valid=%r, reason=%r)" % (
+            self.valid, self.reason)
+
+    def __sizeof__(self):
+        return object.__sizeof__(self) + estimate_size(self._dcc_data)
@@ -1,22 +1,43 @@
+import argparse
+import asyncio
+import hashlib
 import os
-import zlib
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+from datetime import datetime, timezone
 from threading import Timer
 from typing import Callable, Dict
 
 import cbor2
-import cwt
-from base45 import b45decode
-from cwt import Claims
+from cwt import COSE, Claims, VerifyError
 
 from cert_loaders.at import CertificateLoader_AT
 from cert_loaders.at_test import CertificateLoader_AT_TEST
 from cert_loaders.de import CertificateLoader_DE
 from cert_loaders.test import CertificateLoader_XX
+from cert_loaders.trust_store import TrustStore
+from codec import (MAX_DCC_LENGTH, MAX_PAYLOAD_SIZE, PayloadTooLarge,
+                   b45decode, check_length, zlib_decompress)
+from metrics import (TRUST_LIST_AGE_SECONDS, TRUST_LIST_SIZE,
+                     VALIDATION_STAGE_SECONDS, VALIDATIONS)
+from result_cache import ResultCache
+from stream_validation import validate_file
+from validation_result import (EXPIRED, INVALID_CLAIMS,
+                               INVALID_SIGNATURE, NOT_BEFORE, NOT_YET_VALID,
+                               UNKNOWN_SIGNER, VALID, ValidationResult)
+
+# the clock skew allowed for the exp and nbf claims, the same as cwt's
+CLAIMS_LEEWAY = 60
 
 
 class DCCValidator():
 
-    def __init__(self, country, certs=None, dev_mode=False):
+    def __init__(self, country, certs=None, dev_mode=False, cache_size=0,
+                 cache_ttl=300, cache_max_bytes=16 * 1024 * 1024,
+                 auto_update=True, max_dcc_length=MAX_DCC_LENGTH,
+                 max_payload_size=MAX_PAYLOAD_SIZE):
         self.CERT_LOADERS: Dict[str, Callable[[], None]] = {
             'DE': CertificateLoader_DE,
             'AT': CertificateLoader_AT,
@@ -24,46 +45,214 @@ class DCCValidator():
             'XX': CertificateLoader_XX
         }
         self.DEV_MODE = dev_mode
+        # untrusted input is rejected before it can use much memory
+        self.max_dcc_length = max_dcc_length
+        self.max_payload_size = max_payload_size
+        # several loaders can be combined, e.g. "DE,AT"
+        if isinstance(country, str):
+            country = country.split(",")
+        self.sources = [name.strip() for name in country]
+        self._cert_loaders = {}
         # initiates the certificate loader if no certificate is passed to the object
         # passing the certs to the object will not initiate the certificate loader
         # this is useful for testing
         if certs is None:
-            self._cert_loader = self._get_cert_loader(country)()
-        # loads the certificates from the loader instance
-            self._certs = self._cert_loader()
+            with ThreadPoolExecutor(max_workers=len(self.sources)) as executor:
+                loaders = executor.map(
+                    lambda name: self._get_cert_loader(name)(), self.sources)
+                self._cert_loaders = dict(zip(self.sources, loaders))
+            # loads the certificates from the loader instances
+            certs_by_source = self._load_certs_by_source()
         else:
-            self._certs = certs
+            certs_by_source = {name: certs for name in self.sources}
+        # index the certificates of all loaders by their kid for fast
+        # signer lookups, keys that are in several lists are stored once
+        self._trust_store = TrustStore.merge(certs_by_source)
         print("Loaded %i certificates from %s certificate service." %
-              (len(self._certs), country))
-        
-        self._start_update_timer()
+              (len(self._trust_store), ", ".join(self.sources)))
+        TRUST_LIST_SIZE.set_function(lambda: len(self._trust_store))
+        # the time of the last successful refresh of every list, a
+        # refresh that finds no change doesn't build a new trust store
+        self._refreshed_at = dict.fromkeys(self.sources,
+                                           self._trust_store.loaded_at)
+        TRUST_LIST_AGE_SECONDS.set_function(
+            lambda: time.time() - self.get_last_refreshed())
+        self._cose = COSE.new(verify_kid=True)
+        # caches the results of repeatedly scanned DCCs
+        self._result_cache = None
+        if cache_size > 0:
+            self._result_cache = ResultCache(
+                cache_size, cache_ttl, cache_max_bytes)
+
+        # the update timer isn't needed if a RefreshScheduler
+        # refreshes the certificates
+        self._update_timer = None
+        if auto_update:
+            self._start_update_timer()
+
+    def validate(self, dcc, source=None):
+        """
+        Validates a DCC against the keys of all loaders or only against
+        the keys of the given source.
+        Returns:
+            result: A ValidationResult, it unpacks to [valid, dcc_data].
+        Raises:
+            ValueError: If the source isn't loaded.
+            PayloadTooLarge: If the DCC exceeds a size limit.
+        """
+        self._check_input(dcc, source)
+        trust_store = self._trust_store
+        if self._result_cache is None:
+            return self._validate(dcc, trust_store, source)
+
+        key = self._cache_key(dcc, trust_store, source)
+        result = self._result_cache.get(key)
+        if result is None:
+            result = self._validate(dcc, trust_store, source)
+            expires = None
+            if result.valid:
+                expires = result.exp
+            elif result.reason == NOT_YET_VALID:
+                # the verdict changes once the DCC becomes valid
+                expires = result.claim(NOT_BEFORE) - CLAIMS_LEEWAY
+            self._result_cache.put(key, result, expires)
+        return result
+
+    def validate_minimal(self, dcc, source=None):
+        """
+        Validates a DCC like validate, but only returns the verdict.
+        Nothing is added to the result cache, so no personal data is kept.
+        Returns:
+            summary: The valid, reason, exp and type of the DCC, see
+            ValidationResult.summary.
+        Raises:
+            ValueError: If the source isn't loaded.
+            PayloadTooLarge: If the DCC exceeds a size limit.
+        """
+        self._check_input(dcc, source)
+        trust_store = self._trust_store
+        result = None
+        if self._result_cache is not None:
+            result = self._result_cache.get(
+                self._cache_key(dcc, trust_store, source))
+        if result is None:
+            result = self._validate(dcc, trust_store, source)
+        return result.summary()
 
-    def validate(self, dcc):
-        dcc = self._decode(dcc)
+    def _check_input(self, dcc, source):
+        if source is not None and source not in self.sources:
+            raise ValueError("Unknown certificate source: %s" % source)
+        try:
+            check_length(dcc, self.max_dcc_length)
+        except PayloadTooLarge:
+            VALIDATIONS.inc(result="too_large")
+            raise
+
+    def _cache_key(self, dcc, trust_store, source):
+        # the generation is part of the key, so results validated against
+        # an older trust store are never returned
+        return (trust_store.generation, source,
+                hashlib.sha256(dcc.encode()).digest())
+
+    def _validate(self, dcc, trust_store, source=None):
+        try:
+            dcc = self._decode(dcc)
+        except PayloadTooLarge:
+            VALIDATIONS.inc(result="too_large")
+            raise
         if dcc is None:
-            return [False, None]
+            VALIDATIONS.inc(result="undecodable")
+            return ValidationResult(False)
 
+        # the COSE_Sign1 structure is parsed exactly once, the same parse
+        # is used for the verification and the content of the response
         try:
-            decoded = cwt.decode(dcc, keys=self._certs)
-            claims = Claims.new(decoded)
-            return [True, claims.to_dict()]
-        except Exception as e:
-            try:
-                decoded_noverify = cbor2.loads(dcc)
-                decoded_noverify = cbor2.loads(decoded_noverify.value[2])
-                print("Could not validate certificate.")
-            except Exception as e:
-                print("Could not decode certificate.")
-                return [False, {}]
+            with VALIDATION_STAGE_SECONDS.time(stage="cbor"):
+                message = cbor2.loads(dcc)
+                # unwrap an optional CWT tag around the COSE_Sign1 structure
+                if message.tag == 61:
+                    message = message.value
+                result = ValidationResult(
+                    False, dcc_data=cbor2.loads(message.value[2]))
+        except Exception:
+            print("Could not decode certificate.")
+            VALIDATIONS.inc(result="undecodable")
+            return ValidationResult(False, dcc_data={})
 
-            return [False, decoded_noverify]
+        try:
+            with VALIDATION_STAGE_SECONDS.time(stage="verify"):
+                keys = trust_store.find(self._get_kid(message), source)
+                if not keys:
+                    # cwt would parse the structure once more only to
+                    # find that no key matches
+                    result.reason = UNKNOWN_SIGNER
+                    raise VerifyError("The signer is unknown.")
+                result.reason = INVALID_SIGNATURE
+                self._cose.decode(message, keys)
+            with VALIDATION_STAGE_SECONDS.time(stage="claims"):
+                result.reason = INVALID_CLAIMS
+                self._verify_claims(result)
+            VALIDATIONS.inc(result="valid")
+            result.valid = True
+            result.reason = VALID
+        except Exception:
+            print("Could not validate certificate.")
+            VALIDATIONS.inc(result="invalid")
+        return result
+
+    def _verify_claims(self, result):
+        """
+        Checks the claims like cwt.decode does after the signature check.
+        The HCERT payload is only checked to be a map.
+        The reason of an expired or not yet valid DCC is set in result.
+        Raises:
+            ValueError: If the claims are malformed.
+            VerifyError: If the certificate expired or isn't valid yet.
+        """
+        claims = result.top_level_claims()
+        Claims.new(claims)
+        now = time.time()
+        if 4 in claims and claims[4] < now - CLAIMS_LEEWAY:
+            result.reason = EXPIRED
+            raise VerifyError("The token has expired.")
+        if 5 in claims and claims[5] > now + CLAIMS_LEEWAY:
+            result.reason = NOT_YET_VALID
+            raise VerifyError("The token is not yet valid.")
+
+    def validate_batch(self, dccs, source=None, minimal=False):
+        """
+        Validates a list of DCCs one after another.
+        A broken DCC doesn't fail the whole batch. Only the reason of the
+        verdict is returned instead of the claims if minimal is set, see
+        validate_minimal.
+        Returns:
+            results: A list of [valid, dcc_data, error] in the order of dccs,
+            [valid, reason, error] if minimal is set.
+        """
+        results = []
+        for dcc in dccs:
+            try:
+                if minimal:
+                    summary = self.validate_minimal(dcc, source)
+                    results.append([summary["valid"], summary["reason"], None])
+                    continue
+                valid, dcc_data = self.validate(dcc, source)
+                results.append([valid, dcc_data, None])
+            except PayloadTooLarge as error:
+                results.append([False, None, str(error)])
+            except Exception as error:
+                if self.DEV_MODE:
+                    print(error)
+                results.append([False, None, "Data format incompatible."])
+        return results
 
     def _decode(self, dcc):
         dcc = dcc.encode()
         if dcc.startswith(b'HC1:'):
             dcc = dcc[4:]
         try:
-            dcc = b45decode(dcc)
+            with VALIDATION_STAGE_SECONDS.time(stage="base45"):
+                dcc = b45decode(dcc)
         except Exception as e:
             if self.DEV_MODE:
                 print(e)
@@ -72,7 +261,10 @@ class DCCValidator():
 
         if dcc.startswith(b'x'):
             try:
-                dcc = zlib.decompress(dcc)
+                with VALIDATION_STAGE_SECONDS.time(stage="zlib"):
+                    dcc = zlib_decompress(dcc, self.max_payload_size)
+            except PayloadTooLarge:
+                raise
             except Exception as e:
                 if self.DEV_MODE:
                     print(e)
@@ -80,21 +272,176 @@ class DCCValidator():
 
         return dcc
 
+    def _get_kid(self, message):
+        """
+        Reads the kid from the protected or unprotected COSE header.
+        Returns:
+            kid: The key id of the signing certificate.
+        Fails:
+            None: If the DCC carries no kid or can't be parsed.
+        """
+        try:
+            protected = cbor2.loads(message.value[0]) if message.value[0] else {}
+            unprotected = message.value[1]
+            return protected.get(4) or unprotected.get(4)
+        except Exception:
+            return None
+
     def _get_cert_loader(self, country):
         return self.CERT_LOADERS[country]
 
+    def _load_certs_by_source(self):
+        return {name: loader() for name, loader in self._cert_loaders.items()}
+
     def get_business_rules(self):
-        return self._cert_loader.rules
+        """
+        Returns the rules of the first loader that provides rules.
+        """
+        for loader in self._cert_loaders.values():
+            if loader.rules is not None:
+                return loader.rules
+        return None
+
+    def get_rules_generation(self):
+        """
+        Returns a key that changes whenever a loader reloads its rules.
+        """
+        return tuple(loader.rules_generation
+                     for loader in self._cert_loaders.values())
+
+    def get_rule_set(self):
+        """
+        Returns the compiled rules of the first loader that provides rules.
+        """
+        for loader in self._cert_loaders.values():
+            if loader.rule_set is not None:
+                return loader.rule_set
+        return None
+
+    def evaluate_rules(self, dcc_data, now=None):
+        """
+        Evaluates the business rules against the HCERT payload of a
+        validated DCC.
+        Returns:
+            results: The result of every rule that applies to the
+            certificate, see RuleSet.evaluate.
+        Fails:
+            None: If no loader provides rules.
+        """
+        rule_set = self.get_rule_set()
+        if rule_set is None or not dcc_data:
+            return None
+        with VALIDATION_STAGE_SECONDS.time(stage="rules"):
+            return rule_set.evaluate(dcc_data, now)
+
+    def get_last_refreshed(self):
+        """
+        Returns the time of the oldest successful refresh of the
+        certificate lists. A list that failed to refresh counts with its
+        last successful refresh.
+        """
+        return min(self._refreshed_at.values(),
+                   default=self._trust_store.loaded_at)
 
     def get_status(self):
-        return "{status}"
+        """
+        Returns the state of the trust store in use.
+        """
+        trust_store = self._trust_store
+        return {
+            "certificates": len(trust_store),
+            "generation": trust_store.generation,
+            "loaded_at": datetime.fromtimestamp(
+                trust_store.loaded_at, timezone.utc).isoformat(),
+            "last_refreshed": datetime.fromtimestamp(
+                self.get_last_refreshed(), timezone.utc).isoformat(),
+            "sources": trust_store.count_by_source(),
+            "last_update": {name: loader.last_diff
+                            for name, loader in self._cert_loaders.items()},
+            "result_cache": self._result_cache.stats()
+            if self._result_cache is not None else None,
+        }
 
     def update_certs(self):
-        print ("Update timer ran out. Updating certificates.")
-        self._cert_loader.update_certs()
-        self.certs = self._cert_loader()
-        self._update_timer.cancel()
-        self._start_update_timer()
+        """
+        Builds a new trust store from freshly loaded certificates and
+        publishes it with a single assignment. Running validations keep
+        the snapshot they started with. If the update fails the current
+        trust store stays in use.
+        """
+        print("Update timer ran out. Updating certificates.")
+        try:
+            # a failing loader keeps its old certificates
+            changed = False
+            for name, loader in self._cert_loaders.items():
+                try:
+                    if loader.update_certs():
+                        changed = True
+                    self._refreshed_at[name] = time.time()
+                except Exception as e:
+                    print("Could not update the %s certificates: %s" %
+                          (name, e))
+            # the trust store in use stays as it is if no certificate
+            # was added or removed
+            if changed:
+                self._publish_trust_store()
+        except Exception as e:
+            print("Could not update the certificates: %s" % e)
+        if self._update_timer is not None:
+            self._update_timer.cancel()
+            self._start_update_timer()
+
+    async def refresh_async(self, downloader):
+        """
+        Refreshes the certificates of all loaders at the same time with
+        an AsyncDownloader. A new trust store is only built if a
+        certificate was added or removed. If a loader fails it keeps its
+        old certificates.
+        Returns:
+            True if a new trust store was published.
+        """
+        names = list(self._cert_loaders)
+        results = await asyncio.gather(
+            *[self._cert_loaders[name].refresh_async(downloader)
+              for name in names],
+            return_exceptions=True)
+        changed = False
+        for name, result in zip(names, results):
+            if isinstance(result, Exception):
+                print("Could not update the %s certificates: %s" %
+                      (name, result))
+                continue
+            self._refreshed_at[name] = time.time()
+            if result:
+                changed = True
+        if changed:
+            await asyncio.to_thread(self._publish_trust_store)
+        return changed
+
+    def _publish_trust_store(self):
+        """
+        Replaces the trust store with one built from the current
+        certificates of the loaders.
+        """
+        self.set_trust_store(self._trust_store.next(
+            self._load_certs_by_source()))
+        print("Loaded %i certificates, trust store generation %i." %
+              (len(self._trust_store), self._trust_store.generation))
+
+    def get_trust_store(self):
+        """
+        Returns the trust store in use, it's never changed once built.
+        """
+        return self._trust_store
+
+    def set_trust_store(self, trust_store):
+        """
+        Puts a trust store into use, e.g. the one of the validator in the
+        parent of a worker process.
+        """
+        self._trust_store = trust_store
+        if self._result_cache is not None:
+            self._result_cache.clear()
 
     def _start_update_timer(self):
         """
@@ -106,18 +453,42 @@ class DCCValidator():
         self._update_timer.start()
 
 
-def main(dev_mode=False):
+def main(dev_mode=False, argv=None):
+    parser = argparse.ArgumentParser(
+        description="Validates EU Digital COVID Certificates.")
+    parser.add_argument(
+        "--stream", action="store_true",
+        help="validate newline delimited DCCs from stdin and write the "
+             "results as NDJSON to stdout")
+    parser.add_argument(
+        "--concurrency", type=int, default=os.cpu_count() or 1,
+        help="the number of DCCs validated at the same time in stream mode")
+    parser.add_argument(
+        "--source", default=None,
+        help="only validate against the certificates of this country")
+    args = parser.parse_args(argv)
 
     # Retrieve the requrested country for the certificates
     # from env or fall back to DE
     CERT_COUNTRY = os.getenv("CERT_COUNTRY", "AT")
+
+    if args.stream:
+        # stdout only carries the results, everything else goes to stderr
+        output = sys.stdout.buffer
+        with redirect_stdout(sys.stderr):
+            validator = DCCValidator(country=CERT_COUNTRY, dev_mode=dev_mode,
+                                     auto_update=False)
+            validate_file(validator, sys.stdin.buffer, output,
+                          args.concurrency, args.source)
+        return
+
     # Retrieve DCC from env or fall back on empty string
     DCC = os.getenv("DCC", "")
 
     # Initiate the DSCValidator
     validator = DCCValidator(country=CERT_COUNTRY, dev_mode=dev_mode)
     # Validate the DCC
-    print(validator.validate(DCC))
+    print(validator.validate(DCC, args.source))
 
 
 if __name__ == '__main__':